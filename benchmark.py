@@ -0,0 +1,145 @@
+"""
+Benchmarks of the TFTA data layer.
+
+storage: startup time and query latency of the sqlite databases in each
+storage mode (see tfta/storage.py)
+imports: import time of the agent and of each module it imports, measured
+with python -X importtime in a fresh interpreter
+
+Usage: python benchmark.py storage [--repeat N]
+       python benchmark.py imports [--module tfta.tfta_module] [--top N]
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from tfta import storage
+from tfta.db_index import indexed_db_file
+
+
+logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s',
+                    level=logging.INFO)
+logger = logging.getLogger('TFTA-Benchmark')
+
+_root_dir = os.path.dirname(os.path.realpath(__file__))
+_resource_dir = _root_dir + '/resources/'
+
+#representative lookups of each database: (query, query for the parameter values)
+STORAGE_QUERIES = {
+    'TF_target_20191224.db': [
+        ("SELECT DISTINCT TF FROM CombinedDB WHERE Target = ?",
+         "SELECT DISTINCT Target FROM CombinedDB"),
+        ("SELECT DISTINCT Target FROM CombinedDB WHERE TF = ?",
+         "SELECT DISTINCT TF FROM CombinedDB"),
+        ("SELECT DISTINCT pathwayID FROM pathway2Genes WHERE genesymbol = ?",
+         "SELECT DISTINCT genesymbol FROM pathway2Genes"),
+        ("SELECT * FROM mirnaInfo WHERE target = ?",
+         "SELECT DISTINCT target FROM mirnaInfo")],
+    'ldd20200630.db': [
+        ("SELECT DISTINCT gene FROM diseaseGene WHERE diseaseId = ?",
+         "SELECT DISTINCT Id FROM diseaseName")],
+    'mirnaDisease.db': [
+        ("SELECT mirna FROM mir2disease WHERE disease = ?",
+         "SELECT DISTINCT disease FROM mir2disease")]
+}
+
+
+def _sample_params(db_file, queries, num):
+    db = storage.connect(db_file, 'default')
+    params = []
+    for query, param_query in queries:
+        values = [r[0] for r in db.execute(param_query).fetchall()]
+        params.append((query, [(v,) for v in random.sample(values, min(num, len(values)))]))
+    db.close()
+    return params
+
+def bench_storage(repeat=200):
+    """
+    For each database and storage mode, report the startup time (opening the
+    database) and the latency of the first and of the following queries.
+    """
+    print('{:<24} {:<10} {:>11} {:>12} {:>12} {:>12}'.format(
+          'database', 'mode', 'startup ms', 'first ms', 'median us', 'p95 us'))
+    for fn, queries in STORAGE_QUERIES.items():
+        db_file = os.path.join(_resource_dir, fn)
+        if not os.path.isfile(db_file):
+            logger.info('{} not found, skipped.'.format(fn))
+            continue
+        db_file = indexed_db_file(db_file)
+        params = _sample_params(db_file, queries, repeat)
+        for mode in storage.STORAGE_MODES:
+            t0 = time.perf_counter()
+            db = storage.connect(db_file, mode)
+            startup = time.perf_counter() - t0
+            latency = []
+            for query, values in params:
+                for t in values:
+                    t0 = time.perf_counter()
+                    db.execute(query, t).fetchall()
+                    latency.append(time.perf_counter() - t0)
+            db.close()
+            q = statistics.quantiles(latency, n=20)
+            print('{:<24} {:<10} {:>11.1f} {:>12.2f} {:>12.1f} {:>12.1f}'.format(
+                  fn, mode, startup * 1e3, latency[0] * 1e3,
+                  statistics.median(latency) * 1e6, q[-1] * 1e6))
+
+def _import_times(module):
+    """
+    Import module in a new interpreter, return the wall time in seconds and
+    a list of (cumulative us, self us, module name) of every imported module.
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=_root_dir, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        logger.error('Could not import {}: {}'.format(module, proc.stderr.strip().splitlines()[-1]))
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cum_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue
+        rows.append((int(cum_us), int(self_us), name.strip()))
+    return wall, rows
+
+def bench_imports(module='tfta.tfta_module', top=20):
+    """
+    Report the modules with the largest cumulative import time, and the self
+    import time of each top-level package.
+    """
+    wall, rows = _import_times(module)
+    print('import {}: {:.1f} ms wall, {} modules'.format(module, wall * 1e3, len(rows)))
+    print('{:<48} {:>14} {:>10}'.format('module', 'cumulative ms', 'self ms'))
+    for cum_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print('{:<48} {:>14.1f} {:>10.1f}'.format(name, cum_us / 1e3, self_us / 1e3))
+    package_us = defaultdict(int)
+    for cum_us, self_us, name in rows:
+        package_us[name.split('.')[0]] += self_us
+    print('{:<48} {:>14}'.format('package', 'self ms'))
+    for name, us in sorted(package_us.items(), key=lambda x: -x[1])[:top]:
+        print('{:<48} {:>14.1f}'.format(name, us / 1e3))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the TFTA data layer.')
+    parser.add_argument('benchmark', choices=['storage', 'imports'])
+    parser.add_argument('--repeat', type=int, default=200, help='number of queries of each kind')
+    parser.add_argument('--module', default='tfta.tfta_module', help='module to import')
+    parser.add_argument('--top', type=int, default=20, help='number of modules to report')
+    args = parser.parse_args()
+    random.seed(0)
+    if args.benchmark == 'storage':
+        bench_storage(args.repeat)
+    elif args.benchmark == 'imports':
+        bench_imports(args.module, args.top)
+
+if __name__ == '__main__':
+    main()
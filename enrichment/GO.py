@@ -6,11 +6,13 @@ from goatools import obo_parser
 from goatools.go_enrichment import GOEnrichmentStudy
 import wget
 from ftplib import FTP
-import gzip
-import Bio.UniProt.GOA as GOA
 from collections import defaultdict
-import pickle
 import sqlite3
+from tfta.startup import StartupLoader
+from utils import cache_store
+from .gaf_store import GafStore
+from utils.text_index import NameIndex
+from .result_cache import new_data_version
 
 logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger('TFTA-GOEnrich')
@@ -19,16 +21,28 @@ _resource_dir = os.path.dirname(os.path.realpath(__file__)) + '/../enrichment/da
 
 class GOEnrich:
     def __init__(self, species=None):
-        self.go = self.read_go()
-        if self.go:
-            logger.info('GOEnrich loaded GO data.')
-        
+        #the GO DAG and the annotations are loaded concurrently
+        loader = StartupLoader('GOEnrich')
+        loader.add('go', self.read_go)
+        #index of the GO term names for the keyword lookups
+        loader.add('go_names', _index_go_names, ['go'])
         if not species:
-            self.gaf_funcs = self.read_gaf()
+            loader.add('gaf', self.read_gaf)
         else:
             gaf_uri = '/pub/databases/GO/goa/' + species.upper() + '/goa_' + \
                        species.lower() + '.gaf.gz'
-            self.gaf_funcs = self.read_gaf2(gaf_uri=gaf_uri)
+            loader.add('gaf', lambda: self.read_gaf2(gaf_uri=gaf_uri))
+        #enrichment study of the population, with the associations propagated
+        #up the GO DAG, reused by go_enrichment_analysis
+        study_fn = os.path.join(_resource_dir, 'go_study.pickle') if not species else None
+        loader.add('study', lambda go, gaf: _load_study(go, gaf, study_fn), ['go', 'gaf'])
+        res = loader.run()
+        self.go = res['go']
+        if self.go:
+            logger.info('GOEnrich loaded GO data.')
+        self.go_ids, self.go_name_index = res['go_names']
+        
+        self.gaf_funcs = res['gaf']
         if self.gaf_funcs:
             logger.info("GOEnrich loaded GAF file.")
         else:
@@ -38,6 +52,9 @@ class GOEnrich:
         self.pop = self.gaf_funcs.keys()
         
         self.assoc = self.get_assoc_gene_go()
+        self.study = res['study']
+        #version of the data, for the cached enrichment results
+        self.data_version = new_data_version()
         
         #load go_gene.db. Comment out for now since it's not used.
         #self.godb = _load_db()
@@ -72,95 +89,50 @@ class GOEnrich:
         
         gaf_file = self.download_file_http(gaf_uri, data_folder, gaf_fn)
         
-        #read the annotations into a dictionary
+        #read the annotations into a GafStore
         fn = os.path.join(_resource_dir, 'gaf_funcs.pickle')
-        if os.path.isfile(fn):
-            with open(fn, 'rb') as pickle_in:
-                gaf_funcs = pickle.load(pickle_in)
-        else:
-            # File is a gunzip file, so we need to open it in this way
-            with gzip.open(gaf_file, 'rt') as gaf_fp:
-                gaf_funcs = defaultdict(list)
-                # Iterate on each function using Bio.UniProt.GOA library.
-                for entry in GOA.gafiterator(gaf_fp):
-                    gene_symbol = entry.pop('DB_Object_Symbol')
-                    gaf_funcs[gene_symbol].append(entry)
-        
-            #save gaf_funcs to file
-            with open(fn, 'wb') as pickle_out:
-                pickle.dump(gaf_funcs, pickle_out)
-        
+        gaf_funcs = cache_store.load(fn, lambda: _parse_gaf(gaf_file), [gaf_file] if gaf_file else [],
+                                     version=3)
+        if isinstance(gaf_funcs, dict):
+            #dict of Biopython entries of the previous pickle
+            gaf_funcs = GafStore.from_entries(gaf_funcs)
         return gaf_funcs
     
     def get_population(self):
         return self.population
     
-    def get_annotations_keyword(self, keyword):
+    def get_annotations_keyword(self, keyword, whole_words=False):
         """
         Generate a list of annotated genes which have the keyword in their names.
         
         parameter
         ------------
         keyword: str
+        whole_words: bool, if True, match the words of keyword as whole words
+        instead of as a substring
         
         output
         ------------
         annots: dict
         """
-        annots = dict()
-        for g, entry in self.gaf_funcs.items():
-            if keyword.lower() in entry[0]['DB_Object_Name'].lower():
-                annots[g] = entry
+        annots = {g: self.gaf_funcs[g] for g in self.gaf_funcs.genes_with_name(keyword, whole_words)}
         return annots
         
     def get_annotations_genes(self, gene_list):
         """
         Return the annotations for each gene in the gene_list
         """
-        annots = {x: self.gaf_funcs[x] for x in gene_list}
+        annots = {x: self.gaf_funcs.get_annotations(x) for x in gene_list}
         return annots
     
     def get_go_keyword(self, keyword):
         """
-        return GO terms whose names have keyword
-        """
-        #check if the corresponding file exists
-        data_folder = _resource_dir + '/go_files'
-        fn = os.path.join(data_folder, keyword + ".pickle")
-        if os.path.isfile(fn):
-            with open(fn, 'rb') as pickle_in:
-                go_name = pickle.load(pickle_in)
-        else:
-            go_name = self._go_keyword(keyword, data_folder)
-        return go_name
-    
-    def _go_keyword(self, keyword, data_folder):
-        """
-        Generate a dict, its key is GO_id, value is GO name which contains the keyword
+        Return a dict, its key is GO_id, value is GO name which contains the keyword
         """
-        #data_folder = _resource_dir + '/go_files'
-        if not os.path.isfile(data_folder):
-            # Emulate mkdir -p (no error if folder exists)
-            try:
-                os.mkdir(data_folder)
-            except OSError as e:
-                if(e.errno != 17):
-                    logger.error('GOEnrich could not make the go_files folder.')
-                    return None
-        else:
-            logger.error('Data path (' + data_folder + ') exists as a file. '
-                         'Please rename, remove or change the desired location of the data path.')
-            return None
-            
-        go_name = dict()
-        keyword = keyword.lower()
-        if self.go:
-            go_name = {go_id:self.go[go_id].name for go_id in self.go if keyword in self.go[go_id].name.lower()}
-            #save to file
-            fn = os.path.join(data_folder, keyword + ".pickle")
-            with open(fn, 'wb') as pickle_out:
-                pickle.dump(go_name, pickle_out)
-        return go_name
+        if self.go_name_index is None:
+            return dict()
+        go_ids = [self.go_ids[i] for i in self.go_name_index.find(keyword)]
+        return {go_id:self.go[go_id].name for go_id in go_ids}
     
     
         
@@ -173,22 +145,14 @@ class GOEnrich:
         ----------
         res: list of GOEnrichmentRecord
         """
-        if not pop:
-            pop = self.pop
-        if not assoc:
-            assoc = self.assoc
-        if not go:
-            go = self.go
-        
         #methods = ["bonferroni", "sidak", "holm", "fdr"]
         #In order to reduce delay, only use bonferroni by default
         if not methods:
             methods = ['bonferroni']
-        g = GOEnrichmentStudy(pop, assoc, go,
-                         propagate_counts=propagate_counts,
-                         alpha=alpha,
-                         methods=methods)
-        g_res = g.run_study(study)
+        if not pop and not assoc and not go and propagate_counts and self.study is not None:
+            g_res = self.study.run_study(study, alpha=alpha, methods=methods)
+        else:
+            g_res = self._run_study(study, pop, assoc, go, propagate_counts, alpha, methods)
         
         #only return results with pvalue < pvalue
         res = []
@@ -210,11 +174,34 @@ class GOEnrich:
                     break
         return res
     
+    def go_enrichment_batch(self, studies, alpha=0.05, methods=None, p_bonferroni=0.01, limit=30):
+        """
+        GO enrichment analysis of several studies against the population
+        study, with the multiple testing correction done for each study
+
+        output
+        ----------
+        res: list of the lists of GOEnrichmentRecord of each study
+        """
+        return [self.go_enrichment_analysis(study, alpha=alpha, methods=methods,
+                                            p_bonferroni=p_bonferroni, limit=limit)
+                for study in studies]
+
+    def _run_study(self, study, pop, assoc, go, propagate_counts, alpha, methods):
+        if not pop:
+            pop = self.pop
+        if not assoc:
+            assoc = self.assoc
+        if not go:
+            go = self.go
+        g = GOEnrichmentStudy(pop, assoc, go,
+                         propagate_counts=propagate_counts,
+                         alpha=alpha,
+                         methods=methods)
+        return g.run_study(study)
+    
     def get_assoc_gene_go(self):
-        assoc = defaultdict(set)
-        for x in self.gaf_funcs:
-            for entry in self.gaf_funcs[x]:
-                assoc[x].add(entry['GO_ID'])
+        assoc = defaultdict(set, self.gaf_funcs.assoc())
         return assoc
     
     def download_file_http(self, url, data_folder, file_name):
@@ -271,15 +258,8 @@ class GOEnrich:
         
         gaf_file = self.download_file_ftp(ftp_site, gaf_uri, gaf_fn)
         
-        #read the annotations into a dictionary
-        # File is a gunzip file, so we need to open it in this way
-        with gzip.open(gaf_file, 'rt') as gaf_fp:
-            gaf_funcs = defaultdict(list)
-            # Iterate on each function using Bio.UniProt.GOA library.
-            for entry in GOA.gafiterator(gaf_fp):
-                gene_symbol = entry.pop('DB_Object_Symbol')
-                gaf_funcs[gene_symbol].append(entry)
-        return gaf_funcs
+        #read the annotations into a GafStore
+        return GafStore.from_file(gaf_file)
         
     def generate_go2gene_db(self, go_file_name, data_folder=_resource_dir):
         """
@@ -295,12 +275,10 @@ class GOEnrich:
              (id integer, goid text, genesymbol text)''')
         t = []
         num = 1
-        for gene,entry in self.gaf_funcs.items():
-            for en in entry:
-                go_term = en['GO_ID']
-                #c.execute("INSERT INTO go2genes VALUES (?,?,?)", (num, go_terms, gene))
-                t.append((num, go_term, gene))
-                num += 1
+        for gene, go_term, aspect in self.gaf_funcs.rows():
+            #c.execute("INSERT INTO go2genes VALUES (?,?,?)", (num, go_terms, gene))
+            t.append((num, go_term, gene))
+            num += 1
         c.executemany('INSERT INTO go2genes VALUES (?,?,?)', t)
         conn.commit()
         time.sleep(0.1)
@@ -316,17 +294,73 @@ class GOEnrich:
         num = 1
         fn = os.path.join(data_folder, 'go2genes_gaf.txt')
         with open(fn, 'w') as fw:
-            for gene,entries in self.gaf_funcs.items():
-                for entry in entries:
-                    fw.write(str(num) + '\t' + entry['GO_ID'] + '\t' + gene + '\t')
-                    name_space = self.go[entry['GO_ID']].namespace
-                    #or
-                    #name_space = entry['Aspect']
-                    fw.write(name_space + '\n')
-                    num += 1
+            for gene, go_term, aspect in self.gaf_funcs.rows():
+                fw.write(str(num) + '\t' + go_term + '\t' + gene + '\t')
+                name_space = self.go[go_term].namespace
+                #or
+                #name_space = aspect
+                fw.write(name_space + '\n')
+                num += 1
         print('write {} rows to file.'.format(num))
         return num
 
+def _index_go_names(go):
+    """
+    Return the GO ids (including the alternative ids) and the NameIndex of
+    their names, (None, None) if there's no GO data.
+    """
+    if not go:
+        return None, None
+    go_ids = list(go)
+    return go_ids, NameIndex([go[go_id].name for go_id in go_ids])
+
+def _propagate_assoc(go, gaf_funcs):
+    """
+    Return the associations propagated to the ancestor GO terms and the
+    population genes of each term.
+    """
+    g = GOEnrichmentStudy(gaf_funcs.keys(), gaf_funcs.assoc(), go, propagate_counts=True)
+    return {'assoc': g.assoc, 'go2popitems': g.go2popitems}
+
+#attributes of GOEnrichmentStudy set by _load_study
+_STUDY_ATTRS = ('pop', 'pop_n', 'go2popitems')
+
+def _load_study(go, gaf_funcs, fn=None):
+    """
+    Return the GOEnrichmentStudy of the population of gaf_funcs, None if
+    there's no GO or GAF data. The propagated associations and population
+    terms are read from the artifact fn if given.
+    """
+    if not go or not gaf_funcs:
+        return None
+    build = lambda: _propagate_assoc(go, gaf_funcs)
+    if fn:
+        data = cache_store.load(fn, build, [os.path.join(_resource_dir, 'gaf_funcs.pickle'),
+                                            os.path.join(_resource_dir, 'go-basic.obo')])
+    else:
+        data = build()
+    #the associations are already propagated, and the population terms are
+    #set from data instead of counted again. These attributes are internal to
+    #goatools (pinned in setup.py), so the study is built the usual way if
+    #this version doesn't have them.
+    study = GOEnrichmentStudy([], data['assoc'], go, propagate_counts=False,
+                              methods=['bonferroni'])
+    missing = [attr for attr in _STUDY_ATTRS if not hasattr(study, attr)]
+    if missing:
+        logger.warning('GOEnrichmentStudy has no {}, the population study is built '
+                       'from the annotations.'.format(', '.join(missing)))
+        return GOEnrichmentStudy(gaf_funcs.keys(), gaf_funcs.assoc(), go,
+                                 propagate_counts=True, methods=['bonferroni'])
+    study.pop = set(gaf_funcs.keys())
+    study.pop_n = len(study.pop)
+    study.go2popitems = data['go2popitems']
+    return study
+
+def _parse_gaf(gaf_file):
+    if not gaf_file:
+        return None
+    return GafStore.from_file(gaf_file)
+
 def _load_db():
     db_file = os.path.join(_resource_dir, 'go_gene.db')
     #check file size to determine if it need regenerate
@@ -0,0 +1,188 @@
+"""
+Compact store of the GO annotations of a GAF file.
+
+Only the fields used by GOEnrich are kept: the GO id and aspect of each
+annotation, and the name of each gene. The GO ids are interned and the
+annotations of the genes are stored as CSR arrays (indptr, go_index,
+aspects), instead of one dict of about 15 strings per GAF row. The gene
+names are indexed by a NameIndex for the keyword search.
+
+GafStore is a read-only mapping of gene symbol: list of annotations, each
+annotation being a dict with the GO_ID, Aspect and DB_Object_Name keys, so
+that it can be used as the former dict of Biopython GAF entries.
+"""
+
+import gzip
+import logging
+import numpy as np
+from collections.abc import Mapping
+from utils.text_index import NameIndex
+
+logger = logging.getLogger('TFTA-GafStore')
+
+#columns of a GAF file (1.0, 2.0 and 2.1)
+_SYMBOL = 2
+_GO_ID = 4
+_ASPECT = 8
+_NAME = 9
+
+
+class _GafBuilder:
+    def __init__(self):
+        self.genes = dict()
+        self.names = []
+        self.go_ids = dict()
+        self.annots = []
+
+    def add(self, gene, go_id, aspect, name):
+        i = self.genes.get(gene)
+        if i is None:
+            i = self.genes[gene] = len(self.names)
+            self.names.append(name)
+            self.annots.append([])
+        j = self.go_ids.get(go_id)
+        if j is None:
+            j = self.go_ids[go_id] = len(self.go_ids)
+        self.annots[i].append((j, aspect))
+
+    def build(self):
+        indptr = np.zeros(len(self.annots) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(a) for a in self.annots])
+        rows = [r for a in self.annots for r in a]
+        go_index = np.array([r[0] for r in rows], dtype=np.int32)
+        aspects = np.array([r[1] for r in rows], dtype='S1')
+        return GafStore(list(self.genes), self.names, list(self.go_ids),
+                        indptr, go_index, aspects)
+
+
+class GafStore(Mapping):
+    def __init__(self, genes, names, go_ids, indptr, go_index, aspects, name_index=None):
+        """
+        parameter
+        -----------
+        genes: list of gene symbols
+        names: list, name of each gene
+        go_ids: list of the GO ids
+        indptr: np.array, the annotations of genes[i] are at indptr[i]:indptr[i+1]
+        go_index: np.array, index in go_ids of each annotation
+        aspects: np.array of bytes, aspect (P, F or C) of each annotation
+        name_index: NameIndex of names, built if None
+        """
+        self.genes = genes
+        self.names = names
+        self.go_ids = go_ids
+        self.indptr = indptr
+        self.go_index = go_index
+        self.aspects = aspects
+        if name_index is None:
+            name_index = NameIndex(names)
+        self.name_index = name_index
+        self._init_index()
+
+    def _init_index(self):
+        self._gene_index = {g: i for i, g in enumerate(self.genes)}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_gene_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_index()
+
+    @classmethod
+    def from_file(cls, gaf_file):
+        """
+        Stream the rows of a gzipped GAF file into a GafStore.
+        """
+        builder = _GafBuilder()
+        with gzip.open(gaf_file, 'rt') as gaf_fp:
+            for line in gaf_fp:
+                if line.startswith('!'):
+                    continue
+                s = line.rstrip('\n').split('\t')
+                if len(s) <= _NAME:
+                    continue
+                builder.add(s[_SYMBOL], s[_GO_ID], s[_ASPECT], s[_NAME])
+        store = builder.build()
+        logger.info('Loaded {} annotations of {} genes.'.format(len(store.go_index), len(store)))
+        return store
+
+    @classmethod
+    def from_entries(cls, gaf_funcs):
+        """
+        Convert a dict of gene symbol: list of Biopython GAF entries.
+        """
+        builder = _GafBuilder()
+        for gene, entries in gaf_funcs.items():
+            for entry in entries:
+                builder.add(gene, entry['GO_ID'], entry['Aspect'], entry['DB_Object_Name'])
+        return builder.build()
+
+    def __getitem__(self, gene):
+        return self._annotations(self._gene_index[gene])
+
+    def __contains__(self, gene):
+        return gene in self._gene_index
+
+    def __iter__(self):
+        return iter(self.genes)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def _annotations(self, i):
+        name = self.names[i]
+        return [{'GO_ID': self.go_ids[j], 'Aspect': a.decode(), 'DB_Object_Name': name}
+                for j, a in zip(self.go_index[self.indptr[i]:self.indptr[i+1]].tolist(),
+                                self.aspects[self.indptr[i]:self.indptr[i+1]])]
+
+    def get_annotations(self, gene):
+        """
+        Return the annotations of gene, an empty list if it has none.
+        """
+        i = self._gene_index.get(gene)
+        return self._annotations(i) if i is not None else []
+
+    def go_terms(self, gene):
+        i = self._gene_index.get(gene)
+        if i is None:
+            return []
+        return [self.go_ids[j] for j in self.go_index[self.indptr[i]:self.indptr[i+1]].tolist()]
+
+    def name(self, gene):
+        i = self._gene_index.get(gene)
+        return self.names[i] if i is not None else None
+
+    def genes_with_name(self, keyword, whole_words=False):
+        """
+        Return the genes whose name contains keyword, ignoring case. If
+        whole_words is True, the name must hold each word of keyword as a
+        whole word.
+        """
+        if whole_words:
+            ids = self.name_index.find_tokens(keyword)
+        else:
+            ids = self.name_index.find(keyword)
+        return [self.genes[i] for i in ids]
+
+    def assoc(self):
+        """
+        Return a dict of gene symbol: set of GO ids.
+        """
+        go_index = self.go_index.tolist()
+        indptr = self.indptr.tolist()
+        return {g: set(self.go_ids[j] for j in go_index[indptr[i]:indptr[i+1]])
+                for i, g in enumerate(self.genes)}
+
+    def rows(self):
+        """
+        Iterate over the (gene symbol, GO id, aspect) of the annotations.
+        """
+        go_index = self.go_index.tolist()
+        indptr = self.indptr.tolist()
+        aspects = [a.decode() for a in self.aspects]
+        for i, g in enumerate(self.genes):
+            for k in range(indptr[i], indptr[i+1]):
+                yield g, self.go_ids[go_index[k]], aspects[k]
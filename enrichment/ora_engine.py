@@ -0,0 +1,321 @@
+"""
+Vectorised over representation analysis of a gene set collection.
+
+The collection is stored as a sparse set x gene incidence matrix over its
+own gene vocabulary. The population-mapped size of every set is computed
+once per population, the overlaps of a study with every set are one sparse
+matrix-vector product, and the p-values of the sets are one hypergeom.sf
+call over arrays.
+
+A collection is saved as a cache_store artifact holding the set names,
+links and gene vocabulary, next to the CSR arrays of the matrix in .npy
+files, which load_collection maps into memory instead of reading them.
+"""
+
+import os
+import logging
+import numpy as np
+from scipy import sparse
+from scipy import stats
+from statsmodels.sandbox.stats import multicomp
+from utils import cache_store
+from .result_cache import new_data_version
+
+logger = logging.getLogger('TFTA-OraEngine')
+
+#number of populations whose set sizes are kept
+MAX_POPULATIONS = 4
+
+#relative margin of the p-values pruned by the bonferroni bound
+_MARGIN = 1e-6
+
+#schema version of the saved collections
+COLLECTION_VERSION = 1
+
+
+class GeneSetCollection:
+    def __init__(self, gene_set):
+        """
+        parameter
+        -----------
+        gene_set: dict, set name as key and dict with the 'gene' and 'dblink' keys as value
+        """
+        names = list(gene_set)
+        gene_index = dict()
+        indptr = [0]
+        indices = []
+        for k in names:
+            ids = sorted(set(gene_index.setdefault(g, len(gene_index)) for g in gene_set[k]['gene']))
+            indices.extend(ids)
+            indptr.append(len(indices))
+        self._init(names, [gene_set[k]['dblink'] for k in names], list(gene_index),
+                   np.array(indptr, dtype=np.int32), np.array(indices, dtype=np.int32))
+
+    @classmethod
+    def from_arrays(cls, names, dblinks, genes, indptr, indices):
+        """
+        Build a collection from its CSR arrays, which are not copied.
+        """
+        collection = cls.__new__(cls)
+        collection._init(names, dblinks, genes, indptr, indices)
+        return collection
+
+    def _init(self, names, dblinks, genes, indptr, indices):
+        self.names = names
+        self.dblinks = dblinks
+        self.genes = genes
+        self._gene_index = {g: i for i, g in enumerate(genes)}
+        self.num_genes = len(genes)
+        data = np.ones(len(indices), dtype=np.int8)
+        self.matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(names), self.num_genes),
+                                        copy=False)
+        #id(population): (population, population-mapped size of each set)
+        self._pop_sizes = dict()
+        self.version = new_data_version()
+        #number of tests, and of tests pruned by the bonferroni bound
+        self.tested = 0
+        self.pruned = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def _ids(self, genes):
+        """
+        Return the sorted ids of genes (an iterable of symbols) in the vocabulary.
+        """
+        index = self._gene_index
+        return sorted(set(index[g] for g in genes if g in index))
+
+    def _vector(self, genes):
+        """
+        Indicator vector of genes over the vocabulary.
+        """
+        vec = np.zeros(self.num_genes, dtype=np.int32)
+        vec[self._ids(genes)] = 1
+        return vec
+
+    def pop_sizes(self, pop):
+        """
+        Return the number of genes of each set in the population pop.
+        """
+        res = self._pop_sizes.get(id(pop))
+        if res is None or res[0] is not pop:
+            res = (pop, self.matrix.dot(self._vector(pop)))
+            if len(self._pop_sizes) >= MAX_POPULATIONS:
+                self._pop_sizes.clear()
+            self._pop_sizes[id(pop)] = res
+        return res[1]
+
+    def _study_matrix(self, studies):
+        """
+        Sparse study x gene indicator matrix of a list of studies.
+        """
+        indptr = [0]
+        indices = []
+        for study in studies:
+            indices.extend(self._ids(study))
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.int32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(studies), self.num_genes))
+
+    def study_genes(self, i, study_ids):
+        """
+        Return the genes of set i in the study given by its sorted gene ids.
+        """
+        cols = self.matrix.indices[self.matrix.indptr[i]:self.matrix.indptr[i+1]]
+        return set(self.genes[j] for j in np.intersect1d(cols, study_ids, assume_unique=True).tolist())
+
+    def ora(self, study, pop, adjust='bonferroni', p_bonferroni=0.01, limit=30, prune=True):
+        """
+        Over representation analysis based on hypergeometric test, see
+        PathwayEnrich.ora.
+        """
+        return self.ora_batch([study], pop, adjust=adjust, p_bonferroni=p_bonferroni, limit=limit,
+                              prune=prune)[0]
+
+    def ora_batch(self, studies, pop, adjust='bonferroni', p_bonferroni=0.01, limit=30, prune=True):
+        """
+        Over representation analysis of several studies. The overlaps of all
+        the studies with all the sets are one sparse product, and their
+        p-values one hypergeom.sf call; the multiple testing correction is
+        done for each study.
+
+        With the bonferroni correction and prune True, the p-values of the
+        sets which cannot be significant are not computed, unless the study
+        has no significant set, see _prune. The result is the same.
+
+        return
+        -----------
+        list of dict, the result of ora for each study
+        """
+        study_matrix = self._study_matrix(studies)
+        #only the sets sharing genes with a study are tested
+        overlaps = study_matrix.dot(self.matrix.T).tocsr()
+        overlaps.eliminate_zeros()
+        overlaps.sort_indices()
+        indptr = overlaps.indptr
+        pop_sizes = self.pop_sizes(pop)[overlaps.indices]
+        study_sizes = np.repeat([len(study) for study in studies], np.diff(indptr))
+        prune = prune and adjust == 'bonferroni'
+        if prune:
+            keep = np.ones(len(overlaps.data), dtype=bool)
+            for r, study in enumerate(studies):
+                start, end = indptr[r], indptr[r+1]
+                keep[start:end] = self._prune(overlaps.data[start:end], pop_sizes[start:end],
+                                              len(pop), len(study), p_bonferroni)
+        else:
+            keep = slice(None)
+        pvalues = np.full(len(overlaps.data), np.nan)
+        pvalues[keep] = stats.hypergeom.sf(overlaps.data[keep] - 1, len(pop), pop_sizes[keep], study_sizes[keep])
+        if prune:
+            #the studies without significant set return their top 5 sets,
+            #so all their p-values are needed
+            rest = np.zeros(len(overlaps.data), dtype=bool)
+            for r in range(len(studies)):
+                start, end = indptr[r], indptr[r+1]
+                if not np.any(np.minimum(pvalues[start:end][keep[start:end]] * float(end - start), 1.0) < p_bonferroni):
+                    rest[start:end] = ~keep[start:end]
+                    keep[start:end] = True
+            if rest.any():
+                pvalues[rest] = stats.hypergeom.sf(overlaps.data[rest] - 1, len(pop), pop_sizes[rest],
+                                                   study_sizes[rest])
+            self.pruned += len(keep) - int(keep.sum())
+            self.tested += len(keep)
+            logger.info('ORA skipped {} of {} tests, {:.1%} of all tests so far.'.format(
+                         len(keep) - int(keep.sum()), len(keep), self.skip_rate()))
+        res = []
+        for r in range(len(studies)):
+            start, end = indptr[r], indptr[r+1]
+            study_ids = study_matrix.indices[study_matrix.indptr[r]:study_matrix.indptr[r+1]]
+            if prune:
+                kept = keep[start:end]
+                res.append(self._select(overlaps.indices[start:end][kept], pvalues[start:end][kept], study_ids,
+                                        adjust, p_bonferroni, limit, ntests=end - start))
+            else:
+                res.append(self._select(overlaps.indices[start:end], pvalues[start:end], study_ids,
+                                        adjust, p_bonferroni, limit))
+        return res
+
+    @staticmethod
+    def _prune(overlaps, pop_sizes, M, N, p_bonferroni):
+        """
+        Return the mask of the tested sets of a study which may be
+        significant after the bonferroni correction.
+
+        For a given overlap k, the p-value sf(k-1, M, n, N) grows with the
+        set size n, so the sets of overlap k which may be significant are
+        those smaller than a size bound. The bound of each overlap is found
+        by a binary search over the set sizes, each step being one sf call
+        for all the overlaps. A set is only pruned when its bound was
+        reached by a p-value above the threshold with some margin, so the
+        rounding of sf never prunes a significant set.
+        """
+        ntests = len(overlaps)
+        ks = np.unique(overlaps)
+        ns = np.unique(pop_sizes)
+        #the search costs about len(ks) * log2(len(ns)) sf evaluations
+        if not ntests or len(ks) * np.log2(len(ns) + 1) >= ntests:
+            return np.ones(ntests, dtype=bool)
+        threshold = p_bonferroni * (1 + _MARGIN)
+        lo = np.zeros(len(ks), dtype=np.int64)
+        hi = np.full(len(ks), len(ns), dtype=np.int64)
+        while True:
+            active = np.flatnonzero(lo < hi)
+            if not len(active):
+                break
+            mid = (lo[active] + hi[active]) // 2
+            above = stats.hypergeom.sf(ks[active] - 1, M, ns[mid], N) * float(ntests) >= threshold
+            hi[active[above]] = mid[above]
+            lo[active[~above]] = mid[~above] + 1
+        #number of set sizes which may be significant, for each overlap
+        bound = lo[np.searchsorted(ks, overlaps)]
+        return np.searchsorted(ns, pop_sizes) < bound
+
+    def skip_rate(self):
+        """
+        Return the fraction of the tests whose p-value was not computed.
+        """
+        return self.pruned / self.tested if self.tested else 0.0
+
+    def _select(self, tested, pvalues, study_ids, adjust, p_bonferroni, limit, ntests=None):
+        """
+        Correct the p-values of the tested sets of a study and return the
+        enriched sets, or the top 5 sets if there's none. If ntests is
+        given, only the sets which may be significant among ntests tests
+        are given, and the p-values are bonferroni corrected.
+        """
+        res = dict()
+        if not len(tested):
+            return res
+        #multiple testing correction
+        if ntests is not None:
+            pv = np.minimum(pvalues * float(ntests), 1.0)
+        else:
+            _, pv, _, _ = multicomp.multipletests(pvalues, method=adjust)
+        #sorting in ascending order according to pvalues
+        order = np.argsort(pv, kind='stable')
+
+        #If there's no enriched ones, return top 5 terms
+        nlimit = limit if pv[order[0]] < p_bonferroni else 5
+        for j in order[:nlimit].tolist():
+            if nlimit == limit and pv[j] >= p_bonferroni:
+                break
+            i = tested[j]
+            res[self.names[i]] = {'p-bonferroni': pv[j], 'dblink': self.dblinks[i],
+                                  'gene': self.study_genes(i, study_ids)}
+        return res
+
+    def save(self, fn):
+        """
+        Save the CSR arrays of the collection next to fn, and return the
+        other data, which load_collection stores in the artifact fn.
+        """
+        for name in ['indptr', 'indices']:
+            tmp = '{}.{}.tmp{}.npy'.format(fn, name, os.getpid())
+            np.save(tmp, np.asarray(getattr(self.matrix, name), dtype=np.int32))
+            os.replace(tmp, '{}.{}.npy'.format(fn, name))
+        return {'names': self.names, 'dblinks': self.dblinks, 'genes': self.genes,
+                'nnz': len(self.matrix.indices)}
+
+
+def _build_collection(fn, build):
+    gene_set = build()
+    if not gene_set:
+        return None
+    return GeneSetCollection(gene_set).save(fn)
+
+def _map_collection(fn, meta):
+    try:
+        indptr = np.load(fn + '.indptr.npy', mmap_mode='r')
+        indices = np.load(fn + '.indices.npy', mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if len(indptr) != len(meta['names']) + 1 or len(indices) != meta['nnz']:
+        return None
+    return GeneSetCollection.from_arrays(meta['names'], meta['dblinks'], meta['genes'], indptr, indices)
+
+def load_collection(fn, build, sources=()):
+    """
+    Return the collection saved as fn, with its CSR arrays mapped into
+    memory, building and saving it if it is missing or older than its sources.
+
+    parameter
+    -----------
+    fn: str, artifact file of the collection
+    build: function returning the dict of the gene sets, see GeneSetCollection,
+    or None if it cannot be built
+    sources: list of the files the gene sets are built from
+    """
+    meta = cache_store.load(fn, lambda: _build_collection(fn, build), sources, COLLECTION_VERSION)
+    if not isinstance(meta, dict):
+        return None
+    collection = _map_collection(fn, meta)
+    if collection is None:
+        #the arrays don't match the artifact, they're rebuilt
+        logger.warning('The arrays of {} are missing or corrupted.'.format(fn))
+        meta = _build_collection(fn, build)
+        if meta is None:
+            return None
+        cache_store.save(fn, meta, sources, COLLECTION_VERSION)
+        collection = _map_collection(fn, meta)
+    return collection
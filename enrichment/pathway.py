@@ -1,11 +1,10 @@
-from scipy import stats
-from statsmodels.sandbox.stats import multicomp
 import os
 import pickle
-import operator
 from collections import defaultdict
 #from tfta.tfta import TFTA
 from utils.util import download_file_dropbox
+from .ora_engine import GeneSetCollection, load_collection
+import threading
 import logging
 logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s',
                     level=logging.INFO)
@@ -26,19 +25,18 @@ class PathwayEnrich():
         self.mirna_pop = mirna_pop
         self.tfta = tfta
         
-        self.gene_sets = self.get_pathway_geneset()
-        if self.gene_sets:
-            logger.info('PathwayEnrich loaded pathway-genesets.')
-        else:
-            logger.info('PathwayEnrich could not load pathway-genesets.')
-        
-        #In order to avoid long-time delay, just load the disease-genesets in advance
-        self.disease2gene = self.get_disease_geneset()
-        if self.disease2gene:
-            logger.info('PathwayEnrich loaded disease-genesets.')
-        else:
-            logger.info('PathwayEnrich could not load disease-genesets.')
-        
+        #the gene sets of each database are mapped into memory on first use,
+        #see get_gene_set
+        self.gene_sets = dict()
+        self.disease2gene = dict()
+        self._lock = threading.Lock()
+    
+    def data_version(self, db_str):
+        """
+        Return the version of the gene sets of the database db_str, None if they can't be loaded.
+        """
+        gene_set = self.get_gene_set(db_str)
+        return gene_set.version if gene_set is not None else None
     
     def get_ora_pathway(self, study, db_str='kegg'):
         """
@@ -51,7 +49,7 @@ class PathwayEnrich():
         """
         #res = defaultdict(dict)
         try:
-            res = self.ora(study, self.pop, self.gene_sets[db_str.lower()])
+            res = self.ora(study, self.pop, self.get_gene_set(db_str))
             return res
         except Exception as e:
             logger.error(e)
@@ -68,14 +66,7 @@ class PathwayEnrich():
         """
         db_str = db_str.lower()
         if db_str in self.disease_db:
-            if db_str in self.disease2gene:
-                gene_set = self.disease2gene[db_str]
-            else:
-                fn = os.path.join(_enrich_dir, db_str + '.pickle')
-                url = self.disease_link[db_str]
-                gene_set = self.load_pickle_file(fn, url=url)
-                if gene_set:
-                    self.disease2gene[db_str] = gene_set
+            gene_set = self.get_gene_set(db_str)
         else:
             return None
             
@@ -91,42 +82,71 @@ class PathwayEnrich():
             logger.error(e)
             return None
         
-    def get_pathway_geneset(self):
-        gene_sets = dict()
-        filenames = dict()
-        is_exist = True
-        for db in self.pathway_db:
-            fn = os.path.join(_enrich_dir, db + '.pickle')
-            filenames[db] = fn
-            if not os.path.isfile(fn):
-                is_exist = False
+    def get_ora_batch(self, studies, db_str='kegg'):
+        """
+        Return the enriched pathways or diseases of each study, with the
+        multiple testing correction done for each study
+        
+        parameter
+        ---------------
+        studies: list of lists or sets of genes (of miRNAs for hmdd)
+        db_str: str, a pathway or disease database
+        """
+        db_str = db_str.lower()
+        if db_str in self.pathway_db:
+            pop = self.pop
+        elif db_str in self.disease_db:
+            pop = self.mirna_pop if db_str == 'hmdd' else self.pop
+        else:
+            return None
+        gene_set = self.get_gene_set(db_str)
+        try:
+            return [defaultdict(dict, res) for res in gene_set.ora_batch(studies, pop)]
+        except Exception as e:
+            logger.error(e)
+            return None
         
-        if is_exist:
-            for db in self.pathway_db:
-                with open(filenames[db], 'rb') as pickle_in:
-                    gene_sets[db] = pickle.load(pickle_in)
+    def get_gene_set(self, db_str):
+        """
+        Return the GeneSetCollection of the pathway or disease database
+        db_str, mapping it into memory on first use, or None if it can't be
+        loaded.
+        """
+        db_str = db_str.lower()
+        if db_str in self.pathway_db:
+            loaded = self.gene_sets
+        elif db_str in self.disease_db:
+            loaded = self.disease2gene
         else:
-            for db in self.pathway_db:
-                gset = self.tfta.get_pathway_genes(db)
-                if len(gset):
-                    gene_sets[db] = gset
-                else:
+            return None
+        with self._lock:
+            if db_str not in loaded:
+                try:
+                    if db_str in self.pathway_db:
+                        gene_set = self.get_pathway_geneset(db_str)
+                    else:
+                        gene_set = self.get_disease_geneset(db_str)
+                except Exception as e:
+                    logger.error(e)
+                    gene_set = None
+                if gene_set is None:
+                    logger.info('PathwayEnrich could not load the {} genesets.'.format(db_str))
                     return None
-        return gene_sets
+                logger.info('PathwayEnrich loaded the {} genesets.'.format(db_str))
+                loaded[db_str] = gene_set
+            return loaded[db_str]
         
-    def get_disease_geneset(self):
-        disease2gene = dict()
-        for db in self.disease_db:
-            fn = os.path.join(_enrich_dir, db + '.pickle')
-            url = self.disease_link[db]
-            
-            geneset = self.load_pickle_file(fn, url=url)
-            if geneset:
-                disease2gene[db] = geneset
-        return disease2gene
+    def get_pathway_geneset(self, db_str):
+        #the collection is validated against the database by the cache store
+        return self.tfta.get_pathway_gene_sets(db_str)
+        
+    def get_disease_geneset(self, db_str):
+        fn = os.path.join(_enrich_dir, db_str + '.pickle')
+        return load_collection(os.path.join(_enrich_dir, db_str + '.genesets'),
+                               lambda: self.load_pickle_file(fn, url=self.disease_link[db_str]), [fn])
         
     @staticmethod
-    def ora(study, pop, gene_set, adjust='bonferroni', p_bonferroni=0.01, limit=30):
+    def ora(study, pop, gene_set, adjust='bonferroni', p_bonferroni=0.01, limit=30, prune=True):
         """
         Over representation analysis based on hypergeometric test.
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.hypergeom.html
@@ -134,71 +154,22 @@ class PathwayEnrich():
         parameters
         -------------
         study: list or set, the significant gene symbols
-        pop: list or set, the background gene symbols
-        gene_set: dict, the functional gene sets
+        pop: list, set or GeneSet, the background gene symbols
+        gene_set: GeneSetCollection or dict of the functional gene sets, see GeneSetCollection
         adjust: the adjust method in the multiple tests, see details at 
         https://www.statsmodels.org/0.8.0/generated/statsmodels.sandbox.stats.multicomp.multipletests.html
+        prune: bool, with the bonferroni correction, skip the p-values of the sets 
+        which cannot be significant, see GeneSetCollection._prune
         
         return
         -------------
         dict, the ORA analysis result
         """
-        pop_mapped = dict()
-        s_mapped = dict()
-        for k, v in gene_set.items():
-            sm = set(v['gene']) & set(study)
-            if len(sm) >= 1:
-                pop_mapped[k] = set(v['gene']) & set(pop)
-                s_mapped[k] = sm
-        pvalues = {}
-        for k in s_mapped.keys():
-            pvalues[k] = stats.hypergeom.sf(len(s_mapped[k]) - 1, len(pop), len(pop_mapped[k]), len(study))
-        
-        #multiple testing correction
-        _, pv, _, _ = multicomp.multipletests(list(pvalues.values()), method=adjust)
-        res_cor = {list(pvalues.keys())[i]: pv[i] for i in range(len(pvalues))}
-        #sorting in ascending order according to pvalues, list of tuples
-        res_sorted = sorted(res_cor.items(), key=operator.itemgetter(1))
-        
-        # only consider those with pvalue < 0.01
-#         sig_pvalues = dict()
-#         for k,v in pvalues.items():
-#             if v < p_bonferroni:
-#                 sig_pvalues[k] = v
-#         if sig_pvalues:
-#             _, pv, _, _ = multicomp.multipletests(list(sig_pvalues.values()), method=adjust)
-#             res_cor = {list(sig_pvalues.keys())[i]: pv[i] for i in range(len(sig_pvalues))}
-#         
-#             #sorting in ascending order according to pvalues, list of tuples
-#             res_sorted = sorted(res_cor.items(), key=operator.itemgetter(1))
-#         else:
-#             res_sorted = []
-        
-        #test purpose
-        #save_res(res_sorted)
-        
-        num = 1
+        if not isinstance(gene_set, GeneSetCollection):
+            gene_set = GeneSetCollection(gene_set)
         res = defaultdict(dict)
-        if res_sorted:
-            for pn, pv in res_sorted:
-                if num > limit:
-                    break
-                if pv < p_bonferroni:
-                    res[pn]['p-bonferroni'] = pv
-                    res[pn]['dblink'] = gene_set[pn]['dblink']
-                    res[pn]['gene'] = s_mapped[pn]
-                    num += 1
-                else:
-                    break
-            #If there's no enriched ones, return top 5 terms
-            if not res:
-                nlimit = 5
-                for pn, pv in res_sorted:
-                    res[pn]['p-bonferroni'] = pv
-                    res[pn]['dblink'] = gene_set[pn]['dblink']
-                    res[pn]['gene'] = s_mapped[pn]
-                    if len(res) >= nlimit:
-                        break
+        res.update(gene_set.ora(study, pop, adjust=adjust, p_bonferroni=p_bonferroni, limit=limit,
+                               prune=prune))
         return res
         
     @staticmethod
@@ -0,0 +1,120 @@
+"""
+Bounded LRU cache of the enrichment results.
+
+Users often run the same enrichment again in a dialogue, on the same genes
+with another database or after a clarification. The results are cached
+under the canonical study (the set of symbols and the number of symbols
+given, since duplicates count in the tests), the database, the method, the
+thresholds and the version of the data they were computed from. The cached
+values are the serialized results, so their size is known and the cache
+is bounded in bytes.
+"""
+
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('TFTA-ResultCache')
+
+#default memory bound of the cache in bytes
+MAX_BYTES = 16 << 20
+
+_versions = itertools.count(1)
+
+
+def new_data_version():
+    """
+    Return a version number, unique in the process, for a newly loaded data set.
+    """
+    return next(_versions)
+
+def make_key(study, database, method, thresholds=(), version=None):
+    """
+    parameter
+    -----------
+    study: list or set of symbols
+    database: str
+    method: str, the test and the multiple testing correction
+    thresholds: tuple of the thresholds of the analysis
+    version: version of the data of database, see new_data_version
+    """
+    study = list(study)
+    return (frozenset(study), len(study), database, method, tuple(thresholds), version)
+
+
+class ResultCache:
+    def __init__(self, max_bytes=MAX_BYTES):
+        """
+        parameter
+        -----------
+        max_bytes: int, bound of the total size of the cached values, 0 disables the cache
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the value cached for key, None if there's none.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Cache value, a str, evicting the least recently used values over the memory bound.
+        """
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            while self._entries and self.nbytes + size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+                self.evictions += 1
+            self._entries[key] = value
+            self.nbytes += size
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the value cached for key, or compute and cache it. A None
+        computed value is returned without being cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            logger.debug('Cache hit, hit rate {:.2f}.'.format(self.hit_rate()))
+            return value
+        value = compute()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate(),
+                'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self.nbytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
@@ -13,7 +13,7 @@ def main():
           packages=['tfta','enrichment'],
           install_requires=['pysb', 'indra', 'pykqml', 'objectpath', 'rdflib',
                             'functools32', 'requests', 'lxml',
-                            'pandas', 'suds'],
+                            'pandas', 'suds', 'goatools==1.6.5'],
           include_package_data=True,
           keywords=['systems', 'biology', 'model', 'pathway', 'assembler',
                     'nlp', 'mechanism', 'biochemistry'],
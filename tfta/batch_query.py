@@ -0,0 +1,130 @@
+"""
+Single-statement SQL queries over gene lists.
+
+The whole gene list is bound as one JSON array parameter and expanded with
+json_each, so a multi-gene query is one round trip whatever the list size,
+and grouping, counting and intersection are done by sqlite.
+
+If the connection has a knowledge pack (its pack attribute, see
+knowledge_pack.py) holding the relation of a query without extra
+conditions, the query is answered from the pack instead.
+"""
+
+import json
+
+#expands a json array bound to one parameter
+IN_LIST = "IN (SELECT value FROM json_each(?))"
+
+
+def _packed(db, table, key, value, where):
+    """
+    Return the knowledge pack relation answering the query, or None.
+    """
+    pack = getattr(db, 'pack', None)
+    if pack is None or where:
+        return None
+    return pack.relation(table, key, value)
+
+def json_list(values):
+    """
+    Encode values as a json array, dropping duplicates but keeping order.
+    """
+    return json.dumps(list(dict.fromkeys(values)))
+
+def count_keys(db, table, key, keys, where='', params=()):
+    """
+    Return the number of distinct keys which have at least one row in table.
+    """
+    sql = ("SELECT COUNT(DISTINCT {k}) FROM {t} WHERE {k} " + IN_LIST + where).format(k=key, t=table)
+    return db.execute(sql, (json_list(keys),) + tuple(params)).fetchone()[0]
+
+def find_common(db, table, key, value, keys, where='', params=()):
+    """
+    Return the set of values related to every one of the keys.
+
+    parameters
+    ------------
+    db: sqlite3 connection
+    table: str, table name
+    key: str, column the keys are matched against
+    value: str, column to return
+    keys: list of str
+    where: str, extra conditions starting with ' AND '
+    params: tuple, parameters of the extra conditions
+
+    return
+    ------------
+    set, or None if any of the keys has no row at all
+    """
+    rel = _packed(db, table, key, value, where)
+    if rel is not None:
+        return rel.find_common(keys)
+    n = len(set(keys))
+    if not n:
+        return set()
+    #stop early without grouping if some key is missing
+    if count_keys(db, table, key, keys, where, params) < n:
+        return None
+    sql = ("SELECT {v} FROM {t} WHERE {k} " + IN_LIST + where +
+           " GROUP BY {v} HAVING COUNT(DISTINCT {k}) = ?").format(k=key, v=value, t=table)
+    res = db.execute(sql, (json_list(keys),) + tuple(params) + (n,)).fetchall()
+    return set([r[0] for r in res])
+
+def find_any(db, table, key, value, keys, where='', params=()):
+    """
+    Return the set of values related to at least one of the keys.
+    """
+    rel = _packed(db, table, key, value, where)
+    if rel is not None:
+        return rel.find_any(keys)
+    res = find_rows(db, table, key, keys, 'DISTINCT ' + value, where, params)
+    return set([r[0] for r in res])
+
+def find_rows(db, table, key, keys, columns='*', where='', params=()):
+    """
+    Return the rows of any of the keys.
+
+    columns: str, the columns to select
+    """
+    sql = ("SELECT " + columns + " FROM {t} WHERE {k} " + IN_LIST + where).format(k=key, t=table)
+    return db.execute(sql, (json_list(keys),) + tuple(params)).fetchall()
+
+def find_values(db, table, key, value, key_value, where='', params=()):
+    """
+    Return the sorted distinct values related to one key.
+    """
+    rel = _packed(db, table, key, value, where)
+    if rel is not None:
+        return rel.values_of(key_value)
+    sql = ("SELECT DISTINCT {v} FROM {t} WHERE {k} = ?" + where +
+           " ORDER BY {v}").format(k=key, v=value, t=table)
+    res = db.execute(sql, (key_value,) + tuple(params)).fetchall()
+    return [r[0] for r in res]
+
+def find_pairs(db, table, key, value, keys, values, columns, where='', params=()):
+    """
+    Return the rows relating any of the keys to any of the values.
+
+    columns: str, the columns to select
+    """
+    sql = ("SELECT " + columns + " FROM {t} WHERE {k} " + IN_LIST +
+           " AND {v} " + IN_LIST + where).format(k=key, v=value, t=table)
+    return db.execute(sql, (json_list(keys), json_list(values)) + tuple(params)).fetchall()
+
+def group_values(db, table, key, value, keys, where='', params=(), min_count=1):
+    """
+    Group the rows of the keys by value.
+
+    return
+    ------------
+    list of (value, list of keys) tuples, sorted by the number of keys
+    in descending order
+    """
+    rel = _packed(db, table, key, value, where)
+    if rel is not None:
+        return rel.group_values(keys, min_count)
+    sql = ("SELECT v, group_concat(k, char(9)), COUNT(*) FROM "
+           "(SELECT DISTINCT {v} AS v, {k} AS k FROM {t} WHERE {k} " + IN_LIST + where + ") "
+           "GROUP BY v HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC, v").format(k=key, v=value, t=table)
+    res = db.execute(sql, (json_list(keys),) + tuple(params) + (min_count,)).fetchall()
+    return [(r[0], r[1].split('\t')) for r in res]
@@ -0,0 +1,350 @@
+"""
+Index audit for the TFTA sqlite databases.
+
+Every SQL statement used in tfta.py and mirDisease.py is run through
+EXPLAIN QUERY PLAN against its database, and the statements doing a full
+table scan are reported. With --build, the missing (covering) indexes are
+created and ANALYZE is run on a copy of each database, which is then used
+by the loaders instead of the original file. The copies also store the
+search tables: the pathway_fts trigram index of the pathway names and the
+upper-cased miRNA key tables.
+
+Usage: python -m tfta.db_index [--build]
+"""
+
+import os
+import re
+import ast
+import shutil
+import logging
+import sqlite3
+import argparse
+from collections import defaultdict
+
+
+logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s',
+                    level=logging.INFO)
+logger = logging.getLogger('TFTA-DBIndex')
+
+_resource_dir = os.path.dirname(os.path.realpath(__file__)) + '/../resources/'
+_module_dir = os.path.dirname(os.path.realpath(__file__))
+
+#database file of each connection attribute used in the source code
+DB_FILES = {'tfdb': 'TF_target_20191224.db',
+            'ldd': 'ldd20200630.db',
+            'mirdb': 'mirnaDisease.db'}
+
+SOURCE_FILES = ['tfta.py', 'mirDisease.py']
+
+#case insensitive key tables, name: (table, column)
+KEY_TABLES = {'mirnaKey': ('mirnaInfo', 'mirna'),
+              'mir2diseaseKey': ('mir2disease', 'mirna')}
+
+#position of the where argument of the batch_query functions
+_BATCH_WHERE_ARG = {'count_keys': 4, 'find_common': 5, 'find_any': 5, 'find_rows': 5,
+                    'find_values': 5, 'find_pairs': 7, 'group_values': 5}
+
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+_PREDICATE = re.compile(r'(?:(\w+)\.)?(\w+)\s*(=|LIKE|IN)\s', re.IGNORECASE)
+
+
+def indexed_db_file(db_file):
+    """
+    Return the indexed copy of db_file if it exists and is up to date,
+    otherwise db_file.
+    """
+    root, ext = os.path.splitext(db_file)
+    indexed_file = root + '.indexed' + ext
+    if os.path.isfile(indexed_file) and os.path.isfile(db_file) and \
+       os.path.getmtime(indexed_file) >= os.path.getmtime(db_file):
+        return indexed_file
+    return db_file
+
+def create_pathway_fts(db, schema='temp'):
+    """
+    Create the pathway_fts table indexing pathwayInfo.pathwayName with the fts5
+    trigram tokenizer, using the pathwayInfo rowid, so that
+    pathwayName LIKE '%keyword%' does not scan pathwayInfo. If the sqlite library
+    has no trigram tokenizer, a plain table is created instead and the same
+    queries still work.
+
+    parameter
+    -----------
+    db: sqlite3 connection to the TF_target database
+    schema: str, 'temp' for a connection to a read-only file, 'main' to store it
+
+    return
+    -----------
+    True if pathway_fts is a trigram index
+    """
+    res = db.execute("SELECT sql FROM sqlite_master WHERE name = 'pathway_fts' UNION ALL "
+                     "SELECT sql FROM sqlite_temp_master WHERE name = 'pathway_fts'").fetchone()
+    if res:
+        return 'trigram' in res[0]
+    try:
+        db.execute("CREATE VIRTUAL TABLE {}.pathway_fts USING "
+                   "fts5(pathwayName, tokenize='trigram')".format(schema))
+        fts = True
+    except sqlite3.OperationalError:
+        logger.warning('No fts5 trigram tokenizer, pathway name search will scan the names.')
+        db.execute("CREATE TABLE {}.pathway_fts (pathwayName text)".format(schema))
+        fts = False
+    db.execute("INSERT INTO {}.pathway_fts (rowid, pathwayName) "
+               "SELECT rowid, pathwayName FROM main.pathwayInfo".format(schema))
+    db.commit()
+    return fts
+
+def create_key_table(db, name, table, column, schema='temp'):
+    """
+    Create the name table holding UPPER(column) of each row of table as key with
+    the rowid of the row, indexed on the key. UPPER only folds ASCII letters like
+    LIKE does, so key = UPPER(?) is the case insensitive equality of column LIKE ?
+    (without wildcards), and it can also be searched by prefix ranges.
+
+    parameter
+    -----------
+    db: sqlite3 connection
+    name: str, name of the key table
+    table: str
+    column: str
+    schema: str, 'temp' for a connection to a read-only file, 'main' to store it
+    """
+    res = db.execute("SELECT name FROM sqlite_master WHERE name = ? UNION ALL "
+                     "SELECT name FROM sqlite_temp_master WHERE name = ?", (name, name)).fetchone()
+    if res:
+        return
+    db.execute('CREATE TABLE {s}.{n} (key text, rid integer)'.format(s=schema, n=name))
+    db.execute('INSERT INTO {s}.{n} SELECT UPPER({c}), rowid FROM main.{t}'.format(
+               s=schema, n=name, c=column, t=table))
+    db.execute('CREATE INDEX {s}.idx_{n}_key ON {n} (key, rid)'.format(s=schema, n=name))
+    db.commit()
+
+def create_search_tables(db, schema='temp'):
+    """
+    Create the search tables (pathway_fts and the case insensitive key tables)
+    of the tables found in db.
+    """
+    tables = _table_columns(db)
+    if 'pathwayInfo' in tables:
+        create_pathway_fts(db, schema)
+    for name, (table, column) in KEY_TABLES.items():
+        if table in tables:
+            create_key_table(db, name, table, column, schema)
+
+def _const_str(node):
+    """
+    Return the value of a string literal (or a sum of string literals), otherwise None.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left = _const_str(node.left)
+        right = _const_str(node.right)
+        if left is not None and right is not None:
+            return left + right
+    return None
+
+def _receiver(node):
+    """
+    Return the connection attribute name of self.tfdb, self.ldd, ...
+    """
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+def collect_queries(source):
+    """
+    Collect the SQL statements from python source code.
+
+    parameter
+    -----------
+    source: str, python source code
+
+    return
+    -----------
+    list of (connection name, sql) tuples, the statements built by
+    batch_query are rewritten as the equivalent single statements
+    """
+    queries = []
+    for node in ast.walk(ast.parse(source)):
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+            continue
+        func = node.func
+        if func.attr in ['execute', 'executemany'] and node.args:
+            sql = _const_str(node.args[0])
+            if sql is not None and sql.lstrip().upper().startswith('SELECT'):
+                queries.append((_receiver(func.value), ' '.join(sql.split())))
+        elif _receiver(func.value) == 'batch_query' and func.attr in _BATCH_WHERE_ARG:
+            args = [_const_str(a) for a in node.args]
+            if len(args) < 3 or args[1] is None or args[2] is None:
+                continue
+            columns = '*'
+            if func.attr == 'find_rows' and len(args) > 4 and args[4]:
+                columns = args[4]
+            elif func.attr != 'count_keys' and len(args) > 3 and args[3]:
+                columns = args[3]
+            where = ''
+            n = _BATCH_WHERE_ARG[func.attr]
+            if len(args) > n and args[n]:
+                where = args[n]
+            sql = 'SELECT {} FROM {} WHERE {} IN (SELECT value FROM json_each(?)){}'.format(
+                  columns, args[1], args[2], where)
+            queries.append((_receiver(node.args[0]), ' '.join(sql.split())))
+    return list(dict.fromkeys(queries))
+
+def collect_module_queries(files=None):
+    """
+    Collect the SQL statements of the source files, grouped by connection name.
+    """
+    if files is None:
+        files = [os.path.join(_module_dir, f) for f in SOURCE_FILES]
+    queries = defaultdict(list)
+    for fn in files:
+        with open(fn, 'r') as fr:
+            for db, sql in collect_queries(fr.read()):
+                if sql not in queries[db]:
+                    queries[db].append(sql)
+    return queries
+
+def explain(db, sql):
+    """
+    Return the EXPLAIN QUERY PLAN details of sql, or None if it cannot be prepared.
+    """
+    params = ('a',) * sql.count('?')
+    try:
+        return [r[3] for r in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+    except sqlite3.Error:
+        return None
+
+def full_scans(db, sql):
+    """
+    Return the tables fully scanned by sql.
+    """
+    tables = _table_columns(db)
+    plan = explain(db, sql) or []
+    scans = []
+    for detail in plan:
+        m = _SCAN.match(detail)
+        #a scan using a covering index still reads the whole index
+        if m and m.group(1) in tables and 'VIRTUAL TABLE' not in detail:
+            scans.append(m.group(1))
+    return scans
+
+def _table_columns(db):
+    tables = dict()
+    res = db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    for r in res:
+        tables[r[0]] = [c[1] for c in db.execute('PRAGMA table_info("{}")'.format(r[0]))]
+    return tables
+
+def _selected_columns(sql, table, columns):
+    m = re.match(r'SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM\s+(\w+)', sql, re.IGNORECASE)
+    if not m or m.group(2) != table:
+        return []
+    selected = [c.strip() for c in m.group(1).split(',')]
+    if all(c in columns for c in selected):
+        return selected
+    return []
+
+def suggest_index(db, sql, table):
+    """
+    Suggest an index of table for sql: the first filtered column, followed by the
+    other selected columns so that the index covers the query.
+
+    return
+    -----------
+    (columns, nocase) or None, nocase is True for a LIKE filter
+    """
+    columns = _table_columns(db).get(table, [])
+    where = re.split(r'\sWHERE\s', sql, 1, flags=re.IGNORECASE)
+    if len(where) < 2:
+        return None
+    for m in _PREDICATE.finditer(where[1]):
+        col = m.group(2)
+        if col in columns and (m.group(1) is None or m.group(1) == table):
+            nocase = m.group(3).upper() == 'LIKE'
+            cols = [col] + [c for c in _selected_columns(sql, table, columns) if c != col]
+            return tuple(cols), nocase
+    return None
+
+def create_index(db, table, cols, nocase):
+    name = 'idx_{}_{}'.format(table, '_'.join(cols)) + ('_nocase' if nocase else '')
+    col_def = ['"{}"'.format(c) for c in cols]
+    if nocase:
+        col_def[0] += ' COLLATE NOCASE'
+    db.execute('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(name, table, ','.join(col_def)))
+    return name
+
+def audit(db, queries):
+    """
+    Return the list of (sql, tables fully scanned) of the queries with a full scan.
+    """
+    report = []
+    for sql in queries:
+        scans = full_scans(db, sql)
+        if scans:
+            report.append((sql, scans))
+    return report
+
+def build_indexed_copy(db_file, queries, out_file=None):
+    """
+    Copy db_file, create the indexes missing for the queries and run ANALYZE
+    on the copy.
+
+    return
+    -----------
+    list of (sql, tables) of the queries still doing a full scan
+    """
+    if out_file is None:
+        root, ext = os.path.splitext(db_file)
+        out_file = root + '.indexed' + ext
+    tmp_file = out_file + '.tmp'
+    shutil.copyfile(db_file, tmp_file)
+    db = sqlite3.connect(tmp_file)
+    try:
+        create_search_tables(db, 'main')
+        for sql in queries:
+            #check again each query, an index created before may already cover it
+            for table in full_scans(db, sql):
+                idx = suggest_index(db, sql, table)
+                if idx:
+                    name = create_index(db, table, *idx)
+                    logger.info('Created index {}'.format(name))
+        db.execute('ANALYZE')
+        db.commit()
+        remaining = audit(db, queries)
+    finally:
+        db.close()
+    os.replace(tmp_file, out_file)
+    return remaining
+
+def _report(report):
+    for sql, scans in report:
+        logger.info('Full scan of {}: {}'.format(','.join(scans), sql))
+
+def main():
+    parser = argparse.ArgumentParser(description='Audit the indexes of the TFTA databases.')
+    parser.add_argument('--build', action='store_true',
+                        help='create the missing indexes in an indexed copy of each database')
+    args = parser.parse_args()
+
+    queries = collect_module_queries()
+    for name, fn in DB_FILES.items():
+        db_file = os.path.join(_resource_dir, fn)
+        if not os.path.isfile(db_file) or not queries.get(name):
+            continue
+        logger.info('Checking {} queries on {}'.format(len(queries[name]), fn))
+        if args.build:
+            remaining = build_indexed_copy(db_file, queries[name])
+            logger.info('{} queries still do a full scan.'.format(len(remaining)))
+            _report(remaining)
+        else:
+            db = sqlite3.connect(indexed_db_file(db_file))
+            create_search_tables(db)
+            _report(audit(db, queries[name]))
+            db.close()
+
+if __name__ == '__main__':
+    main()
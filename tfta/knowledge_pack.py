@@ -0,0 +1,482 @@
+"""
+Compiled knowledge pack of the TFTA databases.
+
+The relation tables of TF_target_20191224.db, ldd20200630.db and
+mirnaDisease.db are compiled into numpy arrays which are memory-mapped at
+startup: one sorted table of all the strings, and for each relation (such
+as CombinedDB TF -> Target) the sorted keys with the CSR arrays of their
+values, in both directions. The pack also holds the TF and miRNA sets and
+the HGNC symbol to id mapping. Being read-only files, its pages are shared
+by all the agent processes of a host through the OS page cache.
+
+batch_query serves the lookups of the relations in the pack from it, when
+the pack is up to date with the databases and the TFTA_KNOWLEDGE_PACK config
+option is not off.
+
+Usage: python -m tfta.knowledge_pack
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import sqlite3
+import argparse
+from collections.abc import Mapping, Set
+import numpy as np
+
+
+logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s',
+                    level=logging.INFO)
+logger = logging.getLogger('TFTA-KnowledgePack')
+
+_resource_dir = os.path.dirname(os.path.realpath(__file__)) + '/../resources/'
+_pack_dir = os.path.join(_resource_dir, 'knowledge_pack')
+
+PACK_VERSION = 1
+
+#relations compiled in both directions, database file: [(table, column, column)]
+RELATIONS = {
+    'TF_target_20191224.db': [('CombinedDB', 'TF', 'Target'),
+                              ('mirnaInfo', 'mirna', 'target'),
+                              ('kinaseReg', 'kinase', 'target'),
+                              ('pathway2Genes', 'pathwayID', 'genesymbol'),
+                              ('go2Genes', 'termId', 'geneSymbol')],
+    'ldd20200630.db': [('diseaseGene', 'diseaseId', 'gene'),
+                       ('ligandGene', 'ligandId', 'gene'),
+                       ('drugGene', 'drugId', 'gene')],
+    'mirnaDisease.db': [('mir2disease', 'mirna', 'disease')]}
+
+#symbol sets, name: (database file, table, column)
+SETS = {'transFactor': ('TF_target_20191224.db', 'transFactor', 'tf'),
+        'mirna': ('TF_target_20191224.db', 'mirnaInfo', 'mirna')}
+
+HGNC_FILE = 'hgnc_symbol_id_20190225.txt'
+
+
+def _load_array(fn):
+    try:
+        return np.load(fn, mmap_mode='r')
+    except ValueError:
+        #an empty array cannot be mapped
+        return np.load(fn)
+
+class StringTable:
+    """
+    Sorted strings stored as one utf-8 buffer and the offsets of the strings.
+    A string is found by binary search, without building a dict.
+    """
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bytes(self, i):
+        return self.data[self.offsets[i]:self.offsets[i+1]].tobytes()
+
+    def __getitem__(self, i):
+        return self._bytes(i).decode('utf-8')
+
+    def find(self, s):
+        """
+        Return the id of s, or -1 if it is not in the table.
+        """
+        if not isinstance(s, str):
+            return -1
+        key = s.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._bytes(lo) == key:
+            return lo
+        return -1
+
+    def decode(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = self.offsets[ids].tolist()
+        ends = self.offsets[ids + 1].tolist()
+        data = memoryview(self.data)
+        return [str(data[a:b], 'utf-8') for a, b in zip(starts, ends)]
+
+
+class Relation:
+    """
+    Values of each key of a relation, the keys and the values of each key
+    being sorted. A str column holds the ids of the strings, which are in
+    the same order as the strings, and an int column holds the values.
+    """
+    def __init__(self, strings, keys, indptr, values, key_type, value_type):
+        self.strings = strings
+        self.keys = keys
+        self.indptr = indptr
+        self.values = values
+        self.key_type = key_type
+        self.value_type = value_type
+
+    def _code(self, key):
+        #the conversions sqlite does when comparing the key with the column
+        if self.key_type == 'str':
+            if isinstance(key, int) and not isinstance(key, bool):
+                key = str(key)
+            return self.strings.find(key)
+        if isinstance(key, str):
+            try:
+                return int(key)
+            except ValueError:
+                return None
+        if isinstance(key, int) and not isinstance(key, bool):
+            return key
+        return None
+
+    def codes_of(self, key):
+        code = self._code(key)
+        if code is None or code < 0 and self.key_type == 'str':
+            return self.values[:0]
+        i = np.searchsorted(self.keys, code)
+        if i == len(self.keys) or self.keys[i] != code:
+            return self.values[:0]
+        return self.values[self.indptr[i]:self.indptr[i+1]]
+
+    def decode(self, codes):
+        if self.value_type == 'str':
+            return self.strings.decode(codes)
+        return [int(c) for c in codes]
+
+    def values_of(self, key):
+        """
+        Return the sorted values of key.
+        """
+        return self.decode(self.codes_of(key))
+
+    def find_common(self, keys):
+        """
+        Same as batch_query.find_common.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return set()
+        arrays = [self.codes_of(k) for k in keys]
+        if not all(len(a) for a in arrays):
+            return None
+        res = arrays[0]
+        for a in arrays[1:]:
+            res = np.intersect1d(res, a, assume_unique=True)
+        return set(self.decode(res))
+
+    def find_any(self, keys):
+        """
+        Same as batch_query.find_any.
+        """
+        arrays = [self.codes_of(k) for k in dict.fromkeys(keys)]
+        if not arrays:
+            return set()
+        return set(self.decode(np.unique(np.concatenate(arrays))))
+
+    def group_values(self, keys, min_count=1):
+        """
+        Same as batch_query.group_values.
+        """
+        keys = list(dict.fromkeys(keys))
+        arrays = [self.codes_of(k) for k in keys]
+        if not arrays:
+            return []
+        codes = np.concatenate(arrays)
+        key_idx = np.repeat(np.arange(len(keys)), [len(a) for a in arrays])
+        uniq, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+        #count in descending order, then value
+        order = np.lexsort((uniq, -counts))
+        order = order[counts[order] >= min_count]
+        #keys of each value in input order
+        members = np.argsort(inverse, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)))
+        names = self.decode(uniq[order])
+        #the keys as returned by group_concat
+        if self.key_type == 'str':
+            labels = [str(k) for k in keys]
+        else:
+            labels = [str(self._code(k)) for k in keys]
+        return [(name, [labels[k] for k in key_idx[members[starts[i]:starts[i+1]]]])
+                for name, i in zip(names, order)]
+
+
+class SymbolSet(Set):
+    """
+    Read-only set of the strings of a pack. Set operations with it return
+    python sets.
+    """
+    def __init__(self, strings, codes):
+        self.strings = strings
+        self.codes = codes
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, s):
+        code = self.strings.find(s)
+        if code < 0:
+            return False
+        i = np.searchsorted(self.codes, code)
+        return i < len(self.codes) and self.codes[i] == code
+
+    def __iter__(self):
+        return iter(self.strings.decode(self.codes))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def intersection(self, other):
+        return set(s for s in other if s in self)
+
+
+class SymbolMapping(Mapping):
+    """
+    Read-only dict between strings of a pack.
+    """
+    def __init__(self, strings, keys, values):
+        self.strings = strings
+        self.key_codes = keys
+        self.value_codes = values
+
+    def __getitem__(self, s):
+        code = self.strings.find(s)
+        i = np.searchsorted(self.key_codes, code)
+        if code < 0 or i == len(self.key_codes) or self.key_codes[i] != code:
+            raise KeyError(s)
+        return self.strings[self.value_codes[i]]
+
+    def __iter__(self):
+        return iter(self.strings.decode(self.key_codes))
+
+    def __len__(self):
+        return len(self.key_codes)
+
+
+class KnowledgePack:
+    def __init__(self, pack_dir, manifest):
+        self.pack_dir = pack_dir
+        self.manifest = manifest
+        data_file = os.path.join(pack_dir, 'strings.bin')
+        if os.path.getsize(data_file):
+            data = np.memmap(data_file, dtype=np.uint8, mode='r')
+        else:
+            data = np.zeros(0, dtype=np.uint8)
+        self.strings = StringTable(data, self._load('strings.offsets'))
+        self.relations = dict()
+        for r in manifest['relations']:
+            name = _relation_name(r['table'], r['key'], r['value'])
+            self.relations[(r['table'], r['key'], r['value'])] = Relation(
+                self.strings, self._load(name + '.keys'), self._load(name + '.indptr'),
+                self._load(name + '.values'), r['key_type'], r['value_type'])
+        self.sets = dict()
+        for name in manifest['sets']:
+            self.sets[name] = SymbolSet(self.strings, self._load(name))
+        self.hgnc = None
+        if manifest['hgnc']:
+            self.hgnc = SymbolMapping(self.strings, self._load('hgnc.keys'),
+                                      self._load('hgnc.values'))
+
+    def _load(self, name):
+        return _load_array(os.path.join(self.pack_dir, name + '.npy'))
+
+    def relation(self, table, key, value):
+        """
+        Return the Relation of the key and value columns of table, or None
+        if it is not in the pack.
+        """
+        return self.relations.get((table, key, value))
+
+
+def _relation_name(table, key, value):
+    return '{}.{}.{}'.format(table, key, value)
+
+def _source_stats(files, resource_dir):
+    stats = dict()
+    for fn in files:
+        st = os.stat(os.path.join(resource_dir, fn))
+        stats[fn] = [st.st_size, st.st_mtime]
+    return stats
+
+def load_pack(pack_dir=_pack_dir, resource_dir=_resource_dir):
+    """
+    Map the knowledge pack in pack_dir, built from the files in resource_dir.
+
+    return
+    -----------
+    KnowledgePack, or None if there is no pack or it is older than its
+    source files
+    """
+    manifest_file = os.path.join(pack_dir, 'manifest.json')
+    if not os.path.isfile(manifest_file):
+        return None
+    with open(manifest_file, 'r') as fr:
+        manifest = json.load(fr)
+    if manifest.get('version') != PACK_VERSION:
+        logger.warning('Knowledge pack version {} is not supported, rebuild it with '
+                       'python -m tfta.knowledge_pack.'.format(manifest.get('version')))
+        return None
+    try:
+        stats = _source_stats(manifest['sources'], resource_dir)
+    except OSError:
+        stats = None
+    if stats != manifest['sources']:
+        logger.warning('Knowledge pack is out of date, rebuild it with python -m tfta.knowledge_pack.')
+        return None
+    t0 = time.perf_counter()
+    pack = KnowledgePack(pack_dir, manifest)
+    logger.info('Mapped knowledge pack of {} relations in {:.3f} seconds.'.format(
+                len(pack.relations), time.perf_counter() - t0))
+    return pack
+
+def _column_type(values):
+    if all(isinstance(v, str) for v in values):
+        return 'str'
+    if all(isinstance(v, int) for v in values):
+        return 'int'
+    return None
+
+def _read_hgnc(fn):
+    #same as tfta._get_hgnc_genes, symbol: id
+    hgnc = dict()
+    with open(fn, 'rt') as fr:
+        for line in fr:
+            s = line.strip().split('\t')
+            hgnc[s[1]] = s[0]
+    return hgnc
+
+def _csr(key_codes, value_codes):
+    order = np.lexsort((value_codes, key_codes))
+    key_codes = key_codes[order]
+    keys, counts = np.unique(key_codes, return_counts=True)
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return keys, indptr, value_codes[order]
+
+def build_pack(pack_dir=_pack_dir, resource_dir=_resource_dir):
+    """
+    Compile the databases found in resource_dir into a knowledge pack, written
+    to a temporary folder which then replaces pack_dir.
+    """
+    t0 = time.perf_counter()
+    sources = []
+    pairs = dict()
+    sets = dict()
+    for fn, relations in RELATIONS.items():
+        db_file = os.path.join(resource_dir, fn)
+        if not os.path.isfile(db_file):
+            logger.warning('{} not found, its relations are not in the pack.'.format(fn))
+            continue
+        sources.append(fn)
+        db = sqlite3.connect(db_file)
+        tables = set(r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        for table, key, value in relations:
+            if table not in tables:
+                continue
+            res = db.execute("SELECT DISTINCT {k}, {v} FROM {t} WHERE {k} IS NOT NULL AND "
+                             "{v} IS NOT NULL".format(k=key, v=value, t=table)).fetchall()
+            pairs[(table, key, value)] = res
+        for name, (set_fn, table, column) in SETS.items():
+            if set_fn == fn and table in tables:
+                res = db.execute("SELECT DISTINCT {c} FROM {t} WHERE {c} IS NOT NULL".format(
+                                 c=column, t=table)).fetchall()
+                sets[name] = [r[0] for r in res]
+        db.close()
+    hgnc = None
+    if os.path.isfile(os.path.join(resource_dir, HGNC_FILE)):
+        sources.append(HGNC_FILE)
+        hgnc = _read_hgnc(os.path.join(resource_dir, HGNC_FILE))
+
+    #intern the strings of all the str columns
+    types = dict()
+    strings = set()
+    for rel, res in pairs.items():
+        key_type = _column_type([r[0] for r in res])
+        value_type = _column_type([r[1] for r in res])
+        if key_type is None or value_type is None:
+            logger.warning('{} has values of mixed types, it is not in the pack.'.format(
+                           _relation_name(*rel)))
+            continue
+        types[rel] = (key_type, value_type)
+        for i, t in enumerate((key_type, value_type)):
+            if t == 'str':
+                strings.update(r[i] for r in res)
+    for name, values in sets.items():
+        strings.update(values)
+    if hgnc:
+        strings.update(hgnc.keys())
+        strings.update(hgnc.values())
+    #code point order is the byte order of utf-8, as used by sqlite
+    strings = sorted(strings)
+    ids = {s: i for i, s in enumerate(strings)}
+
+    tmp_dir = pack_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    def save(name, array):
+        np.save(os.path.join(tmp_dir, name + '.npy'), array)
+
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(tmp_dir, 'strings.bin'), 'wb') as fw:
+        fw.write(b''.join(encoded))
+    save('strings.offsets', offsets)
+
+    def encode(values, t):
+        if t == 'str':
+            return np.array([ids[v] for v in values], dtype=np.int32)
+        return np.array(values, dtype=np.int64)
+
+    manifest = {'version': PACK_VERSION, 'relations': [], 'sets': [], 'hgnc': False}
+    for (table, key, value), (key_type, value_type) in types.items():
+        res = pairs[(table, key, value)]
+        key_codes = encode([r[0] for r in res], key_type)
+        value_codes = encode([r[1] for r in res], value_type)
+        for k, v, kt, vt, kc, vc in [(key, value, key_type, value_type, key_codes, value_codes),
+                                     (value, key, value_type, key_type, value_codes, key_codes)]:
+            name = _relation_name(table, k, v)
+            keys, indptr, values = _csr(kc, vc)
+            save(name + '.keys', keys)
+            save(name + '.indptr', indptr)
+            save(name + '.values', values)
+            manifest['relations'].append({'table': table, 'key': k, 'value': v,
+                                          'key_type': kt, 'value_type': vt})
+    for name, values in sets.items():
+        save(name, np.sort(encode(values, 'str')))
+        manifest['sets'].append(name)
+    if hgnc:
+        keys = encode(list(hgnc.keys()), 'str')
+        values = encode(list(hgnc.values()), 'str')
+        order = np.argsort(keys)
+        save('hgnc.keys', keys[order])
+        save('hgnc.values', values[order])
+        manifest['hgnc'] = True
+    manifest['sources'] = _source_stats(sources, resource_dir)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as fw:
+        json.dump(manifest, fw, indent=1)
+
+    old_dir = pack_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(pack_dir):
+        os.rename(pack_dir, old_dir)
+    os.rename(tmp_dir, pack_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info('Built knowledge pack of {} relations and {} strings in {:.2f} seconds.'.format(
+                len(manifest['relations']), len(strings), time.perf_counter() - t0))
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the TFTA databases into a knowledge pack.')
+    parser.add_argument('--out', default=_pack_dir, help='folder of the pack')
+    args = parser.parse_args()
+    build_pack(args.out)
+
+if __name__ == '__main__':
+    main()
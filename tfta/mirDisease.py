@@ -6,6 +6,11 @@ import logging
 import sqlite3
 import pickle
 from collections import defaultdict
+from .db_index import indexed_db_file, create_search_tables
+from . import storage
+from .startup import StartupLoader
+from utils.genes import GeneSet
+from utils import cache_store
 
 
 logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s',
@@ -16,10 +21,15 @@ _resource_dir = os.path.dirname(os.path.realpath(__file__)) + '/../resources/'
 
 class mirDisease:
     def __init__(self):
-        #load db file
-        self.mirdb = _load_db()
-        self.mirna_precursor = _load_mirna_precursor_mapping()
-        self.mirna = set(self.mirna_precursor.keys())
+        #load db file and the precursor mapping concurrently
+        loader = StartupLoader('mirDisease')
+        loader.add('mirdb', _load_released_db)
+        loader.add('mirna_precursor', _load_mirna_precursor_mapping)
+        res = loader.run()
+        self.mirdb = res['mirdb']
+        self.mirna_precursor = res['mirna_precursor']
+        #interned, the miRNA population of the hmdd enrichment
+        self.mirna = GeneSet(self.mirna_precursor.keys())
         
     def __del__(self):
         self.mirdb.close()
@@ -39,8 +49,9 @@ class mirDisease:
             dstr = '%' + disease + '%'
             for prec in mapped_mirna[mirna_name]:
                 t = (prec, dstr)
-                res = self.mirdb.execute("SELECT mirna FROM mir2disease WHERE mirna LIKE ? "
-                                    "AND disease LIKE ?", t).fetchone()
+                res = self.mirdb.execute("SELECT mirna FROM mir2disease WHERE rowid IN "
+                                         "(SELECT rid FROM mir2diseaseKey WHERE key = UPPER(?)) "
+                                         "AND disease LIKE ?", t).fetchone()
                 if res:
                     return True
         return False
@@ -63,7 +74,8 @@ class mirDisease:
                 associated = False
                 for prec in mapped_mirnas[mir]: 
                     t = (prec,)
-                    res = self.mirdb.execute("SELECT disease FROM mir2disease WHERE mirna LIKE ?", t).fetchall()
+                    res = self.mirdb.execute("SELECT disease FROM mir2disease WHERE rowid IN "
+                                             "(SELECT rid FROM mir2diseaseKey WHERE key = UPPER(?))", t).fetchall()
                     if res:
                         #id = set([r[0] for r in res])
                         disease[mir] = disease[mir].union(set([r[0] for r in res]))
@@ -159,25 +171,30 @@ def _load_db():
         statinfo = None
         
     if statinfo and statinfo.st_size > 0:
-        mirDisease = sqlite3.connect(db_file, check_same_thread=False)
+        #the upper-cased miRNA key table is built once for the pool
+        mirDisease = storage.ConnectionPool(indexed_db_file(db_file), setup=create_search_tables)
         logger.info('TFTA loaded mirnaDisease database.')
     else:
         logger.info('Generating the mirnaDisease db file...')
         num = _generate_mirDisease_db(db_file)
         if os.path.isfile(db_file):
-            mirDisease = sqlite3.connect(db_file, check_same_thread=False)
+            mirDisease = storage.ConnectionPool(db_file, setup=create_search_tables)
         else:
             logger.error('TFTA could not load mirnaDisease database.')
             mirDisease = None;
     return mirDisease
     
+def _load_released_db():
+    #the connection of the loader thread goes back to the pool
+    mirdb = _load_db()
+    if mirdb is not None:
+        mirdb.release()
+    return mirdb
+    
 def _load_mirna_precursor_mapping():
     fn = os.path.join(_resource_dir, "mirna_precursor_dict.pickle")
-    if os.path.isfile(fn):
-        with open(fn, "rb") as pickle_in:
-            mirna_precursor = pickle.load(pickle_in)
-    else:
-        mirna_precursor = _map_mirna_precursor(fn)
+    mirna_precursor = cache_store.load(fn, _map_mirna_precursor,
+                                       [os.path.join(_resource_dir, 'hsa_precursor_mature_mirna.txt')])
     logger.info('TFTA loaded mirna_precursor mapping file.')
     return mirna_precursor
 
@@ -237,15 +254,14 @@ def _parse_line(line, ind, reformat=True):
 
     return tuple(t)
 
-def _map_mirna_precursor(fn_pickle, data_folder=_resource_dir):
+def _map_mirna_precursor(data_folder=_resource_dir):
     """
-    Generate the matured mirna to precursor mapping file since the disease db contains the precursors
+    Generate the matured mirna to precursor mapping since the disease db contains the precursors
     instead of matured mirnas.
     Use miRNA.dat at http://www.mirbase.org/ftp.shtml. (2019-09-04)
     
     parameter
     -----------
-    fn_pickle: str
     data_folder: str
     """
     mirna_precursor = defaultdict(list)
@@ -257,9 +273,6 @@ def _map_mirna_precursor(fn_pickle, data_folder=_resource_dir):
     for line in lines:
         s = line.strip().split('\t')
         mirna_precursor[s[0].upper()] = s[1].upper().split(',')
-        
-    with open(fn_pickle, 'wb') as pickle_out:
-        pickle.dump(mirna_precursor, pickle_out)
     
     return mirna_precursor
     
@@ -0,0 +1,43 @@
+"""
+Sorted index of the miRNA names for case insensitive exact and prefix
+lookups, used for the miRNA clarification suggestions.
+"""
+
+import re
+from bisect import bisect_left
+
+#mature miRNA forms, such as hsa-miR-20b-5p
+_MATURE = re.compile(r'-[35]p$', re.IGNORECASE)
+#greater than any character following a prefix
+_MAX_CHAR = '\U0010ffff'
+
+
+class MirnaIndex:
+    def __init__(self, mirnas):
+        """
+        parameter
+        -----------
+        mirnas: iterable of miRNA names
+        """
+        pairs = sorted(set((m.upper(), m) for m in mirnas))
+        self.keys = [p[0] for p in pairs]
+        self.names = [p[1] for p in pairs]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        key = name.upper()
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def find_prefix(self, prefix):
+        """
+        Return the miRNAs beginning with prefix (case insensitive), the mature
+        -3p/-5p forms first, each group in alphabetical order.
+        """
+        key = prefix.upper()
+        lo = bisect_left(self.keys, key)
+        hi = bisect_left(self.keys, key + _MAX_CHAR, lo)
+        names = self.names[lo:hi]
+        return [m for m in names if _MATURE.search(m)] + [m for m in names if not _MATURE.search(m)]
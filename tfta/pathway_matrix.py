@@ -0,0 +1,167 @@
+"""
+Sparse pathway x gene incidence matrix built from the pathwayInfo and
+pathway2Genes tables.
+
+The overlap between any gene list and every pathway is one sparse
+matrix-vector product, and the best pathways are selected with an exact
+top-k on the overlap counts.
+"""
+
+import time
+import logging
+import numpy as np
+from scipy import sparse
+from utils.bitset import SymbolTable
+
+logger = logging.getLogger('TFTA-PathwayMatrix')
+
+#max number of keyword masks kept
+KEYWORD_CACHE_SIZE = 256
+
+
+class PathwayMatrix:
+    def __init__(self, pathways, members):
+        """
+        parameters
+        ------------
+        pathways: list of (Id, pathwayName, dblink, source) tuples
+        members: iterable of (pathwayID, genesymbol) tuples
+        """
+        self.ids = [p[0] for p in pathways]
+        self.names = [p[1] for p in pathways]
+        self.dblinks = [p[2] for p in pathways]
+        row = {pid: i for i, pid in enumerate(self.ids)}
+        self.genes = SymbolTable()
+        rows = []
+        cols = []
+        for pid, gene in members:
+            if pid in row:
+                rows.append(row[pid])
+                cols.append(self.genes.add(gene))
+        data = np.ones(len(rows), dtype=np.int32)
+        shape = (len(self.ids), len(self.genes))
+        self.matrix = sparse.csr_matrix((data, (rows, cols)), shape=shape)
+        #duplicated (pathway, gene) pairs are summed by scipy, reset them to 1
+        self.matrix.data[:] = 1
+
+        #pathwayInfo.source LIKE db_name is a case insensitive equality
+        sources = np.array([(p[3] or '').lower() for p in pathways], dtype=object)
+        self.source_masks = {s: sources == s for s in set(sources)}
+        self.names_lower = np.array([(n or '').lower() for n in self.names], dtype=str)
+        self.keyword_masks = dict()
+
+    @classmethod
+    def from_db(cls, tfdb):
+        t0 = time.perf_counter()
+        pathways = tfdb.execute("SELECT Id, pathwayName, dblink, source FROM pathwayInfo "
+                                "ORDER BY Id").fetchall()
+        members = tfdb.execute("SELECT DISTINCT pathwayID, genesymbol FROM pathway2Genes")
+        pm = cls([tuple(p) for p in pathways], members)
+        logger.info('Built pathway-gene matrix of {} pathways and {} genes in {:.2f} seconds.'.format(
+                    pm.matrix.shape[0], pm.matrix.shape[1], time.perf_counter() - t0))
+        return pm
+
+    def source_mask(self, db_name):
+        mask = self.source_masks.get(db_name.lower())
+        if mask is None:
+            mask = np.zeros(len(self.ids), dtype=bool)
+        return mask
+
+    def keyword_mask(self, keyword):
+        """
+        Rows whose pathway name contains keyword, as pathwayName LIKE '%keyword%'
+        """
+        keyword = keyword.lower()
+        mask = self.keyword_masks.get(keyword)
+        if mask is None:
+            mask = np.char.find(self.names_lower, keyword) >= 0
+            if len(self.keyword_masks) >= KEYWORD_CACHE_SIZE:
+                self.keyword_masks.clear()
+            self.keyword_masks[keyword] = mask
+        return mask
+
+    def _gene_vector(self, gene_names):
+        x = np.zeros(len(self.genes), dtype=np.int32)
+        ids = [self.genes.ids[g] for g in set(gene_names) if g in self.genes.ids]
+        x[ids] = 1
+        return x, ids
+
+    def overlap_counts(self, gene_names, fmembers=None):
+        """
+        Return the number of the given genes and families contained in each pathway,
+        a family is counted once if any of its members is contained.
+
+        parameters
+        ------------
+        gene_names: list of gene symbols
+        fmembers: dict, family name as key and list of Agent for members as value
+        """
+        counts = np.zeros(len(self.ids), dtype=np.int32)
+        if gene_names:
+            x, _ = self._gene_vector(gene_names)
+            counts += self.matrix.dot(x)
+        fhits = dict()
+        if fmembers:
+            for f in fmembers:
+                x, ids = self._gene_vector([m.name for m in fmembers[f]])
+                if ids:
+                    fhits[f] = self.matrix.dot(x) > 0
+                    counts += fhits[f]
+        return counts, fhits
+
+    def top_k(self, counts, k, mask=None, min_count=2):
+        """
+        Return the row indices of the k pathways with the largest counts of at least
+        min_count, sorted by count in descending order and then by pathway order.
+        """
+        keep = counts >= min_count
+        if mask is not None:
+            keep &= mask
+        rows = np.flatnonzero(keep)
+        #count first, then row order, as one integer key
+        key = rows - counts[rows].astype(np.int64) * len(self.ids)
+        if len(rows) > k:
+            part = np.argpartition(key, k - 1)[:k]
+            rows = rows[part]
+            key = key[part]
+        return rows[np.argsort(key)]
+
+    def find_common(self, gene_names, fmembers=None, limit=30, keyword=None, db_name=None, min_count=2):
+        """
+        For a given gene list, find the pathways containing at least min_count of the
+        genes (families), and the corresponding genes contained in each of the pathways.
+
+        return
+        ------------
+        pathwayName: dict, pathway Id as key
+        dblink: dict, pathway Id as key
+        genes: dict, pathway Id as key and list of genes and families as value,
+        ordered by the number of genes in descending order
+        """
+        pathwayName = dict()
+        dblink = dict()
+        genes = dict()
+        counts, fhits = self.overlap_counts(gene_names, fmembers)
+        mask = None
+        if keyword:
+            mask = self.keyword_mask(keyword)
+        if db_name:
+            smask = self.source_mask(db_name)
+            mask = smask if mask is None else mask & smask
+        rows = self.top_k(counts, limit, mask, min_count)
+        if not len(rows):
+            return pathwayName, dblink, genes
+
+        _, qids = self._gene_vector(gene_names or [])
+        qids = np.array(qids, dtype=np.int64)
+        indptr = self.matrix.indptr
+        indices = self.matrix.indices
+        for r in rows:
+            cols = indices[indptr[r]:indptr[r+1]]
+            glist = self.genes.to_symbols(cols[np.isin(cols, qids)])
+            glist.extend([f for f in fhits if fhits[f][r]])
+            pid = self.ids[r]
+            pathwayName[pid] = self.names[r]
+            dblink[pid] = self.dblinks[r]
+            genes[pid] = glist
+        return pathwayName, dblink, genes
@@ -0,0 +1,107 @@
+"""
+In-memory index of the TF-target regulations in the CombinedDB table.
+
+TFs and targets are interned to integer ids and each TF (target) keeps a
+bitset over the ids of its targets (TFs), so multi-gene queries become
+bit operations instead of one SQL query per gene.
+"""
+
+import time
+import logging
+from collections import defaultdict
+from utils.bitset import SymbolTable, ids_to_bits, bits_to_ids
+from utils.bitset import and_all, or_all
+
+logger = logging.getLogger('TFTA-RegIndex')
+
+
+class RegulationIndex:
+    def __init__(self, pairs):
+        """
+        parameter
+        -----------
+        pairs: iterable of (tf, target) tuples
+        """
+        self.tfs = SymbolTable()
+        self.targets = SymbolTable()
+        tf_targets = defaultdict(list)
+        target_tfs = defaultdict(list)
+        for tf, target in pairs:
+            i = self.tfs.add(tf)
+            j = self.targets.add(target)
+            tf_targets[i].append(j)
+            target_tfs[j].append(i)
+        #bitset over target ids for each TF id, and over TF ids for each target id
+        self.tf_targets = [ids_to_bits(tf_targets[i]) for i in range(len(self.tfs))]
+        self.target_tfs = [ids_to_bits(target_tfs[j]) for j in range(len(self.targets))]
+
+    @classmethod
+    def from_db(cls, tfdb):
+        t0 = time.perf_counter()
+        res = tfdb.execute("SELECT DISTINCT TF, Target FROM CombinedDB")
+        index = cls(res)
+        logger.info('Built TF-target index with {} TFs and {} targets in {:.2f} seconds.'.format(
+                    len(index.tfs), len(index.targets), time.perf_counter() - t0))
+        return index
+
+    def targets_of(self, tf):
+        """
+        Bitset of the targets regulated by tf, 0 if tf is unknown.
+        """
+        i = self.tfs.get(tf)
+        return self.tf_targets[i] if i is not None else 0
+
+    def tfs_of(self, target):
+        """
+        Bitset of the TFs regulating target, 0 if target is unknown.
+        """
+        j = self.targets.get(target)
+        return self.target_tfs[j] if j is not None else 0
+
+    def common_targets(self, tf_names):
+        """
+        Bitset of the targets regulated by all the given TFs.
+        Return None if any TF has no target at all.
+        """
+        bitsets = [self.targets_of(tf) for tf in tf_names]
+        if not all(bitsets):
+            return None
+        return and_all(bitsets)
+
+    def common_tfs(self, target_names):
+        """
+        Bitset of the TFs regulating all the given targets.
+        Return None if any target has no TF at all.
+        """
+        bitsets = [self.tfs_of(target) for target in target_names]
+        if not all(bitsets):
+            return None
+        return and_all(bitsets)
+
+    def any_targets(self, tf_names):
+        """
+        Bitset of the targets regulated by at least one of the given TFs.
+        """
+        return or_all(self.targets_of(tf) for tf in tf_names)
+
+    def tf_target_hits(self, target_names):
+        """
+        For each TF regulating some of the given targets, return the regulated
+        targets among them.
+
+        return
+        ----------
+        dict, TF symbol as key and list of target symbols as value
+        """
+        query = self.targets.to_bits(target_names)
+        candidates = or_all(self.tfs_of(target) for target in target_names)
+        hits = dict()
+        for i in bits_to_ids(candidates):
+            hits[self.tfs.symbols[i]] = self.targets.from_bits(self.tf_targets[i] & query)
+        return hits
+
+    def tf_names(self, bits):
+        return self.tfs.from_bits(bits)
+
+    def target_names(self, bits):
+        return self.targets.from_bits(bits)
@@ -0,0 +1,109 @@
+"""
+Concurrent loading of the artifacts needed at startup.
+
+The artifacts (databases, pickles, indexes) are declared with the artifacts
+they depend on, and the independent ones are loaded at the same time on a
+thread pool. sqlite queries, decompression and unpickling release the GIL
+for long enough for the loads to overlap. The time of each artifact and the
+critical path, the chain of dependent loads which bounds the startup time,
+are written to the log.
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('TFTA-Startup')
+
+#number of threads loading the artifacts
+MAX_WORKERS = 4
+
+
+class StartupLoader:
+    def __init__(self, name='startup', max_workers=MAX_WORKERS):
+        self.name = name
+        self.max_workers = max_workers
+        self.artifacts = OrderedDict()
+        #artifact name: (start, end) in seconds from the start of run
+        self.timings = dict()
+
+    def add(self, name, load, depends=()):
+        """
+        Declare an artifact.
+
+        parameter
+        -----------
+        name: str
+        load: function returning the artifact, called with the artifacts of depends
+        depends: list of the names of artifacts already declared
+        """
+        for d in depends:
+            if d not in self.artifacts:
+                raise ValueError('{} depends on the undeclared artifact {}.'.format(name, d))
+        self.artifacts[name] = (load, list(depends))
+
+    def run(self):
+        """
+        Load all the artifacts, return a dict of artifact name: value.
+        The first exception raised by a load is raised once all loads ended.
+        """
+        t0 = time.perf_counter()
+        futures = OrderedDict()
+
+        def load_artifact(name, load, depends):
+            #the artifacts are submitted in declaration order, so the
+            #dependencies have a thread when a dependent waits for them
+            values = [futures[d].result() for d in depends]
+            start = time.perf_counter() - t0
+            try:
+                return load(*values)
+            finally:
+                self.timings[name] = (start, time.perf_counter() - t0)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='TFTA-' + self.name) as executor:
+            for name, (load, depends) in self.artifacts.items():
+                futures[name] = executor.submit(load_artifact, name, load, depends)
+        res = OrderedDict()
+        error = None
+        for name, f in futures.items():
+            try:
+                res[name] = f.result()
+            except Exception as e:
+                logger.error('{}: could not load {}: {}'.format(self.name, name, e))
+                error = error or e
+        self.log_report(time.perf_counter() - t0)
+        if error is not None:
+            raise error
+        return res
+
+    def critical_path(self):
+        """
+        Return the names of the chain of artifacts ending with the last one
+        loaded, each preceded by the dependency it waited for the longest.
+        """
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            depends = [d for d in self.artifacts[name][1] if d in self.timings]
+            if not depends:
+                break
+            name = max(depends, key=lambda n: self.timings[n][1])
+            path.append(name)
+        return path[::-1]
+
+    def log_report(self, total):
+        path = self.critical_path()
+        logger.info('{} loaded {} artifacts in {:.2f} seconds, critical path: {}'.format(
+                    self.name, len(self.timings), total,
+                    ' -> '.join('{} ({:.2f}s)'.format(n, self.timings[n][1] - self.timings[n][0])
+                                for n in path)))
+        for name in self.artifacts:
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            logger.info('{}: {} took {:.2f} seconds (from {:.2f} to {:.2f}).'.format(
+                        self.name, name, end - start, start, end))
@@ -0,0 +1,266 @@
+"""
+Storage modes of the sqlite databases, which are never written at runtime.
+
+default: plain connection to the file
+immutable: read-only connection with immutable=1, memory-mapped I/O and a
+larger page cache
+memory: the database is copied into an in-memory database at startup
+
+The mode is set with the TFTA_DB_STORAGE config option.
+
+ConnectionPool gives each thread its own read-only connection, so that the
+agent can answer queries from several threads at once. The search tables
+missing from the database file are built once, in an in-memory database
+shared by the connections of the pool.
+"""
+
+import os
+import time
+import logging
+import sqlite3
+import itertools
+import threading
+from urllib.request import pathname2url
+from indra import get_config
+from .startup import MAX_WORKERS
+
+logger = logging.getLogger('TFTA-Storage')
+
+STORAGE_MODES = ['default', 'immutable', 'memory']
+
+#bytes of the database mapped in memory
+MMAP_SIZE = 1 << 30
+#negative value is in KiB
+CACHE_SIZE = -64 * 1024
+#maximum number of connections of a pool, enough for the startup loader threads,
+#the warm-up thread, the thread answering the requests and a few more
+POOL_SIZE = MAX_WORKERS + 4
+#seconds between the checks for connections of finished threads when a pool is full
+POOL_WAIT = 0.05
+#seconds a thread waits for a connection of a full pool
+POOL_TIMEOUT = 60
+
+_pool_ids = itertools.count()
+
+
+class PoolTimeoutException(Exception):
+    pass
+
+
+def get_storage_mode():
+    mode = get_config('TFTA_DB_STORAGE')
+    if not mode:
+        return 'default'
+    mode = mode.strip().lower()
+    if mode not in STORAGE_MODES:
+        logger.warning('Unknown TFTA_DB_STORAGE {}, using default.'.format(mode))
+        return 'default'
+    return mode
+
+def _file_uri(db_file, params):
+    return 'file:{}?{}'.format(pathname2url(os.path.abspath(db_file)), params)
+
+def connect(db_file, mode=None):
+    """
+    Open db_file with the storage mode.
+
+    parameter
+    -----------
+    db_file: str
+    mode: str or None, one of STORAGE_MODES. If None, use the TFTA_DB_STORAGE
+    config option.
+    """
+    if mode is None:
+        mode = get_storage_mode()
+    t0 = time.perf_counter()
+    if mode == 'immutable':
+        db = sqlite3.connect(_file_uri(db_file, 'mode=ro&immutable=1'), uri=True,
+                             check_same_thread=False)
+        db.execute('PRAGMA mmap_size = {}'.format(MMAP_SIZE))
+        db.execute('PRAGMA cache_size = {}'.format(CACHE_SIZE))
+    elif mode == 'memory':
+        src = sqlite3.connect(_file_uri(db_file, 'mode=ro'), uri=True)
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        src.backup(db)
+        src.close()
+    else:
+        db = sqlite3.connect(db_file, check_same_thread=False)
+    logger.debug('Opened {} in {} mode in {:.3f} seconds.'.format(
+                 os.path.basename(db_file), mode, time.perf_counter() - t0))
+    return db
+
+class ConnectionPool:
+    """
+    Read-only connections to a database, one per thread. A thread keeps its
+    connection until it finishes or calls release(); the connections of finished
+    threads are handed to new threads. When size connections are in use, a new
+    thread waits for one of them, at most timeout seconds.
+
+    It has the execute method and the row_factory attribute of a sqlite3
+    connection.
+    """
+    def __init__(self, db_file, mode=None, size=POOL_SIZE, setup=None, timeout=POOL_TIMEOUT):
+        """
+        parameter
+        -----------
+        db_file: str
+        mode: str or None, one of STORAGE_MODES. If None, use the TFTA_DB_STORAGE
+        config option.
+        size: int, maximum number of connections
+        timeout: float, seconds a thread waits for a connection when size
+        connections are in use, PoolTimeoutException is raised after it
+        setup: function called once with a connection and the schema ('main' for the
+        memory mode, otherwise 'search', an in-memory database attached to each
+        connection) to create the search tables
+        """
+        if mode is None:
+            mode = get_storage_mode()
+        self.db_file = db_file
+        self.mode = mode
+        self.size = size
+        self.timeout = timeout
+        self.setup = setup
+        #knowledge pack answering the batch_query lookups, see knowledge_pack.py
+        self.pack = None
+        self._row_factory = None
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        #thread of each connection in use
+        self._owners = {}
+        self._free = []
+        self._count = 0
+        self._master = None
+        #shared in-memory database of the search tables, attached as search
+        self._search_uri = None
+        if mode == 'memory':
+            #the connections share one copy of the database in the memdb vfs,
+            #which lives as long as the master connection
+            self._uri = 'file:/tfta-{}-{}?vfs=memdb'.format(os.getpid(), next(_pool_ids))
+            t0 = time.perf_counter()
+            self._master = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            src = sqlite3.connect(_file_uri(db_file, 'mode=ro'), uri=True)
+            src.backup(self._master)
+            src.close()
+            if setup:
+                setup(self._master, 'main')
+            logger.debug('Copied {} in memory in {:.3f} seconds.'.format(
+                         os.path.basename(db_file), time.perf_counter() - t0))
+        elif setup:
+            self._build_search_tables()
+        #open the connection of this thread, so that a bad file fails here
+        self.connection()
+
+    def _open(self):
+        if self.mode == 'memory':
+            db = sqlite3.connect(self._uri + '&mode=ro', uri=True, check_same_thread=False)
+        elif self.mode == 'immutable':
+            db = connect(self.db_file, 'immutable')
+        else:
+            db = sqlite3.connect(_file_uri(self.db_file, 'mode=ro'), uri=True,
+                                 check_same_thread=False)
+        if self._search_uri:
+            db.execute('ATTACH DATABASE ? AS search', (self._search_uri + '&mode=ro',))
+        db.row_factory = self._row_factory
+        return db
+
+    def _build_search_tables(self):
+        """
+        Build the search tables in a shared in-memory database, which lives
+        as long as the master connection. It's not attached to the
+        connections if the database file already has all the tables, like
+        the copies made by db_index.
+        """
+        t0 = time.perf_counter()
+        uri = 'file:/tfta-search-{}-{}?vfs=memdb'.format(os.getpid(), next(_pool_ids))
+        self._master = sqlite3.connect(_file_uri(self.db_file, 'mode=ro'), uri=True,
+                                       check_same_thread=False)
+        self._master.execute('ATTACH DATABASE ? AS search', (uri,))
+        self.setup(self._master, 'search')
+        if self._master.execute('SELECT count(*) FROM search.sqlite_master').fetchone()[0]:
+            self._search_uri = uri
+            logger.debug('Built the search tables of {} in {:.3f} seconds.'.format(
+                         os.path.basename(self.db_file), time.perf_counter() - t0))
+        else:
+            self._master.close()
+            self._master = None
+
+    def _reclaim(self):
+        for db, thread in list(self._owners.items()):
+            if not thread.is_alive():
+                del self._owners[db]
+                self._free.append(db)
+
+    def connection(self):
+        """
+        Return the connection of the current thread.
+        """
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            return db
+        with self._cond:
+            #the connections of finished threads are reused before opening new ones
+            self._reclaim()
+            deadline = time.monotonic() + self.timeout
+            while not self._free and self._count >= self.size:
+                if time.monotonic() >= deadline:
+                    raise PoolTimeoutException('No free connection to {} after {} seconds, '
+                        'the {} connections are held by running threads.'.format(
+                        os.path.basename(self.db_file), self.timeout, self.size))
+                self._cond.wait(POOL_WAIT)
+                self._reclaim()
+            if self._free:
+                db = self._free.pop()
+            else:
+                self._count += 1
+        if db is None:
+            try:
+                db = self._open()
+            except Exception:
+                with self._cond:
+                    self._count -= 1
+                    self._cond.notify()
+                raise
+        with self._cond:
+            self._owners[db] = threading.current_thread()
+        self._local.db = db
+        return db
+
+    def release(self):
+        """
+        Give the connection of the current thread back to the pool.
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            return
+        self._local.db = None
+        with self._cond:
+            del self._owners[db]
+            self._free.append(db)
+            self._cond.notify()
+
+    def execute(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters)
+
+    @property
+    def row_factory(self):
+        return self._row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        with self._cond:
+            self._row_factory = factory
+            for db in list(self._owners) + self._free:
+                db.row_factory = factory
+
+    def close(self):
+        with self._cond:
+            for db in list(self._owners) + self._free:
+                db.close()
+            self._owners = {}
+            self._free = []
+            self._count = 0
+            if self._master is not None:
+                self._master.close()
+                self._master = None
+            self._search_uri = None
+        self._local = threading.local()
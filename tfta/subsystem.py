@@ -0,0 +1,92 @@
+"""
+Subsystems of the agent which are loaded lazily or by a warm-up thread.
+
+A subsystem is loaded once, either by the warm-up thread or by the first
+task that needs it. A task finding its subsystem still loading waits for it
+with a timeout, so that the agent can answer the other tasks in the meantime.
+"""
+
+import time
+import logging
+import threading
+from .startup import StartupLoader
+
+logger = logging.getLogger('TFTA-Subsystem')
+
+
+class SubsystemUnavailableException(Exception):
+    pass
+
+class SubsystemDisabledException(SubsystemUnavailableException):
+    pass
+
+
+class Subsystem:
+    """
+    parameter
+    -----------
+    name: str
+    load: function returning the subsystem, called with the subsystems of depends
+    depends: list of Subsystem
+    """
+    def __init__(self, name, load, depends=()):
+        self.name = name
+        self._load = load
+        self.depends = list(depends)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+        self._error = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self, timeout=None):
+        """
+        Return the subsystem, loading it in the calling thread if no other
+        thread is loading it.
+
+        parameter
+        -----------
+        timeout: seconds to wait for a load in progress, None to wait until it ends
+        """
+        if not self._loaded:
+            deps = [d.get(timeout) for d in self.depends]
+            if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+                raise SubsystemUnavailableException('{} is still loading.'.format(self.name))
+            try:
+                if not self._loaded:
+                    t0 = time.perf_counter()
+                    try:
+                        self._value = self._load(*deps)
+                        logger.info('Loaded {} in {:.2f} seconds.'.format(self.name, time.perf_counter() - t0))
+                    except Exception as e:
+                        logger.error('Could not load {}: {}'.format(self.name, e))
+                        self._error = e
+                    self._loaded = True
+            finally:
+                self._lock.release()
+        if self._error is not None:
+            raise SubsystemUnavailableException('{} could not be loaded.'.format(self.name))
+        return self._value
+
+
+def _warm_up_get(subsystem):
+    try:
+        return subsystem.get()
+    except SubsystemUnavailableException:
+        return None
+
+def warm_up(subsystems):
+    """
+    Load the subsystems in a background thread, the independent ones
+    concurrently.
+    """
+    loader = StartupLoader('warm-up')
+    for s in subsystems:
+        loader.add(s.name, lambda *deps, s=s: _warm_up_get(s),
+                   [d.name for d in s.depends if d in subsystems])
+    thread = threading.Thread(target=loader.run, name='TFTA-warmup', daemon=True)
+    thread.start()
+    return thread
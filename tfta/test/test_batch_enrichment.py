@@ -0,0 +1,54 @@
+from kqml import KQMLList
+from indra.statements import Agent
+from tfta.tfta_module import TFTA_Module
+from tfta.subsystem import Subsystem
+from enrichment.result_cache import ResultCache
+
+
+class FakePathwayEnrich:
+    pathway_db = ['kegg']
+    disease_db = ['ctd', 'hmdd']
+
+    def __init__(self):
+        self.batches = []
+
+    def data_version(self, db_name):
+        return 1
+
+    def get_ora_batch(self, studies, db_name):
+        self.batches.append(studies)
+        return [{'P' + s[0]: {'dblink': 'x', 'p-bonferroni': 0.001, 'gene': set(s)}}
+                for s in studies]
+
+def _make_module(pw, agents):
+    module = TFTA_Module.__new__(TFTA_Module)
+    module.subsystems = {'pw': Subsystem('PathwayEnrich', lambda: pw)}
+    module.load_timeout = 1
+    module.result_cache = ResultCache()
+    module.get_agent = lambda arg: agents[str(arg)]
+    module.make_cljson = lambda gene_agent: KQMLList([a.name for a in gene_agent])
+    return module
+
+def test_batch_enrichment():
+    pw = FakePathwayEnrich()
+    agents = {'S1': [Agent('A', db_refs={'HGNC': '1'}), Agent('B', db_refs={'HGNC': '2'})],
+              'S2': Agent('C', db_refs={'HGNC': '3'}),
+              'S3': Agent('X', db_refs={'CHEBI': '4'})}
+    module = _make_module(pw, agents)
+    content = KQMLList.from_string('(BATCH-ENRICHMENT :gene-sets (S1 S3) :database "kegg")')
+    reply = module.respond_batch_enrichment(content)
+    assert(reply.head() == 'SUCCESS')
+    assert(pw.batches == [[['A', 'B']]])
+    results = reply.get('results').to_string()
+    assert(':study "0"' in results and 'PA' in results and ':study "1" :results NIL' in results)
+    #the cached study is not analysed again
+    content = KQMLList.from_string('(BATCH-ENRICHMENT :gene-sets (S2 S1) :database "kegg")')
+    reply = module.respond_batch_enrichment(content)
+    assert(pw.batches[1:] == [[['C']]])
+    results = reply.get('results').to_string()
+    assert(results.index('PC') < results.index('PA'))
+    assert(module.result_cache.hits == 1)
+    #no list resolves
+    content = KQMLList.from_string('(BATCH-ENRICHMENT :gene-sets (S3) :database "kegg")')
+    reply = module.respond_batch_enrichment(content)
+    assert(reply.head() == 'FAILURE' and len(pw.batches) == 2)
@@ -0,0 +1,37 @@
+import sqlite3
+from tfta import batch_query
+
+
+def _make_db():
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE kinaseReg (kinase text, target text, direction text)")
+    db.executemany("INSERT INTO kinaseReg VALUES (?,?,?)",
+                   [('MAPK1', 'ELK1', 'increase'), ('MAPK1', 'FOS', 'increase'),
+                    ('MAPK3', 'ELK1', 'decrease'), ('MAPK3', 'FOS', 'increase'),
+                    ('MAPK3', 'JUN', 'increase'), ('AKT1', 'JUN', 'decrease')])
+    return db
+
+def test_find_common():
+    db = _make_db()
+    assert(batch_query.find_common(db, 'kinaseReg', 'kinase', 'target', ['MAPK1', 'MAPK3']) == {'ELK1', 'FOS'})
+    assert(batch_query.find_common(db, 'kinaseReg', 'kinase', 'target', ['MAPK1', 'AKT1']) == set())
+    #a kinase without any target
+    assert(batch_query.find_common(db, 'kinaseReg', 'kinase', 'target', ['MAPK1', 'BRAF']) is None)
+    assert(batch_query.find_common(db, 'kinaseReg', 'kinase', 'target', ['MAPK1', 'MAPK3'],
+                                   ' AND direction LIKE ?', ('increase',)) == {'FOS'})
+
+def test_find_any():
+    db = _make_db()
+    assert(batch_query.find_any(db, 'kinaseReg', 'target', 'kinase', ['ELK1', 'JUN']) == {'MAPK1', 'MAPK3', 'AKT1'})
+
+def test_group_values():
+    db = _make_db()
+    res = batch_query.group_values(db, 'kinaseReg', 'target', 'kinase', ['ELK1', 'FOS', 'JUN'])
+    assert(res[0][0] == 'MAPK3')
+    assert(sorted(res[0][1]) == ['ELK1', 'FOS', 'JUN'])
+    assert(len(batch_query.group_values(db, 'kinaseReg', 'target', 'kinase', ['ELK1', 'JUN'], min_count=2)) == 1)
+
+def test_find_values():
+    db = _make_db()
+    assert(batch_query.find_values(db, 'kinaseReg', 'kinase', 'target', 'MAPK3') == ['ELK1', 'FOS', 'JUN'])
+    assert(batch_query.find_values(db, 'kinaseReg', 'kinase', 'target', 'BRAF') == [])
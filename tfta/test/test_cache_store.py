@@ -0,0 +1,45 @@
+import os
+import pickle
+from utils import cache_store
+
+
+def _builder(calls, value):
+    def build():
+        calls.append(1)
+        return value
+    return build
+
+def test_cache_rebuild(tmp_path):
+    source = os.path.join(str(tmp_path), 'source.txt')
+    fn = os.path.join(str(tmp_path), 'cache', 'artifact.pickle')
+    with open(source, 'w') as fw:
+        fw.write('a')
+    calls = []
+    assert(cache_store.load(fn, _builder(calls, {'a': 1}), [source]) == {'a': 1})
+    assert(cache_store.load(fn, _builder(calls, {'a': 2}), [source]) == {'a': 1})
+    assert(len(calls) == 1)
+    #same content, the artifact is kept and its header updated
+    os.utime(source, (0, 0))
+    hashed = []
+    file_hash = cache_store.file_hash
+    cache_store.file_hash = lambda f: hashed.append(f) or file_hash(f)
+    try:
+        for i in range(2):
+            assert(cache_store.load(fn, _builder(calls, {'a': 2}), [source]) == {'a': 1})
+    finally:
+        cache_store.file_hash = file_hash
+    assert(len(calls) == 1 and len(hashed) == 1)
+    with open(source, 'w') as fw:
+        fw.write('b')
+    assert(cache_store.load(fn, _builder(calls, {'b': 1}), [source]) == {'b': 1})
+    assert(cache_store.load(fn, _builder(calls, {'b': 2}), [source], version=2) == {'b': 2})
+    assert(len(calls) == 3)
+    assert(not [f for f in os.listdir(os.path.dirname(fn)) if '.tmp' in f])
+
+def test_cache_legacy(tmp_path):
+    fn = os.path.join(str(tmp_path), 'artifact.pickle')
+    with open(fn, 'wb') as fw:
+        pickle.dump({'format': 1, 'a': 1}, fw)
+    assert(cache_store.load(fn, lambda: None) == {'format': 1, 'a': 1})
+    assert(cache_store.load(fn, lambda: {'b': 1}) == {'b': 1})
+    assert(cache_store.load(fn, lambda: None) == {'b': 1})
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+from tfta import db_index
+
+
+source = '''
+def find(self, kinase_names, target_name):
+    res = self.tfdb.execute("SELECT DISTINCT target FROM kinaseReg "
+                            "WHERE kinase = ? AND target = ?", t).fetchall()
+    res = batch_query.find_common(self.tfdb, 'kinaseReg', 'target', 'kinase', kinase_names)
+    res = self.ldd.execute("SELECT Id, disease FROM diseaseName WHERE disease LIKE ?", t)
+'''
+
+def _make_db(db_file):
+    db = sqlite3.connect(db_file)
+    db.execute("CREATE TABLE kinaseReg (kinase text, target text, direction text)")
+    db.executemany("INSERT INTO kinaseReg VALUES (?,?,?)",
+                   [('K%d' % i, 'T%d' % j, 'increase') for i in range(50) for j in range(20)])
+    db.commit()
+    db.close()
+
+def test_collect_queries():
+    queries = set(db_index.collect_queries(source))
+    assert(queries == {('tfdb', 'SELECT DISTINCT target FROM kinaseReg WHERE kinase = ? AND target = ?'),
+                       ('ldd', 'SELECT Id, disease FROM diseaseName WHERE disease LIKE ?'),
+                       ('tfdb', 'SELECT kinase FROM kinaseReg WHERE target IN '
+                                '(SELECT value FROM json_each(?))')})
+
+def test_build_indexed_copy(tmp_path):
+    db_file = os.path.join(str(tmp_path), 'test.db')
+    _make_db(db_file)
+    queries = [q[1] for q in db_index.collect_queries(source) if q[0] == 'tfdb']
+    db = sqlite3.connect(db_file)
+    assert(len(db_index.audit(db, queries)) == 2)
+    db.close()
+
+    assert(db_index.build_indexed_copy(db_file, queries) == [])
+    indexed_file = db_index.indexed_db_file(db_file)
+    assert(indexed_file == os.path.join(str(tmp_path), 'test.indexed.db'))
+    db = sqlite3.connect(indexed_file)
+    assert(db_index.audit(db, queries) == [])
+    db.close()
+
+def test_pathway_fts():
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE pathwayInfo (Id integer, pathwayName text, dblink text, source text)")
+    db.executemany("INSERT INTO pathwayInfo VALUES (?,?,?,?)",
+                   [(1, 'MAPK signaling pathway', 'l1', 'KEGG'), (2, 'Signaling by WNT', 'l2', 'reactome'),
+                    (3, 'Apoptosis', 'l3', 'KEGG')])
+    db_index.create_pathway_fts(db)
+    for kw in ['signaling', 'SIGNAL', 'ap', 'x', 'by_WNT']:
+        t = ('%' + kw + '%',)
+        res1 = db.execute("SELECT Id FROM pathwayInfo WHERE rowid IN "
+                          "(SELECT rowid FROM pathway_fts WHERE pathwayName LIKE ?)", t).fetchall()
+        res2 = db.execute("SELECT Id FROM pathwayInfo WHERE pathwayName LIKE ?", t).fetchall()
+        assert(res1 == res2)
+
+def test_key_table():
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE mirnaInfo (Id integer, mirna text, target text)")
+    db.executemany("INSERT INTO mirnaInfo VALUES (?,?,?)",
+                   [(1, 'hsa-miR-20b-5p', 'STAT3'), (2, 'hsa-miR-20b-3p', 'STAT3'),
+                    (3, 'hsa-miR-200a-3p', 'ZEB1'), (4, 'hsa-let-7a-5p', 'KRAS')])
+    db_index.create_search_tables(db)
+    for name in ['hsa-miR-20b-5p', 'HSA-MIR-20B-5P', 'hsa-mir-20b', 'hsa-let-7a-5p']:
+        res1 = db.execute("SELECT Id FROM mirnaInfo WHERE rowid IN "
+                          "(SELECT rid FROM mirnaKey WHERE key = UPPER(?))", (name,)).fetchall()
+        res2 = db.execute("SELECT Id FROM mirnaInfo WHERE mirna LIKE ?", (name,)).fetchall()
+        assert(res1 == res2)
+    res = db.execute("SELECT Id FROM mirnaInfo WHERE rowid IN (SELECT rid FROM mirnaKey "
+                     "WHERE key >= UPPER(?) AND key < UPPER(?) || char(1114111))",
+                     ('hsa-mir-20', 'hsa-mir-20')).fetchall()
+    assert([r[0] for r in res] == [1, 2, 3])
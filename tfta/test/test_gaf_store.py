@@ -0,0 +1,32 @@
+import gzip
+import os
+import pickle
+from enrichment.gaf_store import GafStore
+
+
+_ROWS = [('STAT3', 'GO:0001', 'P', 'signal transducer and activator of transcription 3'),
+         ('STAT3', 'GO:0002', 'F', 'signal transducer and activator of transcription 3'),
+         ('JAK1', 'GO:0002', 'F', 'Janus kinase 1'),
+         ('STAT3', 'GO:0001', 'P', 'signal transducer and activator of transcription 3')]
+
+def _write_gaf(fn):
+    with gzip.open(fn, 'wt') as fw:
+        fw.write('!gaf-version: 2.1\n')
+        for gene, go_id, aspect, name in _ROWS:
+            fw.write('\t'.join(['UniProtKB', 'P1', gene, 'enables', go_id, 'PMID:1', 'IDA', '',
+                                aspect, name, '', 'protein', 'taxon:9606', '20190701', 'UniProt', '', '']) + '\n')
+
+def test_gaf_store(tmp_path):
+    fn = os.path.join(str(tmp_path), 'goa_human.gaf.gz')
+    _write_gaf(fn)
+    store = pickle.loads(pickle.dumps(GafStore.from_file(fn)))
+    assert(list(store) == ['STAT3', 'JAK1'] and 'JAK1' in store and 'JAK2' not in store)
+    assert([e['GO_ID'] for e in store['STAT3']] == ['GO:0001', 'GO:0002', 'GO:0001'])
+    assert(store['JAK1'] == [{'GO_ID': 'GO:0002', 'Aspect': 'F', 'DB_Object_Name': 'Janus kinase 1'}])
+    assert(store.get_annotations('JAK2') == [])
+    assert(store.assoc() == {'STAT3': {'GO:0001', 'GO:0002'}, 'JAK1': {'GO:0002'}})
+    assert(store.genes_with_name('KINASE') == ['JAK1'])
+    assert(list(store.rows()) == [(r[0], r[1], r[2]) for r in sorted(_ROWS, key=lambda r: r[0] != 'STAT3')])
+    entries = {g: [{'GO_ID': go_id, 'Aspect': a, 'DB_Object_Name': n} for g2, go_id, a, n in _ROWS if g2 == g]
+               for g in ['STAT3', 'JAK1']}
+    assert(dict(GafStore.from_entries(entries)) == dict(store))
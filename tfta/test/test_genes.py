@@ -0,0 +1,13 @@
+from utils.genes import GeneSet, gene_bits
+
+
+def test_gene_set():
+    a = GeneSet(['STAT3', 'JUN', 'FOS'])
+    b = GeneSet(['JUN', 'FOS', 'MYC'])
+    assert(len(a) == 3 and 'JUN' in a and 'MYC' not in a and 'UNKNOWN-X' not in a)
+    assert(isinstance(a & b, GeneSet) and set(a & b) == {'JUN', 'FOS'})
+    assert(a.intersection(['FOS', 'MYC', 'UNKNOWN-X']) == {'FOS'})
+    assert({'STAT3', 'MYC'} & a == {'STAT3'})
+    assert(a - {'JUN'} == {'STAT3', 'FOS'})
+    assert(a == {'STAT3', 'JUN', 'FOS'})
+    assert(gene_bits(['JUN', 'UNKNOWN-X']) == gene_bits(GeneSet(['JUN'])))
@@ -0,0 +1,63 @@
+import os
+import random
+from goatools import obo_parser
+from goatools.go_enrichment import GOEnrichmentStudy
+from enrichment import GO
+from enrichment.GO import _load_study
+from enrichment.gaf_store import GafStore
+
+
+def _write_obo(fn, num):
+    with open(fn, 'w') as fw:
+        fw.write('format-version: 1.2\n\n')
+        for i in range(num):
+            fw.write('[Term]\nid: GO:{:07d}\nname: term {}\nnamespace: biological_process\n'.format(i, i))
+            if i:
+                fw.write('is_a: GO:{:07d} ! term\n'.format((i - 1) // 2))
+            fw.write('\n')
+
+def _record(r):
+    return (r.p_uncorrected, r.p_bonferroni, r.study_items, r.pop_items, r.ratio_in_study, r.ratio_in_pop)
+
+def test_go_study(tmp_path):
+    random.seed(0)
+    fn = os.path.join(str(tmp_path), 'go-basic.obo')
+    _write_obo(fn, 40)
+    go = obo_parser.GODag(fn)
+    genes = ['G%d' % i for i in range(200)]
+    entries = {g: [{'GO_ID': 'GO:{:07d}'.format(random.randrange(40)), 'Aspect': 'P', 'DB_Object_Name': g}
+                   for k in range(3)] for g in genes}
+    gaf_funcs = GafStore.from_entries(entries)
+    study_fn = os.path.join(str(tmp_path), 'go_study.pickle')
+    for i in range(2):
+        #built, then read from the artifact
+        cached = _load_study(go, gaf_funcs, study_fn)
+        for study in [genes[:20], genes[50:60] + ['X'], ['X']]:
+            g = GOEnrichmentStudy(gaf_funcs.keys(), gaf_funcs.assoc(), go,
+                                  propagate_counts=True, alpha=0.05, methods=['bonferroni'])
+            expected = {r.GO: _record(r) for r in g.run_study(study)}
+            res = {r.GO: _record(r) for r in cached.run_study(study, alpha=0.05, methods=['bonferroni'])}
+            assert(res == expected and (len(res) > 0 or study == ['X']))
+    assert(os.path.isfile(study_fn))
+
+def test_go_study_fallback(tmp_path):
+    random.seed(1)
+    fn = os.path.join(str(tmp_path), 'go-basic.obo')
+    _write_obo(fn, 20)
+    go = obo_parser.GODag(fn)
+    genes = ['G%d' % i for i in range(100)]
+    entries = {g: [{'GO_ID': 'GO:{:07d}'.format(random.randrange(20)), 'Aspect': 'P', 'DB_Object_Name': g}
+                   for k in range(2)] for g in genes}
+    gaf_funcs = GafStore.from_entries(entries)
+    cached = _load_study(go, gaf_funcs)
+    #a goatools version without the attributes set by _load_study
+    GO._STUDY_ATTRS = GO._STUDY_ATTRS + ('no_such_attribute',)
+    try:
+        built = _load_study(go, gaf_funcs)
+    finally:
+        GO._STUDY_ATTRS = GO._STUDY_ATTRS[:-1]
+    assert(len(built.pop) == len(genes))
+    study = genes[:15]
+    res = {r.GO: _record(r) for r in built.run_study(study, alpha=0.05, methods=['bonferroni'])}
+    expected = {r.GO: _record(r) for r in cached.run_study(study, alpha=0.05, methods=['bonferroni'])}
+    assert(res == expected and len(res) > 0)
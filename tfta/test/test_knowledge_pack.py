@@ -0,0 +1,51 @@
+import os
+import random
+import sqlite3
+from tfta import batch_query
+from tfta import knowledge_pack
+
+
+def _make_db(resource_dir):
+    random.seed(0)
+    db = sqlite3.connect(os.path.join(resource_dir, 'TF_target_20191224.db'))
+    db.execute("CREATE TABLE CombinedDB (TF text, Target text, dbnames text)")
+    db.execute("CREATE TABLE pathway2Genes (Id integer, pathwayID integer, genesymbol text)")
+    db.execute("CREATE TABLE transFactor (tf text)")
+    genes = ['G%d' % i for i in range(100)] + ['Gène', 'g1']
+    db.executemany("INSERT INTO CombinedDB VALUES (?,?,?)",
+                   [(tf, g, 'TRRUST') for tf in genes[:20] for g in random.sample(genes, 30)])
+    db.executemany("INSERT INTO pathway2Genes VALUES (?,?,?)",
+                   [(0, p, g) for p in range(1, 30) for g in random.sample(genes, 10)])
+    db.executemany("INSERT INTO transFactor VALUES (?)", [(tf,) for tf in genes[:20]])
+    db.commit()
+    return db
+
+def test_pack_queries(tmp_path):
+    resource_dir = str(tmp_path)
+    pack_dir = os.path.join(resource_dir, 'knowledge_pack')
+    db = _make_db(resource_dir)
+    knowledge_pack.build_pack(pack_dir, resource_dir)
+    pack = knowledge_pack.load_pack(pack_dir, resource_dir)
+    assert('G3' in pack.sets['transFactor'] and 'G30' not in pack.sets['transFactor'])
+    queries = [('CombinedDB', 'TF', 'Target', ['G1', 'G2']), ('CombinedDB', 'Target', 'TF', ['G5', 'Gène']),
+               ('CombinedDB', 'Target', 'TF', ['G5', 'X']), ('pathway2Genes', 'genesymbol', 'pathwayID', ['g1']),
+               ('pathway2Genes', 'pathwayID', 'genesymbol', [3, '4', 'x'])]
+    for table, key, value, keys in queries:
+        rel = pack.relation(table, key, value)
+        assert(rel.find_common(keys) == batch_query.find_common(db, table, key, value, keys))
+        assert(rel.find_any(keys) == batch_query.find_any(db, table, key, value, keys))
+        res = batch_query.group_values(db, table, key, value, keys)
+        labels = [str(k) for k in keys]
+        assert(rel.group_values(keys) == [(v, sorted(k, key=labels.index)) for v, k in res])
+        assert(rel.values_of(keys[0]) == batch_query.find_values(db, table, key, value, keys[0]))
+    db.close()
+
+def test_pack_out_of_date(tmp_path):
+    resource_dir = str(tmp_path)
+    pack_dir = os.path.join(resource_dir, 'knowledge_pack')
+    db = _make_db(resource_dir)
+    knowledge_pack.build_pack(pack_dir, resource_dir)
+    db.execute("DELETE FROM transFactor")
+    db.commit()
+    db.close()
+    assert(knowledge_pack.load_pack(pack_dir, resource_dir) is None)
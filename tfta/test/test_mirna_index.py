@@ -0,0 +1,21 @@
+from tfta.mirna_index import MirnaIndex
+
+
+mirnas = ['hsa-miR-20b', 'hsa-miR-20b-3p', 'hsa-miR-20b-5p', 'hsa-miR-200a-3p',
+          'hsa-miR-20a-5p', 'hsa-let-7a-5p']
+
+def test_contains():
+    index = MirnaIndex(mirnas)
+    assert(len(index) == 6)
+    assert('hsa-miR-20b-5p' in index)
+    assert('HSA-MIR-20B-5P' in index)
+    assert('hsa-miR-20' not in index)
+
+def test_find_prefix():
+    index = MirnaIndex(mirnas)
+    assert(index.find_prefix('hsa-miR-20b-') == ['hsa-miR-20b-3p', 'hsa-miR-20b-5p'])
+    #mature forms first
+    assert(index.find_prefix('hsa-mir-20b') == ['hsa-miR-20b-3p', 'hsa-miR-20b-5p', 'hsa-miR-20b'])
+    assert(index.find_prefix('hsa-miR-20') == ['hsa-miR-200a-3p', 'hsa-miR-20a-5p', 'hsa-miR-20b-3p',
+                                               'hsa-miR-20b-5p', 'hsa-miR-20b'])
+    assert(index.find_prefix('hsa-miR-21') == [])
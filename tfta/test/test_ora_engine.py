@@ -0,0 +1,90 @@
+import os
+import random
+from scipy import stats
+from statsmodels.sandbox.stats import multicomp
+from enrichment.ora_engine import GeneSetCollection, load_collection
+from utils.genes import GeneSet
+
+
+def _ora(study, pop, gene_set, p_bonferroni=0.01, limit=30):
+    #scalar reference, one hypergeometric test per set
+    pvalues = dict()
+    genes = dict()
+    for k, v in gene_set.items():
+        sm = set(v['gene']) & set(study)
+        if sm:
+            n = len(set(v['gene']) & set(pop))
+            pvalues[k] = stats.hypergeom.sf(len(sm) - 1, len(pop), n, len(study))
+            genes[k] = sm
+    _, pv, _, _ = multicomp.multipletests(list(pvalues.values()), method='bonferroni')
+    res_sorted = sorted(zip(pvalues, pv), key=lambda x: x[1])
+    sig = [(k, p) for k, p in res_sorted if p < p_bonferroni][:limit]
+    return [(k, p, genes[k], gene_set[k]['dblink']) for k, p in (sig or res_sorted[:5])]
+
+def test_ora_engine():
+    random.seed(1)
+    genes = ['ORA%d' % i for i in range(1000)]
+    for trial in range(10):
+        pop = random.sample(genes, 800)
+        gene_set = {'T%d' % i: {'gene': random.sample(genes, random.randint(5, 100)), 'dblink': 'l%d' % i}
+                    for i in range(100)}
+        collection = GeneSetCollection(gene_set)
+        for study in [random.sample(genes, 100), random.sample(genes, 10) + ['ORA-UNKNOWN']]:
+            expected = _ora(study, pop, gene_set)
+            res = collection.ora(study, GeneSet(pop) if trial % 2 else pop)
+            assert(len(collection) == 100)
+            assert([k for k, _, _, _ in expected] == list(res))
+            for k, p, g, link in expected:
+                assert(abs(res[k]['p-bonferroni'] - p) < 1e-12)
+                assert(res[k]['gene'] == g and res[k]['dblink'] == link)
+
+def test_ora_batch():
+    random.seed(2)
+    genes = ['ORA%d' % i for i in range(500)]
+    pop = GeneSet(genes[:450])
+    gene_set = {'T%d' % i: {'gene': random.sample(genes, random.randint(5, 60)), 'dblink': 'l%d' % i}
+                for i in range(80)}
+    collection = GeneSetCollection(gene_set)
+    studies = [random.sample(genes, random.randint(1, 80)) for i in range(20)] + [['ORA-UNKNOWN']]
+    res = collection.ora_batch(studies, pop)
+    assert(len(res) == len(studies) and res[-1] == {})
+    for study, r in zip(studies, res):
+        assert(r == collection.ora(study, pop))
+
+def test_ora_prune():
+    random.seed(3)
+    genes = ['ORA%d' % i for i in range(2000)]
+    pop = GeneSet(genes[:1800])
+    gene_set = {'T%d' % i: {'gene': random.sample(genes, random.randint(5, 100)), 'dblink': 'l%d' % i}
+                for i in range(1500)}
+    collection = GeneSetCollection(gene_set)
+    studies = [gene_set['T%d' % i]['gene'][:20] + random.sample(genes, 50) for i in range(5)] + \
+              [random.sample(genes, 30)]
+    expected = collection.ora_batch(studies, pop, prune=False)
+    assert(collection.ora_batch(studies, pop) == expected)
+    assert(collection.pruned > 0 and 0 < collection.skip_rate() < 1)
+
+def test_load_collection(tmp_path):
+    random.seed(4)
+    genes = ['ORA%d' % i for i in range(300)]
+    gene_set = {'T%d' % i: {'gene': random.sample(genes, random.randint(5, 40)), 'dblink': 'l%d' % i}
+                for i in range(50)}
+    fn = os.path.join(str(tmp_path), 'test.genesets')
+    builds = []
+    def build():
+        builds.append(1)
+        return gene_set
+    pop = genes[:250]
+    study = random.sample(genes, 30)
+    expected = GeneSetCollection(gene_set).ora(study, pop)
+    for i in range(2):
+        #built, then mapped from the saved arrays
+        collection = load_collection(fn, build)
+        #the read-only mapped arrays are not copied
+        assert(not collection.matrix.indices.flags.writeable)
+        assert(collection.ora(study, pop) == expected)
+    assert(len(builds) == 1)
+    #corrupted arrays are rebuilt
+    os.remove(fn + '.indices.npy')
+    assert(load_collection(fn, build).ora(study, pop) == expected and len(builds) == 2)
+    assert(load_collection(os.path.join(str(tmp_path), 'none.genesets'), lambda: None) is None)
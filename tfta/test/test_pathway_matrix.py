@@ -0,0 +1,42 @@
+from tfta.pathway_matrix import PathwayMatrix
+
+
+class _Agent:
+    def __init__(self, name):
+        self.name = name
+
+pathways = [(1, 'MAPK signaling pathway', 'hsa04010', 'KEGG'),
+            (2, 'Wnt signaling pathway', 'hsa04310', 'KEGG'),
+            (3, 'Apoptosis', 'R-HSA-109581', 'reactome'),
+            (4, 'Cell cycle', 'hsa04110', 'KEGG')]
+members = [(1, 'MAPK1'), (1, 'FOS'), (1, 'JUN'), (1, 'ELK1'),
+           (2, 'JUN'), (2, 'MYC'), (2, 'CTNNB1'),
+           (3, 'JUN'), (3, 'TP53'), (3, 'MYC'), (3, 'CASP3'),
+           (4, 'MYC'), (4, 'TP53'), (4, 'CDK2')]
+
+def test_overlap_counts():
+    pm = PathwayMatrix(pathways, members)
+    counts, _ = pm.overlap_counts(['JUN', 'MYC', 'TP53', 'XYZ'])
+    assert(list(counts) == [1, 2, 3, 2])
+    counts, fhits = pm.overlap_counts(['FOS'], {'CDK': [_Agent('CDK2'), _Agent('CDK4')]})
+    assert(list(counts) == [1, 0, 0, 1])
+    assert(list(fhits['CDK']) == [False, False, False, True])
+
+def test_find_common():
+    pm = PathwayMatrix(pathways, members)
+    names, links, genes = pm.find_common(['JUN', 'MYC', 'TP53'])
+    #ordered by overlap, then by pathway
+    assert(list(genes.keys()) == [3, 2, 4])
+    assert(sorted(genes[3]) == ['JUN', 'MYC', 'TP53'])
+    assert(names[2] == 'Wnt signaling pathway' and links[4] == 'hsa04110')
+    _, _, genes = pm.find_common(['JUN', 'MYC', 'TP53'], limit=2)
+    assert(list(genes.keys()) == [3, 2])
+
+def test_find_common_filters():
+    pm = PathwayMatrix(pathways, members)
+    _, _, genes = pm.find_common(['JUN', 'MYC', 'TP53', 'FOS'], keyword='Signaling')
+    assert(list(genes.keys()) == [1, 2])
+    _, _, genes = pm.find_common(['JUN', 'MYC', 'TP53'], db_name='kegg')
+    assert(list(genes.keys()) == [2, 4])
+    _, _, genes = pm.find_common(['JUN', 'MYC', 'TP53'], keyword='signaling', db_name='reactome')
+    assert(genes == {})
@@ -0,0 +1,39 @@
+from tfta.regindex import RegulationIndex
+from utils.bitset import SymbolTable, ids_to_bits, bits_to_ids, popcount
+
+
+pairs = [('STAT3', 'FOS'), ('STAT3', 'JUN'), ('STAT3', 'MYC'),
+         ('ELK1', 'FOS'), ('ELK1', 'MYC'), ('SMAD2', 'JUN')]
+
+def test_bits_roundtrip():
+    ids = [0, 3, 7, 8, 63, 64, 1000]
+    bits = ids_to_bits(ids)
+    assert(bits_to_ids(bits) == ids)
+    assert(popcount(bits) == len(ids))
+    assert(ids_to_bits([]) == 0)
+    assert(bits_to_ids(0) == [])
+
+def test_symbol_table():
+    st = SymbolTable(['A', 'B', 'A', 'C'])
+    assert(len(st) == 3)
+    assert(st.get('C') == 2)
+    assert(st.from_bits(st.to_bits(['C', 'A', 'X'])) == ['A', 'C'])
+
+def test_common_tfs():
+    index = RegulationIndex(pairs)
+    assert(set(index.tf_names(index.common_tfs(['FOS', 'MYC']))) == {'STAT3', 'ELK1'})
+    assert(index.tf_names(index.common_tfs(['FOS', 'JUN'])) == ['STAT3'])
+    assert(index.common_tfs(['FOS', 'TP53']) is None)
+
+def test_common_targets():
+    index = RegulationIndex(pairs)
+    assert(set(index.target_names(index.common_targets(['STAT3', 'ELK1']))) == {'FOS', 'MYC'})
+    assert(index.common_targets(['STAT3', 'FOS']) is None)
+    assert(set(index.target_names(index.any_targets(['ELK1', 'SMAD2']))) == {'FOS', 'MYC', 'JUN'})
+
+def test_tf_target_hits():
+    index = RegulationIndex(pairs)
+    hits = index.tf_target_hits(['FOS', 'JUN', 'TP53'])
+    assert(sorted(hits['STAT3']) == ['FOS', 'JUN'])
+    assert(hits['ELK1'] == ['FOS'])
+    assert(hits['SMAD2'] == ['JUN'])
@@ -0,0 +1,26 @@
+from enrichment.result_cache import ResultCache, make_key, new_data_version
+
+
+def test_result_cache():
+    cache = ResultCache(max_bytes=10)
+    key = make_key(['A', 'B'], 'kegg', 'bonferroni', (0.01, 30), 1)
+    assert(key == make_key(('B', 'A'), 'kegg', 'bonferroni', (0.01, 30), 1))
+    assert(key != make_key(['A', 'B', 'B'], 'kegg', 'bonferroni', (0.01, 30), 1))
+    assert(key != make_key(['A', 'B'], 'kegg', 'bonferroni', (0.01, 30), 2))
+    calls = []
+    def compute(value):
+        calls.append(value)
+        return value
+    assert(cache.get_or_compute(key, lambda: compute('abcd')) == 'abcd')
+    assert(cache.get_or_compute(key, lambda: compute('efgh')) == 'abcd')
+    assert(calls == ['abcd'] and cache.hits == 1 and cache.misses == 1)
+    #None is not cached
+    key2 = make_key(['C'], 'kegg', 'bonferroni')
+    assert(cache.get_or_compute(key2, lambda: None) is None and cache.get(key2) is None)
+    #the least recently used value is evicted over the memory bound
+    cache.put(key2, '12345')
+    cache.get(key)
+    cache.put(make_key(['D'], 'kegg', 'bonferroni'), '678')
+    assert(cache.get(key) == 'abcd' and cache.get(key2) is None)
+    assert(cache.evictions == 1 and cache.nbytes == 7 and len(cache) == 2)
+    assert(new_data_version() != new_data_version())
@@ -0,0 +1,38 @@
+import time
+from tfta.startup import StartupLoader
+
+
+def _sleep(value, seconds=0.2):
+    time.sleep(seconds)
+    return value
+
+def test_startup_concurrent():
+    loader = StartupLoader()
+    loader.add('db', lambda: _sleep('db'))
+    loader.add('pack', lambda: _sleep('pack'))
+    loader.add('index', lambda db, pack: _sleep(db + pack, 0.1), ['db', 'pack'])
+    loader.add('hgnc', lambda: 'hgnc')
+    res = loader.run()
+    #db and pack were loaded at the same time, index after both
+    t = loader.timings
+    assert(t['db'][0] < t['pack'][1] and t['pack'][0] < t['db'][1])
+    assert(t['index'][0] >= max(t['db'][1], t['pack'][1]))
+    assert(res == {'db': 'db', 'pack': 'pack', 'index': 'dbpack', 'hgnc': 'hgnc'})
+    assert(loader.critical_path()[-1] == 'index' and len(loader.critical_path()) == 2)
+
+def test_startup_error():
+    loader = StartupLoader()
+    loader.add('db', lambda: 1 / 0)
+    loader.add('index', lambda db: db, ['db'])
+    loader.add('hgnc', lambda: 'hgnc')
+    try:
+        loader.run()
+        assert(False)
+    except ZeroDivisionError:
+        pass
+    assert('hgnc' in loader.timings)
+    try:
+        loader.add('matrix', lambda tissue: tissue, ['tissue'])
+        assert(False)
+    except ValueError:
+        pass
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import threading
+from tfta import storage
+from tfta.db_index import create_search_tables
+
+
+def _make_db(db_file):
+    db = sqlite3.connect(db_file)
+    db.execute("CREATE TABLE mirnaInfo (Id integer, mirna text, target text)")
+    db.executemany("INSERT INTO mirnaInfo VALUES (?,?,?)",
+                   [(i, 'hsa-miR-%d-5p' % i, 'G%d' % (i % 10)) for i in range(200)])
+    db.commit()
+    db.close()
+
+def _query_in_threads(pool, num):
+    res = [None] * num
+    def work(i):
+        res[i] = pool.execute("SELECT Id FROM mirnaInfo WHERE rowid IN "
+                              "(SELECT rid FROM mirnaKey WHERE key = UPPER(?))",
+                              ('HSA-MIR-%d-5P' % i,)).fetchall()
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(num)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return res
+
+def test_pool_threads(tmp_path):
+    db_file = os.path.join(str(tmp_path), 'test.db')
+    _make_db(db_file)
+    for mode in storage.STORAGE_MODES:
+        pool = storage.ConnectionPool(db_file, mode, size=3, setup=create_search_tables)
+        pool.row_factory = sqlite3.Row
+        res = _query_in_threads(pool, 12)
+        assert([r[0]['Id'] for r in res] == list(range(12)))
+        assert(pool._count <= 3)
+        pool.close()
+
+def test_pool_read_only(tmp_path):
+    db_file = os.path.join(str(tmp_path), 'test.db')
+    _make_db(db_file)
+    pool = storage.ConnectionPool(db_file, 'default')
+    try:
+        pool.execute("DELETE FROM mirnaInfo")
+        assert(False)
+    except sqlite3.OperationalError:
+        pass
+    pool.release()
+    assert(pool.execute("SELECT count(*) FROM mirnaInfo").fetchone()[0] == 200)
+    assert(pool._count == 1)
+    pool.close()
+
+def test_pool_search_tables_once(tmp_path):
+    db_file = os.path.join(str(tmp_path), 'test.db')
+    _make_db(db_file)
+    calls = []
+    def setup(db, schema):
+        calls.append(schema)
+        create_search_tables(db, schema)
+    for mode in ['default', 'immutable']:
+        del calls[:]
+        pool = storage.ConnectionPool(db_file, mode, size=8, setup=setup)
+        for i in range(4):
+            #each finished thread gives its connection to the next one
+            res = _query_in_threads(pool, 1)
+            assert(res[0][0][0] == 0)
+        assert(calls == ['search'] and pool._count == 2)
+        pool.close()
+
+def test_pool_timeout(tmp_path):
+    db_file = os.path.join(str(tmp_path), 'test.db')
+    _make_db(db_file)
+    #the only connection is held by this thread
+    pool = storage.ConnectionPool(db_file, 'default', size=1, timeout=0.1)
+    errors = []
+    def work():
+        try:
+            pool.execute("SELECT count(*) FROM mirnaInfo")
+        except storage.PoolTimeoutException as e:
+            errors.append(e)
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert(len(errors) == 1 and pool._count == 1)
+    #the released connection is handed to the next thread
+    pool.release()
+    del errors[:]
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert(not errors and pool._count == 1)
+    pool.close()
@@ -0,0 +1,35 @@
+import threading
+from tfta.subsystem import Subsystem, SubsystemUnavailableException, warm_up
+
+
+def test_subsystem_lazy():
+    calls = []
+    md = Subsystem('md', lambda: calls.append('md') or 'md')
+    pw = Subsystem('pw', lambda md: calls.append('pw') or md + '-pw', depends=[md])
+    assert(not pw.loaded)
+    assert(pw.get() == 'md-pw' and pw.get() == 'md-pw')
+    assert(md.loaded and calls == ['md', 'pw'])
+
+def test_subsystem_timeout():
+    release = threading.Event()
+    go = Subsystem('go', lambda: release.wait() and 'go')
+    thread = warm_up([go])
+    while not go._lock.locked():
+        pass
+    try:
+        go.get(timeout=0.01)
+        assert(False)
+    except SubsystemUnavailableException:
+        pass
+    release.set()
+    thread.join()
+    assert(go.get(timeout=0.01) == 'go')
+
+def test_subsystem_error():
+    bad = Subsystem('bad', lambda: 1 / 0)
+    for i in range(2):
+        try:
+            bad.get()
+            assert(False)
+        except SubsystemUnavailableException:
+            pass
@@ -0,0 +1,18 @@
+import random
+from utils.text_index import NameIndex
+
+
+def test_name_index_substring():
+    random.seed(0)
+    words = ['kinase', 'Janus', 'receptor', 'tyrosine', 'protein', 'RNA', 'ß-catenin', '2']
+    names = [' '.join(random.sample(words, 3)) for i in range(300)] + ['', 'ab']
+    index = NameIndex(names)
+    for keyword in ['kinase', 'KIN', 'ase jan', 'in', 'ß-c', 'a', 'receptor tyrosine', 'xyz', 'ab', '']:
+        assert(index.find(keyword) == [i for i, n in enumerate(names) if keyword.lower() in n.lower()])
+
+def test_name_index_tokens():
+    names = ['Janus kinase 1', 'kinase-associated protein', 'Kinases', 'protein kinase C']
+    index = NameIndex(names)
+    assert(index.find_tokens('kinase') == [0, 1, 3])
+    assert(index.find_tokens('Protein KINASE') == [1, 3])
+    assert(index.find_tokens('kinase 2') == [] and index.find_tokens('-') == [])
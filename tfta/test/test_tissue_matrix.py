@@ -0,0 +1,22 @@
+from tfta.tissue_matrix import TissueMatrix
+
+
+rows = [('STAT3', 'liver', 2.0), ('STAT3', 'brain', 1.0), ('MYC', 'liver', 3.0),
+        ('MYC', 'lung', 1.6), ('ALB', 'liver', 8.0), ('GFAP', 'brain', 5.0),
+        ('GFAP', 'lung', 1.5)]
+
+def test_expression():
+    tm = TissueMatrix(rows, 1.5)
+    assert(tm.tissues_of('MYC') == ['liver', 'lung'])
+    assert(tm.tissues_of('TP53') == [])
+    assert(tm.genes_in('LIV') == ['STAT3', 'MYC', 'ALB'])
+    assert(tm.is_expressed('Brain', 'GFAP'))
+    assert(not tm.is_expressed('lung', 'GFAP'))
+
+def test_exclusive():
+    tm = TissueMatrix(rows, 1.5)
+    assert(tm.exclusive_genes('liver') == ['STAT3', 'ALB'])
+    assert(tm.exclusive_genes('brain') == ['GFAP'])
+    assert(tm.exclusive_genes('lung') == [])
+    assert(tm.is_exclusive('liver', 'ALB'))
+    assert(not tm.is_exclusive('liver', 'MYC'))
@@ -8,12 +8,21 @@ import sqlite3
 import numpy as np
 from collections import defaultdict, Counter
 import math
-from indra import has_config
-from indra.ontology.bio import bio_ontology
-from indra.tools.expand_families import expand_agent
+import functools
+from indra import has_config, get_config
 from utils.util import merge_dict_sum, merge_dict_list
 from utils.util import download_file_dropbox
-import pickle
+from utils.genes import GeneSet
+from utils import cache_store
+from .regindex import RegulationIndex
+from .pathway_matrix import PathwayMatrix
+from .mirna_index import MirnaIndex
+from .tissue_matrix import TissueMatrix
+from .db_index import indexed_db_file, create_search_tables
+from .knowledge_pack import load_pack
+from .startup import StartupLoader
+from . import storage
+from . import batch_query
 
 
 logging.basicConfig(format='%(levelname)s: %(name)s - %(message)s',
@@ -59,15 +68,15 @@ class TissueNotFoundException(Exception):
         
 class KinaseNotFoundException(Exception): pass
 
-def _make_go_map():
+#the module level data below are loaded on first use, not at import time
+@functools.lru_cache(maxsize=None)
+def _get_go_map():
     lines = open(_resource_dir + 'GO_mapping.txt', 'rt').readlines()
     go_map = defaultdict(list)
     for line in lines:
         kin, goid = line.strip().split('\t')
         go_map[kin].append(goid)
     return go_map
-    
-go_map = _make_go_map()
 
 def _get_mirna_indra():
     lines = open(_resource_dir + 'mirna_indra_regulateAmount.txt', 'rt').readlines()
@@ -78,49 +87,130 @@ def _get_mirna_indra():
 
 #mirna_indra_set = _get_mirna_indra()
 
-#hgnc official symbol to id mapping
-def _get_hgnc_genes():
+def _get_config_flag(name, default):
+    """
+    Read a boolean option from the indra config or environment.
+    """
+    value = get_config(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ['0', 'false', 'no', 'off']
+
+#compiled knowledge pack, used instead of the databases for the relations it holds
+@functools.lru_cache(maxsize=None)
+def _get_knowledge_pack():
+    if _get_config_flag('TFTA_KNOWLEDGE_PACK', True):
+        return load_pack()
+    return None
+
+def _read_hgnc_genes(fn):
     hgnc_genes = dict()
-    #check if the pickle file exist
-    fn = os.path.join(_resource_dir, 'hgnc_symbol_id.pickle')
-    if os.path.isfile(fn):
-        with open(fn, 'rb') as pickle_in:
-            hgnc_genes = pickle.load(pickle_in)
-    else:
-        with open(_resource_dir + 'hgnc_symbol_id_20190225.txt', 'rt') as fr:
-            lines = fr.readlines()
-        for line in lines:
-            s = line.strip().split('\t')
-            hgnc_genes[s[1]] = s[0]
-        #save to file
-        with open(fn, 'wb') as pickle_out:
-            pickle.dump(hgnc_genes, pickle_out)
+    with open(fn, 'rt') as fr:
+        lines = fr.readlines()
+    for line in lines:
+        s = line.strip().split('\t')
+        hgnc_genes[s[1]] = s[0]
     return hgnc_genes
 
-hgnc_symbol_id = _get_hgnc_genes()
-hgnc_genes_set = set(hgnc_symbol_id.keys())
+#hgnc official symbol to id mapping
+def _get_hgnc_genes():
+    source = _resource_dir + 'hgnc_symbol_id_20190225.txt'
+    return cache_store.load(os.path.join(_resource_dir, 'hgnc_symbol_id.pickle'),
+                            lambda: _read_hgnc_genes(source), [source])
+
+@functools.lru_cache(maxsize=None)
+def _get_hgnc_symbol_id():
+    knowledge_pack = _get_knowledge_pack()
+    if knowledge_pack is not None and knowledge_pack.hgnc is not None:
+        return knowledge_pack.hgnc
+    return _get_hgnc_genes()
+
+#interned, the gene population of the enrichment analyses
+@functools.lru_cache(maxsize=None)
+def _get_hgnc_genes_set():
+    return GeneSet(_get_hgnc_symbol_id().keys())
 
 #gene expression threshold
 EXP_THR = 1.5
 
 class TFTA:
-    def __init__(self):
+    def __init__(self, reg_index=None, pathway_matrix=None):
+        """
+        parameter
+        -----------
+        reg_index: bool or None, build the in-memory TF-target index.
+        If None, use the TFTA_REG_INDEX config option (default on unless the
+        knowledge pack holds the TF-target relation).
+        pathway_matrix: bool or None, build the sparse pathway-gene matrix.
+        If None, use the TFTA_PATHWAY_MATRIX config option (default on).
+        """
+        #the databases, sets and indexes are loaded concurrently, see startup.py
+        if reg_index is None:
+            reg_index = _get_config_flag('TFTA_REG_INDEX', None)
+        if pathway_matrix is None:
+            pathway_matrix = _get_config_flag('TFTA_PATHWAY_MATRIX', True)
+        loader = StartupLoader('TFTA')
+        #the tasks using the databases give the connection of their thread
+        #back to the pools when they end, see _released
+        loader.add('knowledge_pack', _get_knowledge_pack)
+        loader.add('tfdb', self._released(self._load_tfdb), ['knowledge_pack'])
+        loader.add('ldd', self._released(self._load_ldd), ['knowledge_pack'])
+        loader.add('hgnc', lambda pack: _get_hgnc_genes_set(), ['knowledge_pack'])
+        #gene expression in tissues, including the exclusive expression
+        loader.add('tissue_matrix', self._released(lambda tfdb: TissueMatrix.from_db(tfdb, EXP_THR) \
+                   if tfdb is not None else None), ['tfdb'])
+        loader.add('trans_factor', self._released(lambda tfdb: self.tf_set()), ['tfdb'])
+        loader.add('mirna', self._released(lambda tfdb: self.mirna_set()), ['tfdb'])
+        #for miRNA clarification
+        loader.add('mirna_index', MirnaIndex, ['mirna'])
+        #TF-target bitset index for multi-gene queries, by default only
+        #built if the knowledge pack doesn't hold the TF-target relation
+        loader.add('reg_index', self._released(lambda tfdb, pack: _load_reg_index(tfdb, pack, reg_index)),
+                   ['tfdb', 'knowledge_pack'])
+        #pathway-gene matrix for pathway overlap queries
+        loader.add('pathway_matrix', self._released(lambda tfdb: PathwayMatrix.from_db(tfdb) \
+                   if pathway_matrix and tfdb is not None else None), ['tfdb'])
+        res = loader.run()
+        
+        self.tissue_matrix = res['tissue_matrix']
+        self.trans_factor = res['trans_factor']
+        self.mirna = res['mirna']
+        self.mirna_index = res['mirna_index']
+        self.reg_index = res['reg_index']
+        self.pathway_matrix = res['pathway_matrix']
+        
+    def _released(self, load):
+        """
+        Wrap a startup task so that the connections its thread opened go
+        back to the database pools when it ends, to be reused by the other
+        threads instead of opening new ones.
+        """
+        def task(*deps):
+            try:
+                return load(*deps)
+            finally:
+                for pool in [getattr(self, 'tfdb', None), getattr(self, 'ldd', None)]:
+                    if isinstance(pool, storage.ConnectionPool):
+                        pool.release()
+        return task
+        
+    def _load_tfdb(self, pack):
         #Load TF_target database
         self.tfdb = self.load_db()
         if self.tfdb:
             self.tfdb.row_factory = sqlite3.Row
-        
+        return self.tfdb
+    
+    def _load_ldd(self, pack):
         self.ldd = self.load_ldd_db()
         if self.ldd:
             self.ldd.row_factory = sqlite3.Row
-        
-        #for exclusive query
-        self.tissue_gene_exclusive = defaultdict(set)
-        self.trans_factor = self.tf_set()
-        self.mirna = self.mirna_set()
+        return self.ldd
         
     def __del__(self):
         self.tfdb.close()
+        if self.ldd:
+            self.ldd.close()
 
     def Is_tf_target(self,tf_name,target_name):
         """
@@ -154,7 +244,7 @@ class TFTA:
                     return True
         else:
             try:
-                goids = go_map[go_name]
+                goids = _get_go_map()[go_name]
             except KeyError:
                 raise GONotFoundException
             if self.tfdb is not None:
@@ -174,18 +264,17 @@ class TFTA:
             if not self.trans_factor:
                 if self.tfdb is not None:
                     res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                    self.trans_factor = set([r[0] for r in res])
+                    self.trans_factor = GeneSet(r[0] for r in res)
             go_genes = list(self.trans_factor & set(gene_names))
         else:
             try:
-                goids = go_map[go_name]
+                goids = _get_go_map()[go_name]
             except KeyError:
                 raise GONotFoundException
             if self.tfdb is not None:
                 for go in goids:
-                    t = (go, )
-                    res = self.tfdb.execute("SELECT geneSymbol FROM go2Genes WHERE termId = ? ", t).fetchall()
-                    go_genes.extend([r[0] for r in res])
+                    go_genes.extend(batch_query.find_values(self.tfdb, 'go2Genes', 'termId',
+                                                            'geneSymbol', go))
                 go_genes = list(set(go_genes) & set(gene_names))
         return go_genes
 
@@ -209,33 +298,20 @@ class TFTA:
         """
         #query
         dbname = dict()
-        if self.tfdb is not None:
-            t = (target_names[0],)
-            res = self.tfdb.execute("SELECT DISTINCT TF,dbnames FROM CombinedDB "
-                                    "WHERE Target = ? ", t).fetchall()
-            if res:
-                tf_names = set([r[0] for r in res])
-                for r in res:
-                    dbname[(r[0],target_names[0])] = r[1]
-            else:
-                raise TargetNotFoundException 
-            if len(target_names)>1:
-                for i in range(1,len(target_names)):
-                    t = (target_names[i],)
-                    res = self.tfdb.execute("SELECT DISTINCT TF,dbnames FROM CombinedDB "
-                                            "WHERE Target = ? ", t).fetchall()
-                    if res:
-                        tf_names = tf_names & set([r[0] for r in res])
-                        for r in res:
-                            dbname[(r[0],target_names[i])] = r[1]
-                    else:
-                        raise TargetNotFoundException
-            #make the results consistent in both db and TF list
-            if len(tf_names):
-                #tf_names.sort()
-                tf_names = tf_names.intersection(self.trans_factor)
+        if self.reg_index is not None:
+            tf_bits = self.reg_index.common_tfs(target_names)
+            if tf_bits is None:
+                raise TargetNotFoundException
+            tf_names = set(self.reg_index.tf_names(tf_bits))
+        elif self.tfdb is not None:
+            tf_names = batch_query.find_common(self.tfdb, 'CombinedDB', 'Target', 'TF', target_names)
+            if tf_names is None:
+                raise TargetNotFoundException
         else:
-            tf_names = set()
+            return set(),dbname
+        #make the results consistent in both db and TF list
+        tf_names = self.trans_factor.intersection(tf_names)
+        dbname = self.find_dbnames(tf_names, target_names)
         return tf_names,dbname
         
     def find_common_tfs(self,target_names):
@@ -247,15 +323,13 @@ class TFTA:
         if self.tfdb is not None:
             target_names = list(set(target_names))
             thr = max(2, math.ceil(len(target_names)/2))
-            for target_name in target_names:
-                t = (target_name,)
-                res = self.tfdb.execute("SELECT DISTINCT TF FROM CombinedDB "
-                                        "WHERE Target = ? ", t).fetchall()
-                if res:
-                    tfs = [r[0] for r in res]
-                    for tf in tfs:
-                        tf_targets[tf].append(target_name)
-                        counts[tf] += 1
+            if self.reg_index is not None:
+                hits = self.reg_index.tf_target_hits(target_names).items()
+            else:
+                hits = batch_query.group_values(self.tfdb, 'CombinedDB', 'Target', 'TF', target_names)
+            for tf, targets in hits:
+                tf_targets[tf] = targets
+                counts[tf] = len(targets)
             if len(tf_targets):
                 max_count = max(counts.values())
                 if max_count >= thr:
@@ -310,34 +384,13 @@ class TFTA:
         """
         pathwayName = dict()
         dblink = dict()
-        fnum = 0
         if self.tfdb is not None:
-            pathlist = []
-            if gene_names:
-                ids = self.find_pathwayID_genes(gene_names)
-                if ids:
-                    pathlist.extend(ids)
-                else:
-                    raise PathwayNotFoundException
-                
-            if fmembers:
-                fnum = len(fmembers)
-                ids = self.find_pathwayID_families(fmembers)
-                if ids:
-                    pathlist.extend(ids)
-                else:
-                    raise PathwayNotFoundException
-            
-            #Take intersection
-            id_count = Counter(pathlist)
-            for id in id_count:
-                if id_count[id] == (len(gene_names) + fnum):
-                    t = (id, dbsource)
-                    res = self.tfdb.execute("SELECT pathwayName,dblink FROM pathwayInfo "
-                                            "WHERE Id = ? AND source LIKE ?", t).fetchone()
-                    if res:
-                        pathwayName[id] = res['pathwayName']
-                        dblink[id] = res['dblink']
+            ids = self.find_common_pathwayIDs(gene_names, fmembers)
+            res = batch_query.find_rows(self.tfdb, 'pathwayInfo', 'Id', ids, 'Id,pathwayName,dblink',
+                                        ' AND source LIKE ?', (dbsource,))
+            for r in res:
+                pathwayName[r[0]] = r[1]
+                dblink[r[0]] = r[2]
             if not pathwayName:
                 raise PathwayNotFoundException
         return pathwayName,dblink
@@ -354,7 +407,8 @@ class TFTA:
                 regstr = '%' + pathway_name + '%'
                 t = (regstr,)
                 res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                    "WHERE pathwayName LIKE ? ", t).fetchall()
+                                    "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                    "WHERE pathwayName LIKE ?)", t).fetchall()
                 if res:
                     for r in res:
                         pathwayName[r[0]] = r[1]
@@ -383,7 +437,8 @@ class TFTA:
                 regstr = '%' + pathway_name + '%'
                 t = (regstr,)
                 res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                        "WHERE pathwayName LIKE ? ", t).fetchall()
+                                        "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                        "WHERE pathwayName LIKE ?)", t).fetchall()
                 if res:
                     for r in res:
                         pathwayName[r[0]] = r[1]
@@ -433,15 +488,14 @@ class TFTA:
         dblink = dict()
         kinaselist = dict()
         if self.tfdb is not None:
-            t = ('kinase',)
-            res = self.tfdb.execute("SELECT DISTINCT geneSymbol FROM go2Genes "
-                                        "WHERE termId = ? ", t).fetchall()
-            kinases = set([r[0] for r in res])
+            kinases = set(batch_query.find_values(self.tfdb, 'go2Genes', 'termId',
+                                                  'geneSymbol', 'kinase'))
             for pathway_name in pathway_names:
                 regstr = '%' + pathway_name + '%'
                 t = (regstr,)
                 res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                        "WHERE pathwayName LIKE ? ", t).fetchall()
+                                        "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                        "WHERE pathwayName LIKE ?)", t).fetchall()
                 if res:
                     for r in res:
                         pathwayName[r[0]] = r[1]
@@ -472,69 +526,40 @@ class TFTA:
         """
         pathwayName = dict()
         dblink = dict()
-        fnum = 0
         if self.tfdb is not None:
-            pathlist=[]
-            if gene_names:
-                ids = self.find_pathwayID_genes(gene_names)
-                if ids:
-                    pathlist.extend(ids)
-                else:
-                    raise PathwayNotFoundException
-            #Take OR operation on family members
-            if fmembers:
-                fnum = len(fmembers)
-                ids = self.find_pathwayID_families(fmembers)
-                if ids:
-                    pathlist.extend(ids)
-                else:
-                    raise PathwayNotFoundException
-            #Take intersection
-            id_count = Counter(pathlist)
-            for id in id_count:
-                if id_count[id] == (len(gene_names) + fnum):
-                    t = (id,)
-                    res = self.tfdb.execute("SELECT pathwayName,dblink FROM pathwayInfo "
-                                            "WHERE Id = ? ", t).fetchone()
-                    pathwayName[id] = res['pathwayName']
-                    dblink[id] = res['dblink']
+            ids = self.find_common_pathwayIDs(gene_names, fmembers)
+            res = batch_query.find_rows(self.tfdb, 'pathwayInfo', 'Id', ids, 'Id,pathwayName,dblink')
+            for r in res:
+                pathwayName[r[0]] = r[1]
+                dblink[r[0]] = r[2]
             if not pathwayName:
                 raise PathwayNotFoundException
         return pathwayName,dblink
     
-    def find_pathwayID_genes(self, gene_names):
-        ids = []
-        for gene_name in gene_names:
-            t = (gene_name,)
-            res1 = self.tfdb.execute("SELECT DISTINCT pathwayID FROM pathway2Genes "
-                                     "WHERE genesymbol = ? ", t).fetchall()
-            if res1:
-                ids.extend([r[0] for r in res1])
-            else:
-                return None
-        return ids
-    
-    def find_pathwayID_families(self, fmembers):
+    def find_common_pathwayIDs(self, gene_names, fmembers=None):
         """
-        Take OR operation for family members.
+        Return the IDs of the pathways containing all the given genes and at least
+        one member of each family. Take OR operation for family members.
         
         parameter
         ----------
+        gene_names: list of gene symbols
         fmembers: dict, family name as key and list of Agent for members as value
         """
-        ids = []
-        for f in fmembers:
-            fid = set()
-            for m in fmembers[f]:
-                t = (m.name, )
-                res1 = self.tfdb.execute("SELECT DISTINCT pathwayID FROM pathway2Genes "
-                                         "WHERE genesymbol = ? ", t).fetchall()
-                if res1:
-                    fid = fid.union(set([r[0] for r in res1]))
-            if fid:
-                ids.extend(list(fid))
-            else:
-                return None
+        ids = None
+        if gene_names:
+            ids = batch_query.find_common(self.tfdb, 'pathway2Genes', 'genesymbol', 'pathwayID', gene_names)
+            if not ids:
+                raise PathwayNotFoundException
+        if fmembers:
+            for f in fmembers:
+                fid = batch_query.find_any(self.tfdb, 'pathway2Genes', 'genesymbol', 'pathwayID',
+                                           [m.name for m in fmembers[f]])
+                if not fid:
+                    raise PathwayNotFoundException
+                ids = fid if ids is None else ids & fid
+        if not ids:
+            raise PathwayNotFoundException
         return ids
         
 
@@ -551,7 +576,8 @@ class TFTA:
                 regstr = '%' + pathway_name + '%'
                 t = (regstr,)
                 res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                    "WHERE pathwayName LIKE ? ", t).fetchall()
+                                    "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                    "WHERE pathwayName LIKE ?)", t).fetchall()
                 if res:
                     for r in res:
                         pn[r[0]] = r[1]
@@ -583,36 +609,14 @@ class TFTA:
         """
         pathwayName = dict()
         dblink = dict()
-        fnum = 0
         if self.tfdb is not None:
-            pathlist = []
-            if gene_names:
-                ids = self.find_pathwayID_genes(gene_names)
-                if ids:
-                    pathlist.extend(ids)
-                else:
-                    raise PathwayNotFoundException
-                
-            #Take OR operation on family members
-            if fmembers:
-                fnum = len(fmembers)
-                ids = self.find_pathwayID_families(fmembers)
-                if ids:
-                    pathlist.extend(ids)
-                else:
-                    raise PathwayNotFoundException
-                        
-            #intersection
-            id_count = Counter(pathlist)
+            ids = self.find_common_pathwayIDs(gene_names, fmembers)
             regstr = '%' + keyword + '%'
-            for id in id_count:
-                if id_count[id] == (len(gene_names) + fnum):
-                    t = (id, regstr)
-                    res = self.tfdb.execute("SELECT pathwayName,dblink FROM pathwayInfo "
-                                            "WHERE Id = ? AND pathwayName LIKE ? ", t).fetchone()
-                    if res:
-                        pathwayName[id] = res['pathwayName']
-                        dblink[id] = res['dblink']
+            res = batch_query.find_rows(self.tfdb, 'pathwayInfo', 'Id', ids, 'Id,pathwayName,dblink',
+                                        ' AND pathwayName LIKE ?', (regstr,))
+            for r in res:
+                pathwayName[r[0]] = r[1]
+                dblink[r[0]] = r[2]
             
             if not len(dblink):
                 raise PathwayNotFoundException
@@ -628,7 +632,8 @@ class TFTA:
             regstr = '%' + keyword + '%'
             t = (regstr,)
             res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                    "WHERE pathwayName LIKE ? ORDER BY pathwayName", t).fetchall()
+                                    "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                    "WHERE pathwayName LIKE ?) ORDER BY pathwayName", t).fetchall()
             if res:
                 for r in res:
                     pathwayName[r[0]] = r[1]
@@ -649,7 +654,8 @@ class TFTA:
             regstr = '%' + keyword_name + '%'
             t = (regstr,)
             res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                    "WHERE pathwayName LIKE ? ", t).fetchall()
+                                    "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                    "WHERE pathwayName LIKE ?)", t).fetchall()
             if res:
                 pathwayId = [r[0] for r in res]
                 pathwayName = [r[1] for r in res]
@@ -661,7 +667,7 @@ class TFTA:
                                              "WHERE pathwayID = ? ", t).fetchall()
                     genes = [r[0] for r in res1]
                     #intersection with TF list
-                    genes = set(genes).intersection(self.trans_factor)
+                    genes = self.trans_factor.intersection(genes)
                     if genes:
                         tflist[pthID] = genes
                         newpathwayName[pthID] = pn
@@ -673,83 +679,66 @@ class TFTA:
             raise PathwayNotFoundException
         return newpathwayName,tflist,newdblink
 
-    def find_common_pathway_genes(self, gene_names, fmembers=None, limit=30):
+    def find_common_pathway_genes(self, gene_names, fmembers=None, limit=30, keyword=None, db_name=None):
         """
-        For a given gene list, find the pathways containing some of the genes,
+        For a given gene list, find the pathways containing at least two of the genes,
         and the corresponding genes contained in each of the pathways
         
         parameter
         -----------
         gene_names: list of genes
         fmembers: dict, family name as key, the list of Agent for members as value
+        limit: int, max number of pathways returned, the pathways with most genes are kept
+        keyword: str, only the pathways whose name contains the keyword
+        db_name: str, only the pathways from the database
+        """
+        if self.tfdb is None:
+            return dict(),dict(),dict()
+        if self.pathway_matrix is not None:
+            pathwayName,dblink,genes = self.pathway_matrix.find_common(gene_names, fmembers, limit,
+                                                                       keyword, db_name)
+        else:
+            where = ''
+            params = ()
+            if keyword:
+                where += ' AND pathwayName LIKE ?'
+                params += ('%' + keyword + '%',)
+            if db_name:
+                where += ' AND source LIKE ?'
+                params += (db_name,)
+            pathwayName,dblink,genes = self._find_common_pathway_genes_filter(gene_names, fmembers,
+                                                                              limit, where, params)
+        if not len(genes):
+            raise PathwayNotFoundException
+        return pathwayName,dblink,genes
+    
+    def count_pathway_genes(self, gene_names, fmembers=None):
+        """
+        For each pathway containing some of the genes or families, return the
+        contained genes (families) and their count
         """
-        num = 0
-        pathwayName = dict()
-        dblink = dict()
         genes = defaultdict(list)
-        fgenes = defaultdict(list)
         counts = defaultdict(int)
-        if self.tfdb is not None:
-            if gene_names:
-                gene_names = list(set(gene_names))
-                for gene_name in gene_names:
-                    t = (gene_name,)
-                    res1 = self.tfdb.execute("SELECT DISTINCT pathwayID FROM pathway2Genes "
-                                             "WHERE genesymbol = ? ", t).fetchall()
-                    if res1:
-                        for r in res1:
-                            genes[r[0]].append(gene_name)
-                            counts[r[0]] += 1
-
-            if fmembers:
-                #OR operation on members of one family
-                gene1,count1 = self.get_pathwayID_families(fmembers)
-                #logger.info('tfta:find_common_pathway_genes:gene1=' + str(gene1))
-                if gene1:
-                    genes = merge_dict_sum(gene1, genes)
-                if count1:
-                    counts = merge_dict_sum(count1, counts)
-            #logger.info('tfta:find_common_pathway_genes:after: genes=' + str(genes))
-            
-            if len(genes):
-                max_count = max(counts.values())
-                sorted_counts = sorted(counts.items(),key=lambda kv: kv[1], reverse=True)
-                if max_count >= 2:
-                    for pth, ct in sorted_counts:
-                        if ct >= 2:
-                            num += 1
-                            if num > limit:
-                                break
-                            fgenes[pth] = genes[pth]
-                        else:
-                            break
-                else:
-                    raise PathwayNotFoundException
-            else:
-                raise PathwayNotFoundException
-            if len(fgenes):
-                for pth in fgenes:
-                    t = (pth,)
-                    res = self.tfdb.execute("SELECT pathwayName, dblink FROM pathwayInfo "
-                                            "WHERE Id = ? ", t).fetchone()
-                    pathwayName[pth] = res['pathwayName']
-                    dblink[pth] = res['dblink']
-            else:
-                raise PathwayNotFoundException
-        return pathwayName,dblink,fgenes
+        if gene_names:
+            for pth, pgenes in batch_query.group_values(self.tfdb, 'pathway2Genes', 'genesymbol',
+                                                        'pathwayID', gene_names):
+                genes[pth] = pgenes
+                counts[pth] = len(pgenes)
+        if fmembers:
+            #OR operation on members of one family
+            gene1,count1 = self.get_pathwayID_families(fmembers)
+            if gene1:
+                genes = merge_dict_sum(gene1, genes)
+            if count1:
+                counts = merge_dict_sum(count1, counts)
+        return genes,counts
     
     def get_pathwayID_families(self, fmembers, pathIDs=None):
         gene = defaultdict(list)
         count = defaultdict(int)
         for f in fmembers:
-            fid = set()
-            for m in fmembers[f]:
-                t = (m.name,)
-                #logger.info('get_pathwayID_families: m.name=' + m.name)
-                res1 = self.tfdb.execute("SELECT DISTINCT pathwayID FROM pathway2Genes "
-                                         "WHERE genesymbol = ? ", t).fetchall()
-                if res1:
-                    fid.union(set([r[0] for r in res1]))
+            fid = batch_query.find_any(self.tfdb, 'pathway2Genes', 'genesymbol', 'pathwayID',
+                                       [m.name for m in fmembers[f]])
             if fid:
                 if pathIDs:
                     fid = fid.intersection(pathIDs)
@@ -763,313 +752,35 @@ class TFTA:
         For a given gene list and keyword, find the pathways containing some of the genes,
         and return the corresponding given genes in each of the pathways 
         """
-        num = 0
-        pathwayName = dict()
-        dblink = dict()
-        counts = defaultdict(int)
-        genes = defaultdict(list)
-        fgenes = dict()
-        if self.tfdb is not None:
-            if gene_names:
-                gene_names = list(set(gene_names))
-                for gene_name in gene_names:
-                    t = (gene_name,)
-                    res1 = self.tfdb.execute("SELECT DISTINCT pathwayID FROM pathway2Genes "
-                                             "WHERE genesymbol = ? ", t).fetchall()
-                    if res1:
-                        for r in res1:
-                            genes[r[0]].append(gene_name)
-                            counts[r[0]] += 1
-            if fmembers:
-                #OR operation on members of one family
-                gene1,count1 = self.get_pathwayID_families(fmembers)
-                #logger.info('tfta:find_common_pathway_genes_keyword:gene1=' + str(gene1))
-                if gene1:
-                    genes = merge_dict_sum(gene1, genes)
-                if count1:
-                    counts = merge_dict_sum(count1, counts)
-            
-            if len(genes):
-                max_count = max(counts.values())
-                sorted_counts = sorted(counts.items(),key=lambda kv: kv[1], reverse=True)
-                if max_count >= 2:
-                    regstr = '%' + keyword + '%'
-                    for pth, ct in sorted_counts:
-                        if ct >= 2:
-                            t = (pth, regstr)
-                            res = self.tfdb.execute("SELECT pathwayName, dblink FROM pathwayInfo "
-                                            "WHERE Id = ? AND pathwayName LIKE ?", t).fetchone()
-                            if res:
-                                pathwayName[pth] = res['pathwayName']
-                                dblink[pth] = res['dblink']
-                                fgenes[pth] = genes[pth]
-                                num += 1
-                                if num > limit:
-                                    break
-                        else:
-                            break
-                else:
-                    raise PathwayNotFoundException
-            else:
-                raise PathwayNotFoundException
-        return pathwayName,dblink,fgenes
-        
-    def find_common_pathway_genes_keyword2(self, gene_names, keyword, fmembers=None, limit=30):
-        """
-        For a given gene list and keyword, find the pathways containing some of the genes,
-        and return the corresponding given genes in each of the pathways
-        Check pathway name first, then check genes. This method aims to handle large gene list.
-        """
-        num = 0
-        pathwayName = dict()
-        dblink = dict()
-        counts = defaultdict(int)
-        genes = dict()
-        fgenes = dict()
-        temp = defaultdict(dict)
-        if self.tfdb is not None:
-            #find pathways whose names contain the keyword
-            regstr = '%' + keyword + '%'
-            t = (regstr, )
-            res = self.tfdb.execute("SELECT Id, pathwayName, dblink FROM pathwayInfo "
-                                    "WHERE pathwayName LIKE ?", t).fetchall()
-            if res:
-                for r in res:
-                    temp[r[0]]['name'] = r[1]
-                    temp[r[0]]['dblink'] = r[2]
-            
-            #find the pathways containing the given genes in the selected pathways 
-            if gene_names:
-                gene_names = set(gene_names)
-                for pth in temp.keys():
-                    t = (pth,)
-                    res1 = self.tfdb.execute("SELECT DISTINCT genesymbol FROM pathway2Genes "
-                                             "WHERE pathwayID = ? ", t).fetchall()
-                    ovg = gene_names.intersection(set([r[0] for r in res1]))
-                    if len(ovg) > 1:
-                        genes[pth] = ovg
-                        counts[pth] = len(ovg)
-            if fmembers:
-                #OR operation on members of one family
-                gene1,count1 = self.get_pathwayID_families(fmembers, pathIDs=set(temp.keys()))
-                #logger.info('tfta:find_common_pathway_genes_keyword:gene1=' + str(gene1))
-                if gene1:
-                    genes = merge_dict_sum(gene1, genes)
-                if count1:
-                    counts = merge_dict_sum(count1, counts)
-            
-            if len(genes):
-                max_count = max(counts.values())
-                sorted_counts = sorted(counts.items(),key=lambda kv: kv[1], reverse=True)
-                if max_count >= 2:
-                    for pth, ct in sorted_counts:
-                        if ct >= 2:
-                            pathwayName[pth] = temp[pth]['name']
-                            dblink[pth] = temp[pth]['dblink']
-                            fgenes[pth] = genes[pth]
-                            num += 1
-                            if num > limit:
-                                break
-                        else:
-                            break
-                else:
-                    raise PathwayNotFoundException
-            else:
-                raise PathwayNotFoundException
-        return pathwayName,dblink,fgenes
+        return self.find_common_pathway_genes(gene_names, fmembers, limit, keyword=keyword)
         
     def find_common_pathway_genes_db(self, gene_names, db_name, fmembers=None, limit=30):
         """
         For a given gene list and db name, find the pathways containing at least two of 
         the genes, and return the corresponding given genes in each of the pathways 
         """
-        num = 0
-        pathwayName = dict()
-        dblink = dict()
-        counts = defaultdict(int)
-        genes = defaultdict(list)
-        fgenes = dict()
-        if self.tfdb is not None:
-            if gene_names:
-                gene_names = list(set(gene_names))
-                for gene_name in gene_names:
-                    t = (gene_name,)
-                    res1 = self.tfdb.execute("SELECT DISTINCT pathwayID FROM pathway2Genes "
-                                         "WHERE genesymbol = ? ", t).fetchall()
-                    if res1:
-                        for r in res1:
-                            genes[r[0]].append(gene_name)
-                            counts[r[0]] += 1
-            if fmembers:
-                #OR operation on members of one family
-                gene1,count1 = self.get_pathwayID_families(fmembers)
-                #logger.info('tfta:find_common_pathway_genes_db:gene1=' + str(gene1))
-                if gene1:
-                    genes = merge_dict_sum(gene1, genes)
-                if count1:
-                    counts = merge_dict_sum(count1, counts)
-            
-            if len(genes):
-                max_count = max(counts.values())
-                sorted_counts = sorted(counts.items(),key=lambda kv: kv[1], reverse=True)
-                if max_count >= 2:
-                    for pth, ct in sorted_counts:
-                        if ct >= 2:
-                            t = (pth, db_name)
-                            res = self.tfdb.execute("SELECT pathwayName, dblink FROM pathwayInfo "
-                                            "WHERE Id = ? AND source LIKE ?", t).fetchone()
-                            if res:
-                                pathwayName[pth] = res['pathwayName']
-                                dblink[pth] = res['dblink']
-                                fgenes[pth] = genes[pth]
-                                num += 1
-                                if num > limit:
-                                    break
-                        else:
-                            break
-                else:
-                    raise PathwayNotFoundException
-            else:
-                raise PathwayNotFoundException
-        return pathwayName, dblink, fgenes
-        
-    def find_common_pathway_genes_db2(self, gene_names, db_name, fmembers=None, limit=30):
+        return self.find_common_pathway_genes(gene_names, fmembers, limit, db_name=db_name)
+    
+    def _find_common_pathway_genes_filter(self, gene_names, fmembers, limit, where, params):
         """
-        For a given gene list and db name, find the pathways containing at least two of 
-        the genes, and return the corresponding given genes in each of the pathways.
-        Check pathway source first, then check genes. This method aims to handle large gene list.
+        Find the pathways containing at least two of the genes and meeting the
+        pathwayInfo condition in where, sorted by the number of genes
         """
-        num = 0
         pathwayName = dict()
         dblink = dict()
-        counts = defaultdict(int)
-        genes = defaultdict(list)
         fgenes = dict()
-        temp = defaultdict(dict)
-        if self.tfdb is not None:
-            t = (db_name,)
-            res = self.tfdb.execute("SELECT Id, pathwayName, dblink FROM pathwayInfo "
-                                    "WHERE source LIKE ?", t).fetchall()
-            if res:
-                for r in res:
-                    temp[r[0]]['name'] = r[1]
-                    temp[r[0]]['dblink'] = r[2]
-            
-            if gene_names:
-                gene_names = set(gene_names)
-                for pth in temp.keys():
-                    t = (pth,)
-                    res1 = self.tfdb.execute("SELECT DISTINCT genesymbol FROM pathway2Genes "
-                                         "WHERE pathwayID= ? ", t).fetchall()
-                    ovg = gene_names.intersection(set([r[0] for r in res1]))
-                    if len(ovg) >= 2:
-                        genes[pth] = ovg
-                        counts[pth] = len(ovg)
-            if fmembers:
-                #OR operation on members of one family
-                gene1,count1 = self.get_pathwayID_families(fmembers, pathIDs=set(temp.keys()))
-                #logger.info('tfta:find_common_pathway_genes_db:gene1=' + str(gene1))
-                if gene1:
-                    genes = merge_dict_sum(gene1, genes)
-                if count1:
-                    counts = merge_dict_sum(count1, counts)
-            
-            if len(genes):
-                max_count = max(counts.values())
-                sorted_counts = sorted(counts.items(),key=lambda kv: kv[1], reverse=True)
-                if max_count >= 2:
-                    for pth, ct in sorted_counts:
-                        if ct >= 2:
-                            pathwayName[pth] = temp[pth]['name']
-                            dblink[pth] = temp[pth]['dblink']
-                            fgenes[pth] = genes[pth]
-                            num += 1
-                            if num > limit:
-                                break
-                        else:
-                            break
-                else:
-                    raise PathwayNotFoundException
-            else:
-                raise PathwayNotFoundException
-        return pathwayName, dblink, fgenes
-
-    def find_common_pathway_genes_db3(self, gene_names, db_name, fmembers=None, limit=30):
-        """
-        For a given gene list and db name, find the pathways containing at least two of 
-        the genes, and return the corresponding given genes in each of the pathways.
-        Check pathway source first, ignore familiy, then check genes and when it find the limit number of
-        pathways it will return instead of checking all the pathways. 
-        This method aims to handle large gene list.
-        """
-        num = 0
-        pathwayName = dict()
-        dblink = dict()
-        genes = defaultdict(list)
-        temp = defaultdict(dict)
-        numgene = dict()
-        if self.tfdb is not None:
-            t = (db_name,)
-            res = self.tfdb.execute("SELECT Id, pathwayName, dblink, numGenes FROM pathwayInfo "
-                                    "WHERE source LIKE ?", t).fetchall()
-            if res:
-                for r in res:
-                    temp[r[0]]['name'] = r[1]
-                    temp[r[0]]['dblink'] = r[2]
-                    numgene[r[0]] = r[3]
-            if numgene:
-                gene_names = set(gene_names)
-                sorted_numgene = sorted(numgene.items(),key=lambda kv: kv[1], reverse=True)
-                for pth,numg in sorted_numgene:
-                    t = (pth,)
-                    res1 = self.tfdb.execute("SELECT DISTINCT genesymbol FROM pathway2Genes "
-                                             "WHERE pathwayID= ? ", t).fetchall()
-                    ovg = gene_names.intersection(set([r[0] for r in res1]))
-                    if len(ovg) > 2:
-                        genes[pth] = ovg
-                        #counts[pth] = len(ovg)
-                        pathwayName[pth] = temp[pth]['name']
-                        dblink[pth] = temp[pth]['dblink']
-                        num += 1
-                        if num > limit:
-                            break
-            else:
-                raise PathwayNotFoundException
-        return pathwayName, dblink, genes
-
-    def find_common_pathway_genes_db4(self, gene_names, db_name, fmembers=None, limit=30):
-        """
-        For a given gene list and db name, find the pathways containing at least two of 
-        the genes, and return the corresponding given genes in each of the pathways.
-        Check pathway source first, ignore familiy, then check genes and when it find the limit number of
-        pathways it will return instead of checking all the pathways. 
-        This method aims to handle large gene list.
-        """
-        num = 0
-        pathwayName = dict()
-        dblink = dict()
-        genes = defaultdict(list)
-        gene_names = set(gene_names)
-        if self.tfdb is not None:
-            t = (db_name,)
-            res = self.tfdb.execute("SELECT Id, pathwayName, dblink FROM pathwayInfo "
-                                    "WHERE source LIKE ? ORDER BY numGenes DESC", t).fetchall()
-            if res:
-                for r in res:
-                    t = (r[0],)
-                    res1 = self.tfdb.execute("SELECT DISTINCT genesymbol FROM pathway2Genes "
-                                             "WHERE pathwayID= ? ", t).fetchall()
-                    ovg = gene_names.intersection(set([r1[0] for r1 in res1]))
-                    if len(ovg) > 2:
-                        genes[r[0]] = ovg
-                        pathwayName[r[0]] = r[1]
-                        dblink[r[0]] = r[2]
-                        num += 1
-                        if num > limit:
-                            break
-            else:
-                raise PathwayNotFoundException
-        return pathwayName, dblink, genes
+        genes,counts = self.count_pathway_genes(gene_names, fmembers)
+        pths = [pth for pth, ct in counts.items() if ct >= 2]
+        if pths:
+            res = batch_query.find_rows(self.tfdb, 'pathwayInfo', 'Id', pths,
+                                        'Id,pathwayName,dblink', where, params)
+            info = {r[0]: r for r in res}
+            pths = sorted([pth for pth in pths if pth in info], key=lambda pth: (-counts[pth], pth))
+            for pth in pths[:limit]:
+                pathwayName[pth] = info[pth]['pathwayName']
+                dblink[pth] = info[pth]['dblink']
+                fgenes[pth] = genes[pth]
+        return pathwayName,dblink,fgenes
 
     def find_targets(self,tf_names, fmembers=None):
         """
@@ -1078,41 +789,20 @@ class TFTA:
         dbname = dict()
         target_names = []
         if self.tfdb is not None:
+            targets = None
             if tf_names:
-                t = (tf_names[0],)
-                res = self.tfdb.execute("SELECT DISTINCT Target,dbnames FROM CombinedDB "
-                                        "WHERE TF = ? ", t).fetchall()
-                if res:
-                    target_names = [r[0] for r in res]
-                    for r in res:
-                        dbname[(tf_names[0],r[0])] = r[1]
-                else:
-                    raise TFNotFoundException
-                if len(tf_names) > 1:
-                    for i in range(1,len(tf_names)):
-                        t = (tf_names[i],)
-                        res = self.tfdb.execute("SELECT DISTINCT Target,dbnames FROM CombinedDB "
-                                                "WHERE TF = ? ", t).fetchall()
-                        if res:
-                            target_names = list(set(target_names) & set([r[0] for r in res]))
-                            for r in res:
-                                dbname[(tf_names[i],r[0])] = r[1]
-                        else:
-                            raise TFNotFoundException
-            #For families, not consider dbname for now
+                targets = set(self.find_common_targets(tf_names))
+            #For families, take OR operation on members
             if fmembers:
                 for f in fmembers:
-                    ftarget = set()
-                    for m in fmembers[f]:
-                        t = (m.name,)
-                        res = self.tfdb.execute("SELECT DISTINCT Target FROM CombinedDB "
-                                                "WHERE TF = ? ", t).fetchall()
-                        if res:
-                            ftarget = ftarget.union(set([r[0] for r in res]))
-                    if ftarget:
-                        target_names = list(set(target_names) & ftarget)
-                    else:
+                    ftarget = self.find_any_targets([m.name for m in fmembers[f]])
+                    if not ftarget:
                         raise TFNotFoundException
+                    targets = ftarget if targets is None else targets & ftarget
+            if targets:
+                target_names = list(targets)
+            if tf_names:
+                dbname = self.find_dbnames(tf_names, target_names)
         return target_names,dbname
 
     def find_targets_tissue(self,tf_names, tissue_name):
@@ -1150,23 +840,7 @@ class TFTA:
         res_go_names = []
         res_go_genes = dict()
         if self.tfdb is not None:
-            t = (tf_names[0],)
-            res = self.tfdb.execute("SELECT DISTINCT Target FROM CombinedDB "
-                                    "WHERE TF = ? ", t).fetchall()
-            if res:
-                target_names = [r[0] for r in res]
-            else:
-                raise TFNotFoundException
-                
-            if (len(tf_names)>1):
-                for i in range(1,len(tf_names)):
-                    t = (tf_names[i],)
-                    res = self.tfdb.execute("SELECT DISTINCT Target FROM CombinedDB "
-                                            "WHERE TF = ? ", t).fetchall()
-                    if res:
-                        target_names = list(set(target_names) & set([r[0] for r in res]))
-                    else:
-                        raise TFNotFoundException
+            target_names = self.find_common_targets(tf_names)
                                     
             regstr = '%' + go_name + '%'
             t = (regstr,)
@@ -1183,10 +857,9 @@ class TFTA:
                 
                 #search genes
                 for i in range(len(record_ids)):
-                    t = (record_ids[i],)
-                    res1 = self.tfdb.execute("SELECT DISTINCT geneSymbol FROM go2Genes "
-                                    "WHERE termId = ? ", t).fetchall()
-                    tmp = list(set(target_names) & set([r[0] for r in res1]))
+                    res1 = batch_query.find_values(self.tfdb, 'go2Genes', 'termId',
+                                                   'geneSymbol', record_ids[i])
+                    tmp = list(set(target_names) & set(res1))
                     if len(tmp):
                         res_go_ids.append(go_ids[i])
                         res_go_types.append(go_types[i])
@@ -1204,23 +877,7 @@ class TFTA:
         res_go_names = []
         res_go_genes = dict()
         if self.tfdb is not None:
-            t = (tf_names[0],)
-            res = self.tfdb.execute("SELECT DISTINCT Target FROM CombinedDB "
-                                    "WHERE TF = ? ", t).fetchall()
-            if res:
-                target_names = [r[0] for r in res]
-            else:
-                raise TFNotFoundException
-                
-            if (len(tf_names)>1):
-                for i in range(1,len(tf_names)):
-                    t = (tf_names[i],)
-                    res = self.tfdb.execute("SELECT DISTINCT Target FROM CombinedDB "
-                                            "WHERE TF = ? ", t).fetchall()
-                    if res:
-                        target_names = list(set(target_names) & set([r[0] for r in res]))
-                    else:
-                        raise TFNotFoundException
+            target_names = self.find_common_targets(tf_names)
                         
             #regstr = '%' + go_name + '%'
             t = (go_id,)
@@ -1235,10 +892,9 @@ class TFTA:
                 go_types = [r[3] for r in res]
                 #search genes
                 for i in range(len(record_id)):
-                    t = (record_id[i],)
-                    res1 = self.tfdb.execute("SELECT DISTINCT geneSymbol FROM go2Genes "
-                                             "WHERE termId = ? ", t).fetchall()
-                    tmp = list(set(target_names) & set([r[0] for r in res1]))
+                    res1 = batch_query.find_values(self.tfdb, 'go2Genes', 'termId',
+                                                   'geneSymbol', record_id[i])
+                    tmp = list(set(target_names) & set(res1))
                     if len(tmp):
                         res_go_ids.append(go_ids[i])
                         res_go_types.append(go_types[i])
@@ -1247,6 +903,45 @@ class TFTA:
                         res_go_genes[go_ids[i]] = tmp
         return res_go_ids,res_go_types,res_go_names,res_go_genes
 
+    def find_common_targets(self, tf_names):
+        """
+        Return the targets regulated by all the given TFs
+        """
+        if self.reg_index is not None:
+            target_bits = self.reg_index.common_targets(tf_names)
+            if target_bits is None:
+                raise TFNotFoundException
+            return self.reg_index.target_names(target_bits)
+        target_names = batch_query.find_common(self.tfdb, 'CombinedDB', 'TF', 'Target', tf_names)
+        if target_names is None:
+            raise TFNotFoundException
+        return list(target_names)
+        
+    def find_any_targets(self, tf_names):
+        """
+        Return the set of targets regulated by at least one of the given TFs
+        """
+        if self.reg_index is not None:
+            return set(self.reg_index.target_names(self.reg_index.any_targets(tf_names)))
+        return batch_query.find_any(self.tfdb, 'CombinedDB', 'TF', 'Target', tf_names)
+        
+    def find_dbnames(self, tf_names, target_names):
+        """
+        Return the dbnames of the regulations between tf_names and target_names
+        
+        output
+        ----------
+        dbname: dict, (tf, target) as key and dbnames as value
+        """
+        dbname = dict()
+        if self.tfdb is None or not tf_names or not target_names:
+            return dbname
+        res = batch_query.find_pairs(self.tfdb, 'CombinedDB', 'TF', 'Target', tf_names, target_names,
+                                     'DISTINCT TF,Target,dbnames')
+        for r in res:
+            dbname[(r[0],r[1])] = r[2]
+        return dbname
+        
     def Is_miRNA_target(self, miRNA_name_dict, target_name):
         """
         Return True if the miRNA regulates the target, and False if not;
@@ -1260,7 +955,8 @@ class TFTA:
         miRNA_name = list(miRNA_name_dict.keys())[0]
         if self.tfdb is not None:
             t = (miRNA_name, target_name)
-            res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ? "
+            res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
                                      "AND target = ? ", t).fetchall()
             if res:
                 for r in res:
@@ -1271,7 +967,8 @@ class TFTA:
             else:
                 #check if miRNA_name in the database
                 t = (miRNA_name,)
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ? ", t).fetchall()
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
                 if not res:
                     miRNA_mis[miRNA_name] = miRNA_name_dict[miRNA_name]
         return False, expr, supt, pmid, miRNA_mis
@@ -1290,10 +987,12 @@ class TFTA:
         if self.tfdb is not None:
             t = (miRNA_name, target_name, '%Weak%')
             if strength == 'strong':
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ? "
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
                                      "AND target = ? AND supportType NOT LIKE ?", t).fetchall()
             else:
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ? "
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
                                      "AND target = ? AND supportType LIKE ?", t).fetchall()
             if res:
                 for r in res:
@@ -1304,7 +1003,8 @@ class TFTA:
             else:
                 #check if miRNA_name in the database
                 t = (miRNA_name,)
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ? ", t).fetchone()
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchone()
                 if not res and (not miRNA_name[-1] in ['P', 'p']):
                     miRNA_mis[miRNA_name] = miRNA_name_dict[miRNA_name]
         return False, expr, supt, pmid, miRNA_mis
@@ -1318,36 +1018,25 @@ class TFTA:
         ----------
         target_names: list
         """
+        return self._find_miRNA_target(target_names)
+    
+    def _find_miRNA_target(self, target_names, where='', params=()):
         miRNAs = set()
         expr = defaultdict(list)
         supt = defaultdict(list)
         pmid = defaultdict(list)
         if self.tfdb is not None:
-            t = (target_names[0],)
-            res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE target = ? ", t).fetchall()
-            if res:
-                for r in res:
-                    miRNAs.add(r[1])
-                    expr[(r[1],target_names[0])].append(r[3])
-                    supt[(r[1],target_names[0])].append(r[4])
-                    pmid[(r[1],target_names[0])].append(str(r[5]))
-            else:
+            miRNAs = batch_query.find_common(self.tfdb, 'mirnaInfo', 'target', 'mirna',
+                                             target_names, where, params)
+            if miRNAs is None:
                 raise TargetNotFoundException
-            
-            if len(target_names)>1:
-                for i in range(1,len(target_names)):
-                    t = (target_names[i],)
-                    res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE target = ? ", t).fetchall()
-                    if res:
-                        miRNAs = miRNAs & set([r[1] for r in res])
-                        for r in res:
-                            expr[(r[1],target_names[i])].append(r[3])
-                            supt[(r[1],target_names[i])].append(r[4])
-                            pmid[(r[1],target_names[i])].append(str(r[5]))
-                    else:
-                        raise TargetNotFoundException
+            #evidence of the regulations found
+            res = batch_query.find_pairs(self.tfdb, 'mirnaInfo', 'target', 'mirna', target_names,
+                                         miRNAs, '*', where, params)
+            for r in res:
+                expr[(r[1],r[2])].append(r[3])
+                supt[(r[1],r[2])].append(r[4])
+                pmid[(r[1],r[2])].append(str(r[5]))
         return miRNAs,expr,supt,pmid
     
     def find_miRNA_target_strength(self, target_names, evidence_strength):
@@ -1359,56 +1048,11 @@ class TFTA:
         ----------
         target_names: list
         """
-        miRNAs = set()
-        expr = defaultdict(list)
-        supt = defaultdict(list)
-        pmid = defaultdict(list)
-        if self.tfdb is not None:
-            if evidence_strength == 'strong':
-                t = (target_names[0],'%Weak%')
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE target = ? AND supportType NOT LIKE ?", t).fetchall()
-            else:
-                t = (target_names[0], '%Weak%')
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE target = ? AND supportType LIKE ?", t).fetchall()
-            if res:
-                for r in res:
-                    miRNAs.add(r[1])
-                    expr[(r[1],target_names[0])].append(r[3])
-                    supt[(r[1],target_names[0])].append(r[4])
-                    pmid[(r[1],target_names[0])].append(str(r[5]))
-            else:
-                raise TargetNotFoundException
-            
-            if len(target_names)>1:
-                if evidence_strength == 'strong':
-                    for i in range(1,len(target_names)):
-                        t = (target_names[i],'%Weak%')
-                        res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE target = ? AND supportType NOT LIKE ?", t).fetchall()
-                        if res:
-                            miRNAs = miRNAs & set([r[1] for r in res])
-                            for r in res:
-                                expr[(r[1],target_names[i])].append(r[3])
-                                supt[(r[1],target_names[i])].append(r[4])
-                                pmid[(r[1],target_names[i])].append(str(r[5]))
-                        else:
-                            raise TargetNotFoundException
-                else:
-                    for i in range(1,len(target_names)):
-                        t = (target_names[i],'%Weak%')
-                        res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE target = ? AND supportType LIKE ?", t).fetchall()
-                        if res:
-                            miRNAs = miRNAs & set([r[1] for r in res])
-                            for r in res:
-                                expr[(r[1],target_names[i])].append(r[3])
-                                supt[(r[1],target_names[i])].append(r[4])
-                                pmid[(r[1],target_names[i])].append(str(r[5]))
-                        else:
-                            raise TargetNotFoundException
-        return miRNAs,expr,supt,pmid
+        if evidence_strength == 'strong':
+            where = ' AND supportType NOT LIKE ?'
+        else:
+            where = ' AND supportType LIKE ?'
+        return self._find_miRNA_target(target_names, where, ('%Weak%',))
     
     def find_target_miRNA(self, miRNA_name_dict):
         """
@@ -1427,8 +1071,8 @@ class TFTA:
         miRNA_names = list(miRNA_name_dict.keys())
         if self.tfdb is not None:
             t = (miRNA_names[0],)
-            res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? ", t).fetchall()
+            res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
             if res:
                 for r in res:
                     target_names.add(r[2])
@@ -1442,8 +1086,8 @@ class TFTA:
             if len(miRNA_names) > 1:
                 for i in range(1, len(miRNA_names)):
                     t = (miRNA_names[i],)
-                    res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? ", t).fetchall()
+                    res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
                     if res:
                         target_names = target_names & set([r[2] for r in res])
                         for r in res:
@@ -1477,8 +1121,9 @@ class TFTA:
         if self.tfdb is not None:
             if evidence_strength == 'strong':
                 t = (miRNA_names[0], '%Weak%')
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? AND supportType NOT LIKE ? ", t).fetchall()
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
+                                    "AND supportType NOT LIKE ? ", t).fetchall()
                 if res:
                     for r in res:
                         target_names.add(r[2])
@@ -1494,8 +1139,9 @@ class TFTA:
                 if len(miRNA_names)>1:
                     for i in range(1, len(miRNA_names)):
                         t = (miRNA_names[i], '%Weak%')
-                        res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? AND supportType NOT LIKE ?", t).fetchall()
+                        res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
+                                    "AND supportType NOT LIKE ?", t).fetchall()
                         if res:
                             target_names = target_names.intersection(set([r[2] for r in res]))
                             for r in res:
@@ -1511,8 +1157,9 @@ class TFTA:
                             break
             else:
                 t = (miRNA_names[0], '%Weak%')
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? AND supportType LIKE ? ", t).fetchall()
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
+                                    "AND supportType LIKE ? ", t).fetchall()
                 if res:
                     for r in res:
                         target_names.add(r[2])
@@ -1527,8 +1174,9 @@ class TFTA:
                 if len(miRNA_names)>1:
                     for i in range(1, len(miRNA_names)):
                         t = (miRNA_names[i], '%Weak%')
-                        res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? AND supportType LIKE ?", t).fetchall()
+                        res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
+                                    "AND supportType LIKE ?", t).fetchall()
                         if res:
                             target_names = target_names.intersection(set([r[2] for r in res]))
                             for r in res:
@@ -1548,7 +1196,8 @@ class TFTA:
         if self.tfdb is not None:
             t = (miRNA_name,)
             res = self.tfdb.execute("SELECT DISTINCT target FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? ", t).fetchall()
+                                    "WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
             if res:
                 return False
             else:
@@ -1567,7 +1216,7 @@ class TFTA:
                 if not self.trans_factor:
                     if self.tfdb is not None:
                         res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                        self.trans_factor = set([r[0] for r in res])
+                        self.trans_factor = GeneSet(r[0] for r in res)
                 tf_names = list(set(target_names) & self.trans_factor)
         return tf_names,miRNA_mis
     
@@ -1617,8 +1266,9 @@ class TFTA:
         miRNA_name = list(miRNA_name_dict.keys())[0]
         if self.tfdb is not None:
             t = (miRNA_name, target_name)
-            res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? AND target = ? ", t).fetchall()
+            res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                    "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) "
+                                    "AND target = ? ", t).fetchall()
             if res:
                 experiments = [r[3] for r in res]
                 support_types = [r[4] for r in res]
@@ -1626,8 +1276,8 @@ class TFTA:
             else:
                 #check if miRNA_name in the database
                 t = (miRNA_name,)
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                        "WHERE mirna LIKE ? ", t).fetchall()
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
                 if not res:
                     miRNA_mis[miRNA_name] = miRNA_name_dict[miRNA_name]
         return experiments, support_types, pmid_link, miRNA_mis
@@ -1652,10 +1302,12 @@ class TFTA:
         if self.tfdb is not None:
             t = (miRNA_name, target_name, '%Weak%')
             if strength == 'strong':
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ?"
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?))"
                                     " AND target = ? AND supportType NOT LIKE ?", t).fetchall()
             else:
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE mirna LIKE ?"
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?))"
                                     " AND target = ? AND supportType LIKE ?", t).fetchall()
             if res:
                 experiments = [r[3] for r in res]
@@ -1664,8 +1316,8 @@ class TFTA:
             else:
                 #check if miRNA_name in the database
                 t = (miRNA_name,)
-                res = self.tfdb.execute("SELECT * FROM mirnaInfo "
-                                        "WHERE mirna LIKE ? ", t).fetchall()
+                res = self.tfdb.execute("SELECT * FROM mirnaInfo WHERE rowid IN "
+                                        "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
                 if not res and (not miRNA_name[-1] in ['P', 'p']):
                     miRNA_mis[miRNA_name] = miRNA_name_dict[miRNA_name]
         return experiments, support_types, pmid_link, miRNA_mis
@@ -1677,37 +1329,17 @@ class TFTA:
         What(which of those) mirs most frequently or commonly regulate a list of genes
         """
         mirna_count = dict()
-        temp = []
         mir_targets = defaultdict(list)
         if self.tfdb is not None:
-            for gene_name in gene_names:
-                t = (gene_name,)
-                res1 = self.tfdb.execute("SELECT DISTINCT mirna FROM mirnaInfo "
-                                         "WHERE target = ? ", t).fetchall()
-                if res1:
-                    temp.extend([r[0].upper() for r in res1])
-                    for mir in [r[0].upper() for r in res1]:
-                        mir_targets[mir].append(gene_name)
-            if temp:
-                mcount = Counter(temp)
-                sorted_c = sorted(mcount.items(), key=operator.itemgetter(1), reverse=True)
-                num = 0
-                if of_those:
-                    for mir,count in sorted_c:
-                        if num < limit:
-                            if mir in of_those and count > 1:
-                                mirna_count[mir] = count
-                                num += 1
-                        else:
-                            break
-                else:
-                    for mir,count in sorted_c:
-                        if num < limit:
-                            if count > 1:
-                                mirna_count[mir] = count
-                                num += 1
-                        else:
-                            break
+            res = batch_query.group_values(self.tfdb, 'mirnaInfo', 'target', 'UPPER(mirna)', gene_names)
+            num = 0
+            for mir, targets in res:
+                mir_targets[mir] = targets
+                count = len(targets)
+                if num < limit and count > 1:
+                    if not of_those or mir in of_those:
+                        mirna_count[mir] = count
+                        num += 1
         return mirna_count,mir_targets
                          
     def find_gene_count_miRNA(self, miRNA_name_dict, of_those=None, limit=30):
@@ -1731,7 +1363,8 @@ class TFTA:
             for mir in miRNA_names:
                 t = (mir,)
                 res1 = self.tfdb.execute("SELECT DISTINCT target FROM mirnaInfo "
-                                         "WHERE mirna LIKE ? ", t).fetchall()
+                                         "WHERE rowid IN "
+                                         "(SELECT rid FROM mirnaKey WHERE key = UPPER(?)) ", t).fetchall()
                 if res1:
                     temp.extend([r[0] for r in res1])
                     for target in [r[0] for r in res1]:
@@ -1772,7 +1405,8 @@ class TFTA:
                 regstr = '%' + pathway_name + '%'
                 t = (regstr, db_source)
                 res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                        "WHERE pathwayName LIKE ? AND source LIKE ?", t).fetchall()
+                                        "WHERE rowid IN (SELECT rowid FROM pathway_fts "
+                                        "WHERE pathwayName LIKE ?) AND source LIKE ?", t).fetchall()
                 if res:
                     for r in res:
                         pathwayName[r[0]] = r[1]
@@ -1788,18 +1422,11 @@ class TFTA:
         miRNA_names is a list
         """
         clari_miRNA = dict()
-        if self.tfdb is not None:
-            for miRNA_name in miRNA_names:
-                t = (miRNA_name,)
-                res = self.tfdb.execute("SELECT DISTINCT mirna FROM mirnaInfo "
-                                         "WHERE mirna LIKE ? ", t).fetchall()
-                if not res:
-                    regstr = miRNA_name + '%'
-                    t = (regstr,)
-                    res = self.tfdb.execute("SELECT DISTINCT mirna FROM mirnaInfo "
-                                            "WHERE mirna LIKE ? ", t).fetchall()
-                    if res:
-                        clari_miRNA[miRNA_name] = [r[0] for r in res]
+        for miRNA_name in miRNA_names:
+            if miRNA_name not in self.mirna_index:
+                res = self.mirna_index.find_prefix(miRNA_name)
+                if res:
+                    clari_miRNA[miRNA_name] = res
         return clari_miRNA
         
     def get_similar_miRNAs(self, miRNA_name):
@@ -1808,21 +1435,9 @@ class TFTA:
         is not in the database, for user clarification purpose
         miRNA_name: str, miRNA name
         """
-        clari_miRNA = []
-        if self.tfdb is not None:
-            regstr = miRNA_name + '-%'
-            t = (regstr,)
-            res = self.tfdb.execute("SELECT DISTINCT mirna FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? ", t).fetchall()
-            if res:
-                clari_miRNA = [r[0] for r in res]
-            else:
-                regstr = miRNA_name + '%'
-                t = (regstr,)
-                res = self.tfdb.execute("SELECT DISTINCT mirna FROM mirnaInfo "
-                                    "WHERE mirna LIKE ? ", t).fetchall()
-                if res:
-                    clari_miRNA = [r[0] for r in res]
+        clari_miRNA = self.mirna_index.find_prefix(miRNA_name + '-')
+        if not clari_miRNA:
+            clari_miRNA = self.mirna_index.find_prefix(miRNA_name)
         return clari_miRNA
 
     def find_tissue_gene(self, gene_name):
@@ -1831,13 +1446,9 @@ class TFTA:
         What tissues is STAT3 expressed in?
         """
         tissue_names = []
-        if self.tfdb is not None:
-            t = (gene_name, EXP_THR)
-            res = self.tfdb.execute("SELECT DISTINCT tissue FROM geneTissue "
-                                    "WHERE genesymbol = ? AND enrichment > ? ", t).fetchall()
-            if res:
-                tissue_names = [r[0] for r in res]
-            else:
+        if self.tissue_matrix is not None:
+            tissue_names = self.tissue_matrix.tissues_of(gene_name)
+            if not tissue_names:
                 raise TissueNotFoundException
         return tissue_names
     
@@ -1847,22 +1458,9 @@ class TFTA:
         """
         gene_names = set()
         if self.tfdb is not None:
-            t = (kinase_names[0],)
-            res = self.tfdb.execute("SELECT DISTINCT target FROM kinaseReg "
-                                    "WHERE kinase = ? ", t).fetchall()
-            if res:
-                gene_names = set([r[0] for r in res])
-            else:
-                raise TargetNotFoundException 
-            if len(kinase_names)>1:
-                for i in range(1,len(kinase_names)):
-                    t = (kinase_names[i],)
-                    res = self.tfdb.execute("SELECT DISTINCT target FROM kinaseReg "
-                                            "WHERE kinase = ? ", t).fetchall()
-                    if res:
-                        gene_names = set(gene_names) & set([r[0] for r in res])
-                    else:
-                        raise TargetNotFoundException
+            gene_names = batch_query.find_common(self.tfdb, 'kinaseReg', 'kinase', 'target', kinase_names)
+            if gene_names is None:
+                raise TargetNotFoundException
         if not gene_names:
             raise TargetNotFoundException
         
@@ -1874,22 +1472,10 @@ class TFTA:
         """
         gene_names = set()
         if self.tfdb is not None:
-            t = (kinase_names[0], keyword)
-            res = self.tfdb.execute("SELECT DISTINCT target FROM kinaseReg "
-                                    "WHERE kinase = ? AND direction LIKE ? ", t).fetchall()
-            if res:
-                gene_names = set([r[0] for r in res])
-            else:
-                raise TargetNotFoundException 
-            if len(kinase_names)>1:
-                for i in range(1,len(kinase_names)):
-                    t = (kinase_names[i], keyword)
-                    res = self.tfdb.execute("SELECT DISTINCT target FROM kinaseReg "
-                                            "WHERE kinase = ? AND direction LIKE ? ", t).fetchall()
-                    if res:
-                        gene_names = set(gene_names) & set([r[0] for r in res])
-                    else:
-                        raise TargetNotFoundException
+            gene_names = batch_query.find_common(self.tfdb, 'kinaseReg', 'kinase', 'target', kinase_names,
+                                                 ' AND direction LIKE ?', (keyword,))
+            if gene_names is None:
+                raise TargetNotFoundException
         if not gene_names:
             raise TargetNotFoundException
         return gene_names
@@ -1900,22 +1486,10 @@ class TFTA:
         """
         kinase_names = []
         if self.tfdb is not None:
-            t = (target_names[0],)
-            res = self.tfdb.execute("SELECT DISTINCT kinase FROM kinaseReg "
-                                    "WHERE target = ? ", t).fetchall()
-            if res:
-                kinase_names = [r[0] for r in res]
-            else:
-                raise KinaseNotFoundException 
-            if len(target_names)>1:
-                for i in range(1,len(target_names)):
-                    t = (target_names[i],)
-                    res = self.tfdb.execute("SELECT DISTINCT kinase FROM kinaseReg "
-                                            "WHERE target = ? ", t).fetchall()
-                    if res:
-                        kinase_names = list(set(kinase_names) & set([r[0] for r in res]))
-                    else:
-                        raise KinaseNotFoundException
+            kinases = batch_query.find_common(self.tfdb, 'kinaseReg', 'target', 'kinase', target_names)
+            if kinases is None:
+                raise KinaseNotFoundException
+            kinase_names = list(kinases)
         return kinase_names
         
     def find_kinase_target_keyword(self, target_names, keyword_name):
@@ -1924,22 +1498,11 @@ class TFTA:
         """
         kinase_names = []
         if self.tfdb is not None:
-            t = (target_names[0], keyword_name)
-            res = self.tfdb.execute("SELECT DISTINCT kinase FROM kinaseReg "
-                                    "WHERE target = ? AND direction LIKE ? ", t).fetchall()
-            if res:
-                kinase_names = [r[0] for r in res]
-            else:
-                raise KinaseNotFoundException 
-            if len(target_names)>1:
-                for i in range(1,len(target_names)):
-                    t = (target_names[i], keyword_name)
-                    res = self.tfdb.execute("SELECT DISTINCT kinase FROM kinaseReg "
-                                            "WHERE target = ? AND direction LIKE ? ", t).fetchall()
-                    if res:
-                        kinase_names = list(set(kinase_names) & set([r[0] for r in res]))
-                    else:
-                        raise KinaseNotFoundException
+            kinases = batch_query.find_common(self.tfdb, 'kinaseReg', 'target', 'kinase', target_names,
+                                              ' AND direction LIKE ?', (keyword_name,))
+            if kinases is None:
+                raise KinaseNotFoundException
+            kinase_names = list(kinases)
         return kinase_names
         
     def find_gene_tissue(self, tissue_name):
@@ -1947,14 +1510,9 @@ class TFTA:
         For a given tissue, return genes expressed in this tissue
         """
         gene_names = []
-        if self.tfdb is not None:
-            regstr = '%' + tissue_name + '%'
-            t = (regstr, EXP_THR)
-            res = self.tfdb.execute("SELECT DISTINCT genesymbol FROM geneTissue "
-                                    "WHERE tissue LIKE ? AND enrichment > ? ", t).fetchall()
-            if res:
-                gene_names = [r[0] for r in res]
-            else:
+        if self.tissue_matrix is not None:
+            gene_names = self.tissue_matrix.genes_in(tissue_name)
+            if not gene_names:
                 raise TissueNotFoundException
         return gene_names
         
@@ -1963,68 +1521,33 @@ class TFTA:
         For a given tissue, return genes exclusively expressed in this tissue
         """
         gene_names = []
-        if not len(self.tissue_gene_exclusive):
-            self.tissue_gene_exclusive = self.map_exclusive_tissue_gene()
-        if tissue_name in self.tissue_gene_exclusive:
-            gene_names = list(self.tissue_gene_exclusive[tissue_name])
+        if self.tissue_matrix is not None:
+            gene_names = self.tissue_matrix.exclusive_genes(tissue_name)
         return gene_names
         
     def is_tissue_gene(self, tissue_name, gene_name):
         """
         For a given gene and a tissue, return if this gene is expressed in this tissue
         """
-        if self.tfdb is not None:
-            t = (tissue_name, gene_name, EXP_THR)
-            res = self.tfdb.execute("SELECT DISTINCT genesymbol FROM geneTissue "
-                                    "WHERE tissue LIKE ? AND genesymbol = ? "
-                                    "AND enrichment > ? ", t).fetchall()
-            if res:
-                return True
-            else:
-                return False
+        if self.tissue_matrix is not None:
+            return self.tissue_matrix.is_expressed(tissue_name, gene_name)
     
     def is_tissue_gene_exclusive(self, tissue_name, gene_name):
         """
         For a given gene and a tissue, return if this gene is exclusively expressed in this tissue
         """
-        if self.tfdb is not None:
-            t = (gene_name, EXP_THR)
-            res = self.tfdb.execute("SELECT DISTINCT genesymbol, tissue FROM geneTissue "
-                                    "WHERE genesymbol = ? AND enrichment > ? ", t).fetchall()
-            if res:
-                tissues = set([r[1] for r in res])
-                if len(tissues) == 1 and tissue_name in tissues:
-                    return True
-                else:
-                    return False
-            else:
-                return False
+        if self.tissue_matrix is not None:
+            return self.tissue_matrix.is_exclusive(tissue_name, gene_name)
                 
     def map_exclusive_tissue_gene(self):
         """
         return gene expressions exclusively in each tissue
         """
-        gene_exp_all = defaultdict(set)
         gene_exp_exclusive = defaultdict(set)
-        if self.tfdb is not None:
-            t = (EXP_THR,)
-            res = self.tfdb.execute("SELECT DISTINCT tissue FROM geneTissue "
-                                    "WHERE enrichment > ? ", t).fetchall()
-            tissues = [r[0] for r in res]
-            for tiss in tissues:
-                t = (tiss, EXP_THR)
-                res = self.tfdb.execute("SELECT DISTINCT genesymbol FROM geneTissue "
-                                    "WHERE tissue LIKE ? AND enrichment > ? ", t).fetchall()
-                gene_exp_all[tiss] = set([r[0] for r in res])
-            #get exclusively expressed genes
-            for i in range(len(tissues)):
-                temp = gene_exp_all[tissues[i]]
-                for j in range(len(tissues)):
-                    if j != i:
-                        temp = temp - gene_exp_all[tissues[j]]
-                #print('tissue ' + tissues[i] + ' have %d exclusively expressively expressed genes' % len(temp))
-                if len(temp):
-                    gene_exp_exclusive[tissues[i]] = temp
+        if self.tissue_matrix is not None:
+            tm = self.tissue_matrix
+            for g in np.flatnonzero(tm.exclusive >= 0):
+                gene_exp_exclusive[tm.tissues.symbols[tm.exclusive[g]]].add(tm.genes.symbols[g])
         return gene_exp_exclusive
     
     def find_evidence_dbname(self, tf_name, target_name):
@@ -2086,15 +1609,13 @@ class TFTA:
                     dname[r[0]] = r[1]
             if dname:
                 for id in dname:
-                    t = (id,)
-                    res = self.ldd.execute("SELECT DISTINCT gene FROM diseaseGene "
-                                    "WHERE diseaseId = ? ORDER BY gene", t).fetchall()
+                    res = batch_query.find_values(self.ldd, 'diseaseGene', 'diseaseId', 'gene', id)
                     if of_those:
-                        temp = set(of_those).intersection(set([r[0] for r in res]))
+                        temp = set(of_those).intersection(set(res))
                         if temp:
                             genes[id] = temp
                     else:
-                        genes[id] = [r[0] for r in res]
+                        genes[id] = res
         return dname, genes
         
     def find_gene_ligand(self, ligand_name, keyword, of_those, limit=5):
@@ -2123,15 +1644,13 @@ class TFTA:
                         lname[r[0]] = r[1]
             if lname:
                 for id in lname:
-                    t = (id,)
-                    res = self.ldd.execute("SELECT DISTINCT gene FROM ligandGene "
-                                    "WHERE ligandId = ? ORDER BY gene", t).fetchall()
+                    res = batch_query.find_values(self.ldd, 'ligandGene', 'ligandId', 'gene', id)
                     if of_those:
-                        temp = set(of_those).intersection(set([r[0] for r in res]))
+                        temp = set(of_those).intersection(set(res))
                         if temp:
                             genes[id] = temp
                     else:
-                        genes[id] = [r[0] for r in res]
+                        genes[id] = res
                     if genes and len(genes) >= limit:
                         break
         return lname,genes
@@ -2157,15 +1676,13 @@ class TFTA:
                     dname[r[0]] = r[1]
             if dname:
                 for id in dname:
-                    t = (id,)
-                    res = self.ldd.execute("SELECT DISTINCT gene FROM drugGene "
-                                    "WHERE drugId = ? ORDER BY gene", t).fetchall()
+                    res = batch_query.find_values(self.ldd, 'drugGene', 'drugId', 'gene', id)
                     if of_those:
-                        temp = set(of_those).intersection(set([r[0] for r in res]))
+                        temp = set(of_those).intersection(set(res))
                         if temp:
                             genes[id] = temp
                     else:
-                        genes[id] = [r[0] for r in res]
+                        genes[id] = res
                     
                     if genes and len(genes) >= limit:
                         break
@@ -2181,46 +1698,51 @@ class TFTA:
             if not self.trans_factor:
                 if self.tfdb is not None:
                     res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                    self.trans_factor = set([r[0] for r in res])
+                    self.trans_factor = GeneSet(r[0] for r in res)
             return self.trans_factor
         else:
             try:
-                goids = go_map[go_name]
+                goids = _get_go_map()[go_name]
             except KeyError:
                 raise GONotFoundException
             if self.tfdb is not None:
                 for go in goids:
-                    t = (go, )
-                    res = self.tfdb.execute("SELECT geneSymbol FROM go2Genes WHERE termId = ? ", t).fetchall()
-                    go_genes.extend([r[0] for r in res])
+                    go_genes.extend(batch_query.find_values(self.tfdb, 'go2Genes', 'termId',
+                                                            'geneSymbol', go))
                 go_genes = set(go_genes)
         return go_genes
         
     def get_hgnc_mapping(self):
-        return hgnc_symbol_id
+        return _get_hgnc_symbol_id()
     
     def get_hgnc_symbols(self):
-        return hgnc_genes_set
+        return _get_hgnc_genes_set()
     
     def get_tf_set(self):
         tf_set = set()
         if not self.trans_factor:
             if self.tfdb is not None:
                 res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                self.trans_factor = set([r[0] for r in res])
+                self.trans_factor = GeneSet(r[0] for r in res)
                 tf_set = self.trans_factor
         else:
             tf_set = self.trans_factor
         return tf_set
         
     def tf_set(self):
-        tfs = set()
+        knowledge_pack = _get_knowledge_pack()
+        if knowledge_pack is not None and 'transFactor' in knowledge_pack.sets:
+            return GeneSet(knowledge_pack.sets['transFactor'])
+        tfs = GeneSet()
         if self.tfdb is not None:
             res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-            tfs = set([r[0] for r in res])
+            tfs = GeneSet(r[0] for r in res)
         return tfs
         
     def mirna_set(self):
+        knowledge_pack = _get_knowledge_pack()
+        if knowledge_pack is not None and 'mirna' in knowledge_pack.sets:
+            return knowledge_pack.sets['mirna']
         mirnas = set()
         if self.tfdb is not None:
             res = self.tfdb.execute("SELECT DISTINCT mirna FROM mirnaInfo").fetchall()
@@ -2231,31 +1753,41 @@ class TFTA:
         """
         Return pathway-gene dict. 
         """
-        p_genes = defaultdict(dict)
         fn = os.path.join(_enrich_dir, db_source.lower() + '.pickle')
-        if os.path.isfile(fn):
-            with open(fn, 'rb') as pickle_in:
-                p_genes = pickle.load(pickle_in)
-        else:
-            if self.tfdb is not None:
-                pathw = defaultdict(dict)
-                reg_str = db_source + '%'
-                t = (reg_str,)
-                res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
-                                        "WHERE source LIKE ?", t).fetchall()
-                for r in res:
-                    pathw[r[0]]['name'] = r[1]
-                    pathw[r[0]]['dblink'] = r[2]
-                
-                for id in pathw.keys():
-                    t = (id,)
-                    res = self.tfdb.execute("SELECT DISTINCT genesymbol FROM pathway2Genes "
-                                             "WHERE pathwayID = ? ", t).fetchall()
-                    p_genes[pathw[id]['name']]['gene'] = [r[0] for r in res]
-                    p_genes[pathw[id]['name']]['dblink'] = pathw[id]['dblink']
-                #save to file
-                with open(fn, 'wb') as pickle_out:
-                    pickle.dump(p_genes, pickle_out)
+        p_genes = cache_store.load(fn, lambda: self._read_pathway_genes(db_source),
+                                   [_resource_dir + 'TF_target_20191224.db'])
+        if p_genes is None:
+            p_genes = defaultdict(dict)
+        return p_genes
+
+    def get_pathway_gene_sets(self, db_source):
+        """
+        Return the GeneSetCollection of the pathways of db_source, mapped into memory.
+        """
+        from enrichment.ora_engine import load_collection
+        fn = os.path.join(_enrich_dir, db_source.lower() + '.genesets')
+        return load_collection(fn, lambda: self.get_pathway_genes(db_source) or None,
+                               [_resource_dir + 'TF_target_20191224.db'])
+
+    def _read_pathway_genes(self, db_source):
+        if self.tfdb is None:
+            return None
+        p_genes = defaultdict(dict)
+        pathw = defaultdict(dict)
+        reg_str = db_source + '%'
+        t = (reg_str,)
+        res = self.tfdb.execute("SELECT Id,pathwayName,dblink FROM pathwayInfo "
+                                "WHERE source LIKE ?", t).fetchall()
+        for r in res:
+            pathw[r[0]]['name'] = r[1]
+            pathw[r[0]]['dblink'] = r[2]
+        
+        for id in pathw.keys():
+            t = (id,)
+            res = self.tfdb.execute("SELECT DISTINCT genesymbol FROM pathway2Genes "
+                                     "WHERE pathwayID = ? ", t).fetchall()
+            p_genes[pathw[id]['name']]['gene'] = [r[0] for r in res]
+            p_genes[pathw[id]['name']]['dblink'] = pathw[id]['dblink']
         return p_genes
     
     
@@ -2299,13 +1831,13 @@ class TFTA:
         if not self.trans_factor:
             if self.tfdb is not None:
                 res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                self.trans_factor = set([r[0] for r in res])
+                self.trans_factor = GeneSet(r[0] for r in res)
        
-        tfs = subjects.intersection(self.trans_factor)
+        tfs = self.trans_factor.intersection(subjects)
         nontfs = subjects - tfs
         #mirnas = nontfs.intersection(mirna_indra_set)
         #others = nontfs - mirnas
-        genes = nontfs.intersection(hgnc_genes_set)
+        genes = _get_hgnc_genes_set().intersection(nontfs)
         #other = others - genes
         return tfs, genes#, mirnas, other
         
@@ -2352,13 +1884,13 @@ class TFTA:
         if not self.trans_factor:
             if self.tfdb is not None:
                 res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                self.trans_factor = set([r[0] for r in res])
+                self.trans_factor = GeneSet(r[0] for r in res)
        
-        tfs = genes.intersection(self.trans_factor)
+        tfs = self.trans_factor.intersection(genes)
         nontfs = genes - tfs
-        mirnas = nontfs.intersection(self.mirna)
+        mirnas = self.mirna.intersection(nontfs)
         others = nontfs - mirnas
-        gene = others.intersection(hgnc_genes_set)
+        gene = _get_hgnc_genes_set().intersection(others)
         #other = others - gene
         return tfs, gene, mirnas, stmt_f
         
@@ -2405,7 +1937,7 @@ class TFTA:
             obj = stmt.obj
             if obj is not None:
                 objs.add(obj.name)
-        genes = objs.intersection(hgnc_genes_set)
+        genes = _get_hgnc_genes_set().intersection(objs)
         return genes
         
     def find_target_indra_regulators(self, stmts_d, of_those=None, target_type=None):
@@ -2460,9 +1992,9 @@ class TFTA:
         if not self.trans_factor:
             if self.tfdb is not None:
                 res = self.tfdb.execute("SELECT DISTINCT tf FROM transFactor").fetchall()
-                self.trans_factor = set([r[0] for r in res])
+                self.trans_factor = GeneSet(r[0] for r in res)
             
-        tfs = subjs.intersection(self.trans_factor)
+        tfs = self.trans_factor.intersection(subjs)
         return tfs
         
     def find_tfs_indra(self, stmts_d):
@@ -2555,7 +2087,11 @@ class TFTA:
             download_file_dropbox(url, tf_db_file)
             
         if os.path.isfile(tf_db_file):
-            tfdb = sqlite3.connect(tf_db_file, check_same_thread=False)
+            #use the copy made by db_index with the missing indexes if present.
+            #the pathway name trigram index and miRNA key table are built once for the pool
+            tfdb = storage.ConnectionPool(indexed_db_file(tf_db_file),
+                                          setup=create_search_tables)
+            tfdb.pack = _get_knowledge_pack()
             logger.info('TFTA loaded TF-target database')
         else:
             logger.error('TFTA could not load TF-target database.')
@@ -2572,14 +2108,24 @@ class TFTA:
             download_file_dropbox(url, ldd_file)
             
         if os.path.isfile(ldd_file):
-            ldd = sqlite3.connect(ldd_file, check_same_thread=False)
+            ldd = storage.ConnectionPool(indexed_db_file(ldd_file))
+            ldd.pack = _get_knowledge_pack()
             logger.info('TFTA loaded ldd database')
         else:
             logger.error('TFTA could not load ldd database.')
             ldd = None
         return ldd
 
+def _load_reg_index(tfdb, pack, reg_index):
+    if reg_index is None:
+        reg_index = pack is None or pack.relation('CombinedDB', 'TF', 'Target') is None
+    if reg_index and tfdb is not None:
+        return RegulationIndex.from_db(tfdb)
+    return None
+
 def _get_members(agent):
+    from indra.ontology.bio import bio_ontology
+    from indra.tools.expand_families import expand_agent
     return expand_agent(agent, bio_ontology, ns_filter=['HGNC'])
 
 
@@ -12,16 +12,17 @@ logger = logging.getLogger('TFTA')
 from kqml import KQMLModule, KQMLPerformative, KQMLList
 from .tfta import TFTA, TFNotFoundException, TargetNotFoundException, PathwayNotFoundException 
 from .tfta import GONotFoundException, miRNANotFoundException, TissueNotFoundException
-from .tfta import KinaseNotFoundException
+from .tfta import KinaseNotFoundException, _get_config_flag
+from .subsystem import Subsystem, SubsystemUnavailableException, SubsystemDisabledException
+from .subsystem import warm_up
 from .mirDisease import mirDisease
-from enrichment.GO import GOEnrich
-from enrichment.pathway import PathwayEnrich
-from utils.heatmap import generate_heatmap
+from enrichment.result_cache import ResultCache, make_key, MAX_BYTES
 #from indra.sources.trips.processor import TripsProcessor
 from collections import defaultdict
 from bioagents import Bioagent
 from indra.statements import Agent
 from indra.databases import hgnc_client
+from indra import get_config
 
 stmt_provenance_map = {'increase':'upregulates', 'decrease':'downregulates',
                  'regulate':'regulates'}
@@ -32,6 +33,10 @@ stmt_provenance_map_target = {'increase':'upregulated', 'decrease':'downregulate
 stmt_type_map = {'increase':['IncreaseAmount'], 'decrease':['DecreaseAmount'],
                  'regulate':['IncreaseAmount', 'DecreaseAmount']}
                  
+#tasks served by the enrichment subsystems
+enrichment_tasks = ['GO-ENRICHMENT', 'GO-ANNOTATION', 'PATHWAY-ENRICHMENT',
+                    'DISEASE-ENRICHMENT', 'MIRNA-DISEASE-ENRICHMENT', 'BATCH-ENRICHMENT']
+
 dbname_pmid_map = {'TRED':'17202159', 'ITFP':'18713790', 'ENCODE':'22955616',
                  'TRRUST':'26066708', 'Marbach2016':'26950747', 'Neph2012':'22959076'}
 
@@ -57,7 +62,8 @@ class TFTA_Module(Bioagent):
              'IS-MIRNA-DISEASE', 'FIND-MIRNA-DISEASE', 'FIND-DISEASE-MIRNA',
              'MAKE-HEATMAP', 'PATHWAY-ENRICHMENT', 'DISEASE-ENRICHMENT',
              'MIRNA-DISEASE-ENRICHMENT', 'FIND-EVIDENCE-MIRNA-EXP',
-             'FIND-GENE-DISEASE', 'IS-GENE-DISEASE', 'FIND-GENE-LIGAND']
+             'FIND-GENE-DISEASE', 'IS-GENE-DISEASE', 'FIND-GENE-LIGAND',
+             'BATCH-ENRICHMENT']
     #keep the genes from the most recent previous call, which are used to input 
     #find-gene-onto if there's no gene input 
     #gene_list = ['STAT3', 'JAK1', 'JAK2', 'ELK1', 'FOS', 'SMAD2', 'KDM4B']
@@ -66,11 +72,26 @@ class TFTA_Module(Bioagent):
     def __init__(self, **kwargs):
         #Instantiate a singleton TFTA agent and other agents
         self.tfta = TFTA()
-        self.go = GOEnrich()
-        self.md = mirDisease()
-        self.mirna_pop = self.md.get_mirna_pop()
         self.pop = self.tfta.get_hgnc_symbols()
-        self.pw = PathwayEnrich(self.pop, self.mirna_pop, self.tfta)
+        
+        #the other subsystems are loaded by a warm-up thread, or on first use
+        md = Subsystem('mirDisease', mirDisease)
+        self.subsystems = {'md': md}
+        if _get_config_flag('TFTA_ENRICHMENT', True):
+            self.subsystems['go'] = Subsystem('GOEnrich', _load_go)
+            self.subsystems['pw'] = Subsystem('PathwayEnrich',
+                                              lambda md: _load_pathway(self.pop, md.get_mirna_pop(), self.tfta),
+                                              depends=[md])
+        else:
+            logger.info('The enrichment subsystems are disabled.')
+            self.tasks = [t for t in self.tasks if t not in enrichment_tasks]
+        timeout = get_config('TFTA_LOAD_TIMEOUT')
+        self.load_timeout = float(timeout) if timeout else 60
+        #cache of the enrichment results
+        cache_bytes = get_config('TFTA_RESULT_CACHE_BYTES')
+        self.result_cache = ResultCache(int(cache_bytes) if cache_bytes else MAX_BYTES)
+        if _get_config_flag('TFTA_WARMUP', True):
+            warm_up(list(self.subsystems.values()))
         
         self.stmts_indra = dict()
         #self.hgnc_info = dict()
@@ -78,6 +99,23 @@ class TFTA_Module(Bioagent):
         # Call the constructor of Bioagent
         super(TFTA_Module, self).__init__(**kwargs)
         
+    @property
+    def md(self):
+        return self._get_subsystem('md')
+    
+    @property
+    def go(self):
+        return self._get_subsystem('go')
+    
+    @property
+    def pw(self):
+        return self._get_subsystem('pw')
+    
+    def _get_subsystem(self, name):
+        if name not in self.subsystems:
+            raise SubsystemDisabledException('{} is disabled.'.format(name))
+        return self.subsystems[name].get(self.load_timeout)
+    
     def receive_tell(self, msg, content):
         #handle tell broadcast
         #now just do nothing here, but to avoid error message sending out
@@ -1056,7 +1094,6 @@ class TFTA_Module(Bioagent):
         find-common-pathway-genes-database
         """
         start = time.time()
-        limit = 50
         gene_names,fmembers = self._get_targets2(content, descr='target')
         if not gene_names and not fmembers:
             reply = make_failure('NO_GENE_NAME')
@@ -1068,23 +1105,10 @@ class TFTA_Module(Bioagent):
         
         db_name = _get_keyword_name(content, descr='database', low_case=False)
         
+        keyword = keyword_name[0] if keyword_name else None
         try:
-            if all([gene_names, keyword_name]):
-                if len(gene_names) < 15:
-                    pathwayName,dblink,genes = self.tfta.find_common_pathway_genes_keyword(gene_names, keyword_name[0], fmembers)
-                else:
-                    pathwayName,dblink,genes = self.tfta.find_common_pathway_genes_keyword2(gene_names, keyword_name[0], fmembers)
-            elif all([gene_names, db_name]):
-                if len(gene_names) < limit:
-                    pathwayName,dblink,genes = self.tfta.find_common_pathway_genes_db(gene_names, db_name, fmembers)
-                else:
-                    pathwayName,dblink,genes = self.tfta.find_common_pathway_genes_db4(gene_names, db_name, fmembers)
-            elif len(gene_names) > limit:
-                db_name = 'KEGG'
-                logger.info('GO to find_common_pathway_genes_db4 for large gene list.')
-                pathwayName,dblink,genes = self.tfta.find_common_pathway_genes_db4(gene_names, db_name, fmembers)
-            else:
-                pathwayName, dblink, genes = self.tfta.find_common_pathway_genes(gene_names, fmembers)
+            pathwayName,dblink,genes = self.tfta.find_common_pathway_genes(gene_names, fmembers,
+                                                                           keyword=keyword, db_name=db_name)
         except PathwayNotFoundException:
             reply = KQMLList.from_string('(SUCCESS :pathways NIL)')
             return reply
@@ -2359,32 +2383,42 @@ class TFTA_Module(Bioagent):
         if not gene_names:
             reply = self.wrap_family_message(term_id, 'NO_GENE_NAME')
             return reply
-            
-        results = self.go.go_enrichment_analysis(gene_names)
-        #return GO_id, GO_name, p_bonferroni, study_items
-        mes_json = []
-        if results:
-            for res in results:
-                mes = KQMLList()
-                mes.sets('GO-term', res.goterm.id)
-                mes.sets('GO-name', res.name)
-                mes.sets('p-bonferroni', str(res.p_bonferroni))
-                r1 = res.ratio_in_study
-                mes.sets('ratio_in_study', str(r1[0]) + '/' + str(r1[1]))
-                r1 = res.ratio_in_pop
-                mes.sets('ratio_in_pop', str(r1[0]) + '/' + str(r1[1]))
-                gene_agent = [Agent(g, db_refs={'TYPE':'ONT::GENE-PROTEIN'}) for g in res.study_items]
-                gene_json = self.make_cljson(gene_agent)
-                mes.set('genes', gene_json)
-                mes_json.append(mes.to_string())
+        
+        go = self.go
+        key = self._enrichment_key(gene_names, 'go')
+        res_str = self.result_cache.get_or_compute(key,
+                      lambda: self._go_results(go.go_enrichment_analysis(gene_names)))
+        if res_str:
             reply=KQMLList('SUCCESS')
-            res_str = '(' + ' '.join(mes_json) + ')'
             reply.set('results', res_str)
             return reply
         else:
             reply = KQMLList.from_string('(SUCCESS :results NIL)')
             return reply
     
+    def _go_results(self, results):
+        """
+        Return the results string of GO-ENRICHMENT, an empty string if there's no result.
+        """
+        #return GO_id, GO_name, p_bonferroni, study_items
+        mes_json = []
+        if not results:
+            return ''
+        for res in results:
+            mes = KQMLList()
+            mes.sets('GO-term', res.goterm.id)
+            mes.sets('GO-name', res.name)
+            mes.sets('p-bonferroni', str(res.p_bonferroni))
+            r1 = res.ratio_in_study
+            mes.sets('ratio_in_study', str(r1[0]) + '/' + str(r1[1]))
+            r1 = res.ratio_in_pop
+            mes.sets('ratio_in_pop', str(r1[0]) + '/' + str(r1[1]))
+            gene_agent = [Agent(g, db_refs={'TYPE':'ONT::GENE-PROTEIN'}) for g in res.study_items]
+            gene_json = self.make_cljson(gene_agent)
+            mes.set('genes', gene_json)
+            mes_json.append(mes.to_string())
+        return '(' + ' '.join(mes_json) + ')'
+    
     def respond_go_annotation(self, content):
         """
         Respond to GO-ANNOTATION request
@@ -2421,25 +2455,9 @@ class TFTA_Module(Bioagent):
         if not db_name:
             db_name = 'kegg'
             
-        results = self.pw.get_ora_pathway(gene_names, db_name)
-        mes_json = []
-        if results:
-            for res in results.keys():
-                mes = KQMLList()
-                mes.sets('name', res)
-                mes.sets('dblink', results[res]['dblink'])
-                mes.sets('p-bonferroni', str(results[res]['p-bonferroni']))
-                gene_agent = [Agent(g, db_refs={'TYPE':'ONT::GENE-PROTEIN'}) for g in results[res]['gene']]
-                gene_json = self.make_cljson(gene_agent)
-                mes.set('genes', gene_json)
-                mes_json.append(mes.to_string())
-            reply=KQMLList('SUCCESS')
-            res_str = '(' + ' '.join(mes_json) + ')'
-            reply.set('results', res_str)
-            return reply
-        else:
-            reply = KQMLList.from_string('(SUCCESS :results NIL)')
-            return reply
+        pw = self.pw
+        return self._ora_reply(gene_names, 'pathway', db_name,
+                               lambda: pw.get_ora_pathway(gene_names, db_name))
             
     def respond_disease_enrichment(self, content):
         """
@@ -2453,25 +2471,9 @@ class TFTA_Module(Bioagent):
         if not db_name:
             db_name = 'ctd'
             
-        results = self.pw.get_ora_disease(gene_names, db_name)
-        mes_json = []
-        if results:
-            for res in results.keys():
-                mes = KQMLList()
-                mes.sets('name', res)
-                mes.sets('dblink', results[res]['dblink'])
-                mes.sets('p-bonferroni', str(results[res]['p-bonferroni']))
-                gene_agent = [Agent(g, db_refs={'TYPE':'ONT::GENE-PROTEIN'}) for g in results[res]['gene']]
-                gene_json = self.make_cljson(gene_agent)
-                mes.set('genes', gene_json)
-                mes_json.append(mes.to_string())
-            reply=KQMLList('SUCCESS')
-            res_str = '(' + ' '.join(mes_json) + ')'
-            reply.set('results', res_str)
-            return reply
-        else:
-            reply = KQMLList.from_string('(SUCCESS :results NIL)')
-            return reply
+        pw = self.pw
+        return self._ora_reply(gene_names, 'disease', db_name,
+                               lambda: pw.get_ora_disease(gene_names, db_name))
             
     def respond_mirna_disease_enrichment(self, content):
         """
@@ -2482,26 +2484,124 @@ class TFTA_Module(Bioagent):
             reply = make_failure('NO_MIRNA_NAME')
             return reply
         db_name = 'hmdd'
-        results = self.pw.get_ora_disease(miRNA_names, db_str=db_name)
-        mes_json = []
-        if results:
-            for res in results.keys():
-                mes = KQMLList()
-                mes.sets('name', res)
-                mes.sets('dblink', results[res]['dblink'])
-                mes.sets('p-bonferroni', str(results[res]['p-bonferroni']))
-                gene_agent = [Agent(g, db_refs={'TYPE':'MIRNA'}) for g in results[res]['gene']]
-                gene_json = self.make_cljson(gene_agent)
-                mes.set('mirnas', gene_json)
-                mes_json.append(mes.to_string())
+        pw = self.pw
+        return self._ora_reply(miRNA_names, 'disease', db_name,
+                               lambda: pw.get_ora_disease(miRNA_names, db_str=db_name),
+                               descr='mirnas', agent_type='MIRNA')
+    
+    def _ora_reply(self, study, kind, db_name, ora, descr='genes', agent_type='ONT::GENE-PROTEIN'):
+        """
+        Return the reply to a pathway or disease enrichment, the results are
+        cached by the result cache.
+        
+        parameter
+        -----------
+        study: list of gene or miRNA names
+        kind: 'pathway' or 'disease'
+        db_name: str, the database of the gene sets
+        ora: function returning the result of PathwayEnrich.ora on the study
+        """
+        key = make_key(study, kind + '/' + db_name, 'bonferroni', (0.01, 30), self.pw.data_version(db_name))
+        res_str = self.result_cache.get_or_compute(key,
+                      lambda: self._ora_results(ora(), descr, agent_type))
+        if res_str:
             reply=KQMLList('SUCCESS')
-            res_str = '(' + ' '.join(mes_json) + ')'
             reply.set('results', res_str)
             return reply
         else:
             reply = KQMLList.from_string('(SUCCESS :results NIL)')
             return reply
     
+    def _ora_results(self, results, descr, agent_type):
+        """
+        Return the results string of an ORA result, an empty string if
+        there's no result and None if the analysis failed.
+        """
+        if results is None:
+            return None
+        mes_json = []
+        for res in results.keys():
+            mes = KQMLList()
+            mes.sets('name', res)
+            mes.sets('dblink', results[res]['dblink'])
+            mes.sets('p-bonferroni', str(results[res]['p-bonferroni']))
+            gene_agent = [Agent(g, db_refs={'TYPE':agent_type}) for g in results[res]['gene']]
+            gene_json = self.make_cljson(gene_agent)
+            mes.set(descr, gene_json)
+            mes_json.append(mes.to_string())
+        if not mes_json:
+            return ''
+        return '(' + ' '.join(mes_json) + ')'
+    
+    def respond_batch_enrichment(self, content):
+        """
+        Respond to batch-enrichment request, the enrichment of several gene
+        (or miRNA for hmdd) lists against one database in one call
+        """
+        sets_arg = content.get('gene-sets')
+        if not sets_arg:
+            reply = make_failure('NO_GENE_NAME')
+            return reply
+        db_name = _get_keyword_name(content, descr='database', low_case=True)
+        if not db_name:
+            db_name = 'kegg'
+        
+        studies = []
+        for arg in sets_arg.data:
+            if db_name == 'hmdd':
+                names = self._mirnas_from_arg(arg)
+            else:
+                names,term_id = self._targets_from_arg(arg)
+                #a list of only families needs the clarification, as for one list
+                if not names and term_id:
+                    reply = self.wrap_family_message(term_id, 'NO_GENE_NAME')
+                    return reply
+            studies.append(names or [])
+        if not any(studies):
+            reply = make_failure('NO_MIRNA_NAME' if db_name == 'hmdd' else 'NO_GENE_NAME')
+            return reply
+        
+        #the cached studies are not analysed again
+        keys = [self._enrichment_key(study, db_name) for study in studies]
+        res_str = [self.result_cache.get(key) if study else '' for study, key in zip(studies, keys)]
+        todo = [i for i, r in enumerate(res_str) if r is None]
+        if todo:
+            if db_name == 'go':
+                results = self.go.go_enrichment_batch([studies[i] for i in todo])
+                results = [self._go_results(r) for r in results]
+            else:
+                results = self.pw.get_ora_batch([studies[i] for i in todo], db_name)
+                if results is None:
+                    results = [None] * len(todo)
+                elif db_name == 'hmdd':
+                    results = [self._ora_results(r, 'mirnas', 'MIRNA') for r in results]
+                else:
+                    results = [self._ora_results(r, 'genes', 'ONT::GENE-PROTEIN') for r in results]
+            for i, r in zip(todo, results):
+                res_str[i] = r
+                if r is not None:
+                    self.result_cache.put(keys[i], r)
+        
+        mes_json = []
+        for i, r in enumerate(res_str):
+            mes = KQMLList()
+            mes.sets('study', str(i))
+            mes.set('results', r if r else 'NIL')
+            mes_json.append(mes.to_string())
+        reply=KQMLList('SUCCESS')
+        reply.set('results', '(' + ' '.join(mes_json) + ')')
+        return reply
+    
+    def _enrichment_key(self, study, db_name):
+        """
+        Return the result cache key of the enrichment of study against db_name.
+        """
+        if db_name == 'go':
+            return make_key(study, 'go', 'bonferroni', (0.05, 0.01, 30), self.go.data_version)
+        pw = self.pw
+        kind = 'disease' if db_name in pw.disease_db else 'pathway'
+        return make_key(study, kind + '/' + db_name, 'bonferroni', (0.01, 30), pw.data_version(db_name))
+    
     def respond_make_heatmap(self, content):
         """
         Respond to make-heatmap request
@@ -2511,6 +2611,7 @@ class TFTA_Module(Bioagent):
             reply = make_failure('NO_FILE_NAME')
             return reply
             
+        from utils.heatmap import generate_heatmap
         heatmap_file, row_index, col_index = generate_heatmap(path.lower())
         if heatmap_file:
             reply = KQMLList('SUCCESS')
@@ -2561,7 +2662,8 @@ class TFTA_Module(Bioagent):
                  'FIND-GENE-DISEASE':respond_find_gene_disease, 'FIND-GENE-LIGAND':respond_find_gene_ligand,
                  'MAKE-HEATMAP':respond_make_heatmap, 'PATHWAY-ENRICHMENT':respond_pathway_enrichment,
                  'DISEASE-ENRICHMENT': respond_disease_enrichment,
-                 'MIRNA-DISEASE-ENRICHMENT': respond_mirna_disease_enrichment}
+                 'MIRNA-DISEASE-ENRICHMENT': respond_mirna_disease_enrichment,
+                 'BATCH-ENRICHMENT': respond_batch_enrichment}
     
     def receive_request(self, msg, content):
         """If a "request" message is received, decode the task and
@@ -2569,11 +2671,18 @@ class TFTA_Module(Bioagent):
         response. A reply message is then sent back.
         """
         task_str = content.head().upper()
-        if task_str not in self.task_func:
+        if task_str not in self.task_func or task_str not in self.tasks:
             logger.info('In receive_request: TFTA received the unkonwn task: {}.'.format(task_str))
             reply_content = make_failure2('NO-CAPABILITY', task_str)
         else:
-            reply_content = self.task_func[task_str](self, content)
+            try:
+                reply_content = self.task_func[task_str](self, content)
+            except SubsystemDisabledException as e:
+                logger.info(e)
+                reply_content = make_failure2('NO-CAPABILITY', task_str)
+            except SubsystemUnavailableException as e:
+                logger.warning(e)
+                reply_content = make_failure('SERVICE_NOT_READY')
             logger.info('In receive_request: TFTA received the task: {}.'.format(task_str))
         
         reply_msg = KQMLPerformative('reply')
@@ -3231,12 +3340,14 @@ class TFTA_Module(Bioagent):
         return reply
     
     def _get_targets(self, content, descr='target'):
+        return self._targets_from_arg(content.get(descr))
+        
+    def _targets_from_arg(self, target_arg):
         #parse json message format
         proteins = []
         family = dict()
         
         ont1 = {"ONT::GENE", "ONT::PROTEIN", "ONT::GENE-PROTEIN", "KB::KINASE", "KB::TRANSCRIPTION-FACTOR"}
-        target_arg = content.get(descr)
         if not target_arg:
             return None,None
         try:
@@ -3319,13 +3430,16 @@ class TFTA_Module(Bioagent):
             return None
     
     def _get_mirnas(self, content, descr='miRNA'):
-        #JSON format
-        #consider +trips+ if it exists
-        mirna = {}
         try:
             mir_arg = content.get(descr)
         except Exception:
             return []
+        return self._mirnas_from_arg(mir_arg)
+    
+    def _mirnas_from_arg(self, mir_arg):
+        #JSON format
+        #consider +trips+ if it exists
+        mirna = {}
         try:
             agents = self.get_agent(mir_arg)
         except Exception:
@@ -3395,6 +3509,15 @@ def _filter_pathway_name(path_name, keyword):
             #p = p.replace('pathway', '').strip()
     return p
 
+#the enrichment packages are heavy to import, so they are imported with their subsystem
+def _load_go():
+    from enrichment.GO import GOEnrich
+    return GOEnrich()
+
+def _load_pathway(pop, mirna_pop, tfta):
+    from enrichment.pathway import PathwayEnrich
+    return PathwayEnrich(pop, mirna_pop, tfta)
+
 def make_failure(reason):
     msg = KQMLList('FAILURE')
     msg.set('reason', reason)
@@ -0,0 +1,103 @@
+"""
+Gene x tissue expression matrix built from the geneTissue table.
+
+The expression mask at the threshold and the tissue of each exclusively
+expressed gene are computed once when the matrix is loaded.
+"""
+
+import time
+import logging
+import numpy as np
+from utils.bitset import SymbolTable
+
+logger = logging.getLogger('TFTA-TissueMatrix')
+
+
+class TissueMatrix:
+    def __init__(self, rows, threshold):
+        """
+        parameters
+        ------------
+        rows: iterable of (genesymbol, tissue, enrichment) tuples
+        threshold: float, a gene is expressed in a tissue if enrichment > threshold
+        """
+        self.genes = SymbolTable()
+        self.tissues = SymbolTable()
+        gi = []
+        ti = []
+        values = []
+        for gene, tissue, enrichment in rows:
+            if enrichment is None:
+                continue
+            gi.append(self.genes.add(gene))
+            ti.append(self.tissues.add(tissue))
+            values.append(enrichment)
+        idx = (np.array(gi, dtype=np.intp), np.array(ti, dtype=np.intp))
+        values = np.array(values, dtype=np.float64)
+        shape = (len(self.genes), len(self.tissues))
+        #threshold in double precision as in the database, a pair given
+        #several times is expressed if any of its enrichments is over it
+        self.expressed = np.zeros(shape, dtype=bool)
+        np.logical_or.at(self.expressed, idx, values > threshold)
+
+        #tissue of the genes expressed in exactly one tissue, -1 otherwise
+        counts = self.expressed.sum(axis=1)
+        self.exclusive = np.where(counts == 1, self.expressed.argmax(axis=1), -1)
+        self.tissues_lower = np.array([t.lower() for t in self.tissues.symbols], dtype=str)
+
+    @classmethod
+    def from_db(cls, tfdb, threshold):
+        t0 = time.perf_counter()
+        res = tfdb.execute("SELECT genesymbol, tissue, enrichment FROM geneTissue")
+        tm = cls(res, threshold)
+        logger.info('Built gene-tissue matrix of {} genes and {} tissues in {:.2f} seconds.'.format(
+                    len(tm.genes), len(tm.tissues), time.perf_counter() - t0))
+        return tm
+
+    def tissue_mask(self, tissue_name, substring=False):
+        """
+        Columns of the tissues equal to (or containing) tissue_name, case insensitive
+        """
+        if not len(self.tissues_lower):
+            return np.zeros(0, dtype=bool)
+        if substring:
+            return np.char.find(self.tissues_lower, tissue_name.lower()) >= 0
+        return self.tissues_lower == tissue_name.lower()
+
+    def tissues_of(self, gene_name):
+        """
+        Return the tissues the gene is expressed in
+        """
+        g = self.genes.get(gene_name)
+        if g is None:
+            return []
+        return self.tissues.to_symbols(np.flatnonzero(self.expressed[g]))
+
+    def genes_in(self, tissue_name):
+        """
+        Return the genes expressed in any tissue whose name contains tissue_name
+        """
+        mask = self.tissue_mask(tissue_name, substring=True)
+        rows = np.flatnonzero(self.expressed[:, mask].any(axis=1))
+        return self.genes.to_symbols(rows)
+
+    def is_expressed(self, tissue_name, gene_name):
+        g = self.genes.get(gene_name)
+        if g is None:
+            return False
+        return bool(self.expressed[g, self.tissue_mask(tissue_name)].any())
+
+    def exclusive_genes(self, tissue_name):
+        """
+        Return the genes expressed only in the tissue
+        """
+        t = self.tissues.get(tissue_name)
+        if t is None:
+            return []
+        return self.genes.to_symbols(np.flatnonzero(self.exclusive == t))
+
+    def is_exclusive(self, tissue_name, gene_name):
+        g = self.genes.get(gene_name)
+        if g is None or self.exclusive[g] < 0:
+            return False
+        return self.tissues.symbols[self.exclusive[g]] == tissue_name
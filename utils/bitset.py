@@ -0,0 +1,108 @@
+"""
+Integer interning of symbols and int-backed bitsets.
+
+A bitset is a plain python int where bit i is set when id i is a member,
+so AND/OR/popcount run word by word inside the interpreter.
+"""
+
+#set bit positions for every byte value, used to decode bitsets
+_BYTE_BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+
+class SymbolTable:
+    """
+    Assign dense integer ids to symbols in order of first appearance.
+    """
+    def __init__(self, symbols=None):
+        self.ids = dict()
+        self.symbols = []
+        if symbols:
+            for s in symbols:
+                self.add(s)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.ids
+
+    def add(self, symbol):
+        """
+        Return the id of symbol, interning it if it's new.
+        """
+        try:
+            return self.ids[symbol]
+        except KeyError:
+            i = len(self.symbols)
+            self.ids[symbol] = i
+            self.symbols.append(symbol)
+            return i
+
+    def get(self, symbol, default=None):
+        return self.ids.get(symbol, default)
+
+    def to_symbols(self, ids):
+        return [self.symbols[i] for i in ids]
+
+    def to_bits(self, symbols):
+        """
+        Return the bitset of the given symbols, unknown symbols are ignored.
+        """
+        return ids_to_bits(self.ids[s] for s in symbols if s in self.ids)
+
+    def from_bits(self, bits):
+        return self.to_symbols(bits_to_ids(bits))
+
+
+def ids_to_bits(ids):
+    """
+    Build a bitset from an iterable of non-negative ints.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+def bits_to_ids(bits):
+    """
+    Return the sorted list of ids set in the bitset.
+    """
+    ids = []
+    if not bits:
+        return ids
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for pos, byte in enumerate(data):
+        if byte:
+            base = pos << 3
+            ids.extend([base + i for i in _BYTE_BITS[byte]])
+    return ids
+
+def popcount(bits):
+    """
+    Number of ids set in the bitset.
+    """
+    try:
+        return bits.bit_count()
+    except AttributeError:
+        #python < 3.10
+        return bin(bits).count('1')
+
+def and_all(bitsets):
+    """
+    Intersection of the bitsets, stopping as soon as it becomes empty.
+    """
+    res = None
+    for b in bitsets:
+        res = b if res is None else res & b
+        if not res:
+            return 0
+    return res or 0
+
+def or_all(bitsets):
+    res = 0
+    for b in bitsets:
+        res |= b
+    return res
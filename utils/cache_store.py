@@ -0,0 +1,153 @@
+"""
+Versioned cache of the data derived from the resource files.
+
+An artifact is a pickle file starting with a header which holds the schema
+version of the artifact and the fingerprints (size, mtime and sha256) of the
+files it is built from. It is rebuilt when the version or any of the files
+changed; the sha256 is only computed when the size or mtime of a file
+differs from the header, which is then updated if the sha256 is the same.
+Artifacts are written to a temporary file which is
+then renamed, so that a crash never leaves a half-written artifact.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import logging
+
+logger = logging.getLogger('TFTA-CacheStore')
+
+#format of the artifact files
+CACHE_FORMAT = 1
+
+_CHUNK = 1 << 20
+
+
+def file_hash(fn):
+    h = hashlib.sha256()
+    with open(fn, 'rb') as fr:
+        for chunk in iter(lambda: fr.read(_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _fingerprint(fn, known=None):
+    """
+    Return [path, size, mtime_ns, sha256] of fn, or None if it doesn't exist.
+    The hash of known is reused if the size and mtime are the same.
+    """
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return None
+    fn = os.path.abspath(fn)
+    if known and known[:3] == [fn, st.st_size, st.st_mtime_ns]:
+        return known
+    return [fn, st.st_size, st.st_mtime_ns, file_hash(fn)]
+
+def _is_header(header):
+    return isinstance(header, dict) and header.get('format') == CACHE_FORMAT and \
+           'sources' in header
+
+def _check(header, sources, version):
+    """
+    Return the current fingerprints of the sources if the artifact of header
+    is valid, None otherwise.
+    """
+    if not _is_header(header):
+        return None
+    if header.get('version') != version or len(header['sources']) != len(sources):
+        return None
+    fps = []
+    for fn, known in zip(sources, header['sources']):
+        fp = _fingerprint(fn, known)
+        if known is None:
+            if fp is not None:
+                return None
+        #a missing source cannot be checked, the artifact is kept
+        elif fp is None:
+            fp = known
+        elif fp[3] != known[3]:
+            return None
+        fps.append(fp)
+    return fps
+
+def _read(fn):
+    """
+    Return the header and the file, positioned at the value, or (None, None).
+    """
+    try:
+        fr = open(fn, 'rb')
+    except OSError:
+        return None, None
+    try:
+        return pickle.load(fr), fr
+    except Exception:
+        fr.close()
+        return None, None
+
+def save(fn, value, sources=(), version=1):
+    """
+    Atomically write value to the artifact fn.
+    """
+    _write(fn, value, version, [_fingerprint(s) for s in sources])
+
+def _write(fn, value, version, fingerprints):
+    header = {'format': CACHE_FORMAT, 'version': version, 'sources': fingerprints}
+    folder = os.path.dirname(os.path.abspath(fn))
+    os.makedirs(folder, exist_ok=True)
+    tmp = '{}.tmp{}'.format(fn, os.getpid())
+    try:
+        with open(tmp, 'wb') as fw:
+            pickle.dump(header, fw, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(value, fw, protocol=pickle.HIGHEST_PROTOCOL)
+            fw.flush()
+            os.fsync(fw.fileno())
+        os.replace(tmp, fn)
+    except OSError as e:
+        logger.warning('Could not save {}: {}'.format(fn, e))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def load(fn, build, sources=(), version=1):
+    """
+    Return the artifact stored in fn, rebuilding it with build() if it is
+    missing, of another version or older than its sources.
+
+    parameter
+    -----------
+    fn: str, artifact file
+    build: function returning the value of the artifact, or None if it cannot
+    be built, in which case nothing is saved
+    sources: list of the files the artifact is built from
+    version: int, schema version of the artifact, to increase when build changes
+    """
+    sources = list(sources)
+    header, fr = _read(fn)
+    if fr is not None:
+        with fr:
+            fps = _check(header, sources, version)
+            if fps is not None:
+                try:
+                    value = pickle.load(fr)
+                except Exception as e:
+                    logger.warning('{} is corrupted: {}'.format(fn, e))
+                    fps = None
+        if fps is not None:
+            #a source touched without being changed, its new size and mtime
+            #are written so that it isn't hashed again at every load
+            if fps != header['sources']:
+                _write(fn, value, version, fps)
+            return value
+    t0 = time.perf_counter()
+    value = build()
+    if value is None:
+        if fr is not None and not _is_header(header):
+            #a file of the previous pickles, kept as nothing can replace it
+            logger.warning('Using {} which has no version, it cannot be rebuilt.'.format(fn))
+            return header
+        return None
+    save(fn, value, sources, version)
+    logger.info('Built {} in {:.2f} seconds.'.format(os.path.basename(fn), time.perf_counter() - t0))
+    return value
+
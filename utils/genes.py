@@ -0,0 +1,94 @@
+"""
+Process-wide interning of gene symbols.
+
+TFTA, PathwayEnrich and mirDisease intern their gene (and miRNA) symbols in
+the same SymbolTable, so their gene collections are bitsets over the same
+ids and intersect without hashing strings. The symbols are only decoded
+when a result is returned.
+"""
+
+import threading
+from collections.abc import Set
+from utils.bitset import SymbolTable, ids_to_bits, popcount
+
+#ids of all the gene symbols of the process
+gene_table = SymbolTable()
+_lock = threading.Lock()
+
+
+def intern_genes(symbols):
+    """
+    Return the ids of the symbols, interning the new ones.
+    """
+    with _lock:
+        return [gene_table.add(s) for s in symbols]
+
+def gene_bits(genes, intern=False):
+    """
+    Return the bitset of genes (a GeneSet or an iterable of symbols). Unless
+    intern is True, the symbols never interned are ignored, since they are
+    not in any GeneSet.
+    """
+    if isinstance(genes, GeneSet):
+        return genes.bits
+    if intern:
+        return ids_to_bits(intern_genes(genes))
+    return gene_table.to_bits(genes)
+
+
+class GeneSet(Set):
+    """
+    Immutable set of gene symbols stored as a bitset over gene_table.
+    Intersections with another GeneSet are bit operations; the other set
+    operations return python sets. The bitset is also kept as bytes, to test
+    the membership of a symbol without shifting the whole int.
+    """
+    def __init__(self, symbols=(), bits=None):
+        if bits is None:
+            bits = gene_bits(symbols, intern=True)
+        self.bits = bits
+        self._bytes = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        self._nbits = len(self._bytes) << 3
+        self._len = None
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, symbol):
+        #the symbols not interned, or past the last gene of the set, are not in it
+        n = self._nbits
+        i = gene_table.ids.get(symbol, n)
+        return i < n and self._bytes[i >> 3] >> (i & 7) & 1 == 1
+
+    def __iter__(self):
+        return iter(gene_table.from_bits(self.bits))
+
+    def __len__(self):
+        if self._len is None:
+            self._len = popcount(self.bits)
+        return self._len
+
+    def __and__(self, other):
+        if isinstance(other, GeneSet):
+            return GeneSet(bits=self.bits & other.bits)
+        return Set.__and__(self, other)
+
+    __rand__ = __and__
+
+    def intersection(self, other):
+        """
+        Return the genes of other in the set, as a GeneSet if other is one,
+        otherwise as a python set.
+        """
+        if isinstance(other, GeneSet):
+            return self & other
+        ids = gene_table.ids
+        data = self._bytes
+        n = self._nbits
+        res = set()
+        for g in other:
+            i = ids.get(g, n)
+            if i < n and data[i >> 3] >> (i & 7) & 1:
+                res.add(g)
+        return res
@@ -0,0 +1,112 @@
+"""
+Inverted index of a list of names for case insensitive keyword search.
+
+The index maps each token (run of letters and digits) and each trigram of
+the lower-cased names to the sorted ids (positions) of the names holding
+it, in CSR arrays. A substring query intersects the postings of its
+trigrams and then checks the few remaining names, so it returns the same
+names as testing keyword.lower() in name.lower() on every name. A token
+query intersects the postings of its tokens.
+"""
+
+import re
+import numpy as np
+
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def tokens(text):
+    return _TOKEN.findall(text.lower())
+
+def trigrams(text):
+    return set(text[i:i+3] for i in range(len(text) - 2))
+
+
+class _Postings:
+    """
+    Sorted ids of the names holding each key, in CSR arrays.
+    """
+    def __init__(self, keys_of_names):
+        postings = dict()
+        for i, keys in enumerate(keys_of_names):
+            for k in keys:
+                postings.setdefault(k, []).append(i)
+        self.keys = sorted(postings)
+        self.indptr = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(postings[k]) for k in self.keys])
+        self.ids = np.array([i for k in self.keys for i in postings[k]], dtype=np.int32)
+        self._init_rows()
+
+    def _init_rows(self):
+        self._rows = {k: r for r, k in enumerate(self.keys)}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_rows()
+
+    def get(self, key):
+        r = self._rows.get(key)
+        if r is None:
+            return None
+        return self.ids[self.indptr[r]:self.indptr[r+1]]
+
+    def intersect(self, keys):
+        """
+        Return the sorted ids holding all the keys, None if a key is unknown.
+        """
+        arrays = []
+        for k in set(keys):
+            a = self.get(k)
+            if a is None:
+                return None
+            arrays.append(a)
+        arrays.sort(key=len)
+        res = arrays[0]
+        for a in arrays[1:]:
+            if not len(res):
+                break
+            res = np.intersect1d(res, a, assume_unique=True)
+        return res
+
+
+class NameIndex:
+    def __init__(self, names):
+        """
+        parameter
+        -----------
+        names: list of str
+        """
+        self.lower_names = [n.lower() for n in names]
+        self.token_postings = _Postings(tokens(n) for n in self.lower_names)
+        self.trigram_postings = _Postings(trigrams(n) for n in self.lower_names)
+
+    def __len__(self):
+        return len(self.lower_names)
+
+    def find(self, keyword):
+        """
+        Return the sorted ids of the names containing keyword, ignoring case.
+        """
+        keyword = keyword.lower()
+        if len(keyword) < 3:
+            return [i for i, n in enumerate(self.lower_names) if keyword in n]
+        ids = self.trigram_postings.intersect(trigrams(keyword))
+        if ids is None:
+            return []
+        return [i for i in ids.tolist() if keyword in self.lower_names[i]]
+
+    def find_tokens(self, query):
+        """
+        Return the sorted ids of the names holding every word of query as a
+        whole word, ignoring case.
+        """
+        words = tokens(query)
+        if not words:
+            return []
+        ids = self.token_postings.intersect(words)
+        return ids.tolist() if ids is not None else []